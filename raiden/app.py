@@ -1,7 +1,7 @@
 import structlog
 from eth_utils import to_checksum_address
 
-from raiden.constants import DISCOVERY_DEFAULT_ROOM
+from raiden.constants import DISCOVERY_DEFAULT_ROOM, SNAPSHOT_STATE_CHANGES_COUNT
 from raiden.exceptions import InvalidSettleTimeout
 from raiden.network.blockchain_service import BlockChainService
 from raiden.network.proxies.discovery import Discovery
@@ -11,6 +11,8 @@ from raiden.network.proxies.token_network_registry import TokenNetworkRegistry
 from raiden.network.proxies.user_deposit import UserDeposit
 from raiden.raiden_service import RaidenService
 from raiden.settings import (
+    DEFAULT_DB_ARCHIVE_HISTORY,
+    DEFAULT_DB_READ_CONNECTIONS,
     DEFAULT_NAT_INVITATION_TIMEOUT,
     DEFAULT_NAT_KEEPALIVE_RETRIES,
     DEFAULT_NAT_KEEPALIVE_TIMEOUT,
@@ -21,11 +23,17 @@ from raiden.settings import (
     DEFAULT_REVEAL_TIMEOUT,
     DEFAULT_SETTLE_TIMEOUT,
     DEFAULT_SHUTDOWN_TIMEOUT,
+    DEFAULT_SNAPSHOT_INTERVAL,
+    DEFAULT_SNAPSHOT_MAX_REPLAY_TIME,
+    DEFAULT_SNAPSHOT_SERIALIZER,
+    DEFAULT_TRANSPORT_MATRIX_MAX_CONCURRENT_SENDS,
+    DEFAULT_TRANSPORT_MATRIX_MAX_QUEUED_MESSAGES,
     DEFAULT_TRANSPORT_MATRIX_RETRY_INTERVAL,
     DEFAULT_TRANSPORT_RETRIES_BEFORE_BACKOFF,
     DEFAULT_TRANSPORT_THROTTLE_CAPACITY,
     DEFAULT_TRANSPORT_THROTTLE_FILL_RATE,
     DEFAULT_TRANSPORT_UDP_RETRY_INTERVAL,
+    DEFAULT_WAL_GROUP_COMMIT_WINDOW,
     INITIAL_PORT,
     RED_EYES_CONTRACT_VERSION,
 )
@@ -42,6 +50,15 @@ class App:  # pylint: disable=too-few-public-methods
         "settle_timeout": DEFAULT_SETTLE_TIMEOUT,
         "contracts_path": contracts_precompiled_path(RED_EYES_CONTRACT_VERSION),
         "database_path": "",
+        "database": {
+            "group_commit_window": DEFAULT_WAL_GROUP_COMMIT_WINDOW,
+            "read_connections": DEFAULT_DB_READ_CONNECTIONS,
+            "snapshot_state_changes_count": SNAPSHOT_STATE_CHANGES_COUNT,
+            "snapshot_interval": DEFAULT_SNAPSHOT_INTERVAL,
+            "snapshot_max_replay_time": DEFAULT_SNAPSHOT_MAX_REPLAY_TIME,
+            "snapshot_serializer": DEFAULT_SNAPSHOT_SERIALIZER,
+            "archive_history": DEFAULT_DB_ARCHIVE_HISTORY,
+        },
         "transport_type": "udp",
         "blockchain": {"confirmation_blocks": DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS},
         "transport": {
@@ -62,6 +79,8 @@ class App:  # pylint: disable=too-few-public-methods
                 # None causes fetching from url in raiden.settings.py::DEFAULT_MATRIX_KNOWN_SERVERS
                 "available_servers": None,
                 "global_rooms": [DISCOVERY_DEFAULT_ROOM],
+                "max_concurrent_sends": DEFAULT_TRANSPORT_MATRIX_MAX_CONCURRENT_SENDS,
+                "max_queued_messages": DEFAULT_TRANSPORT_MATRIX_MAX_QUEUED_MESSAGES,
                 "retries_before_backoff": DEFAULT_TRANSPORT_RETRIES_BEFORE_BACKOFF,
                 "retry_interval": DEFAULT_TRANSPORT_MATRIX_RETRY_INTERVAL,
                 "server": "auto",
@@ -12,6 +12,7 @@ from raiden.utils.filters import (
     StatelessFilter,
     decode_event,
     get_filter_args_for_all_events_from_channel,
+    get_new_entries_for_filters,
 )
 from raiden.utils.typing import (
     Address,
@@ -204,13 +205,25 @@ class BlockchainEvents:
         self.event_listeners = list()
 
     def poll_blockchain_events(self, block_number: typing.BlockNumber):
-        """ Poll for new blockchain events up to `block_number`. """
-
-        for event_listener in self.event_listeners:
-            assert isinstance(event_listener.filter, StatelessFilter)
-
-            for log_event in event_listener.filter.get_new_entries(block_number):
-                yield decode_event_to_internal(event_listener.abi, log_event)
+        """ Poll for new blockchain events up to `block_number`.
+
+        The logs of all the listeners are queried together, see
+        `get_new_entries_for_filters`, and yielded in the listeners' order.
+        Listeners added while the events are consumed, e.g. for a new token
+        network, are polled afterwards.
+        """
+        number_of_polled_listeners = 0
+        while number_of_polled_listeners < len(self.event_listeners):
+            event_listeners = self.event_listeners[number_of_polled_listeners:]
+            number_of_polled_listeners = len(self.event_listeners)
+
+            filters = [event_listener.filter for event_listener in event_listeners]
+            assert all(isinstance(eth_filter, StatelessFilter) for eth_filter in filters)
+
+            entries = get_new_entries_for_filters(filters, block_number)
+            for event_listener, log_events in zip(event_listeners, entries):
+                for log_event in log_events:
+                    yield decode_event_to_internal(event_listener.abi, log_event)
 
     def uninstall_all_event_listeners(self):
         for listener in self.event_listeners:
@@ -41,11 +41,13 @@ from raiden.utils.typing import (
     Any,
     BalanceHash,
     BlockExpiration,
+    Callable,
     ChainID,
     ChannelID,
     Dict,
     FeeAmount,
     InitiatorAddress,
+    Iterable,
     Locksroot,
     MessageID,
     Nonce,
@@ -88,9 +90,11 @@ __all__ = (
     "decode",
     "from_dict",
     "message_from_sendevent",
+    "recover_senders",
 )
 
-_senders_cache = LRUCache(maxsize=128)
+# Big enough to keep the senders recovered for a whole batch of incoming messages
+_senders_cache = LRUCache(maxsize=1024)
 _hashes_cache = LRUCache(maxsize=128)
 _lock_bytes_cache = LRUCache(maxsize=128)
 
@@ -167,6 +171,26 @@ def from_dict(data: dict) -> "Message":
     return klass.from_dict(data)
 
 
+def recover_senders(
+    messages: Iterable["SignedMessage"],
+    map_function: Callable[[Callable, Iterable], Iterable] = map,
+) -> None:
+    """ Recover the senders of `messages` and store them in the senders cache.
+
+    `map_function` is used to run the recoveries, e.g. a pool's ordered `map`
+    to take them out of the caller's thread. Signatures already in the cache
+    are not recovered again.
+    """
+    pending = dict()
+    for message in messages:
+        if message.signature and message.signature not in _senders_cache:
+            pending[message.signature] = message
+
+    senders = map_function(SignedMessage._recover_sender, list(pending.values()))
+    for signature, sender in zip(list(pending), senders):
+        _senders_cache[signature] = sender
+
+
 def message_from_sendevent(send_event: SendMessageEvent) -> "Message":
     if type(send_event) == SendLockedTransfer:
         assert isinstance(send_event, SendLockedTransfer), MYPY_ANNOTATION
@@ -196,16 +220,32 @@ def message_from_sendevent(send_event: SendMessageEvent) -> "Message":
 
 
 class Message:
+    """ Base class of the protocol messages.
+
+    The encoding and the hash of a message are memoized, the memo is cleared
+    whenever an attribute of the message is set. Nested values, e.g. the
+    `Lock` of a transfer, must be replaced instead of being mutated in place.
+    """
+
     # Needs to be set by a subclass
     cmdid: Optional[int] = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        self.__dict__.pop("_memo", None)
+        super().__setattr__(name, value)
+
+    def _memoize(self, key: str, compute: Callable[[], Any]) -> Any:
+        memo = self.__dict__.setdefault("_memo", dict())
+        if key not in memo:
+            memo[key] = compute()
+        return memo[key]
+
     @property
     def hash(self):
-        packed = self.packed()
-        return sha3(packed.data)
+        return self._memoize("hash", lambda: sha3(self.encode()))
 
     def __eq__(self, other):
         return isinstance(other, self.__class__) and self.hash == other.hash
@@ -227,8 +267,7 @@ class Message:
         return cls.unpack(packed)
 
     def encode(self) -> bytes:
-        packed = self.packed()
-        return bytes(packed.data)
+        return self._memoize("encoded", lambda: bytes(self.packed().data))
 
     def packed(self):
         klass = messages.CMDID_MESSAGE[self.cmdid]
@@ -271,13 +310,17 @@ class SignedMessage(AuthenticatedMessage):
 
     def _data_to_sign(self) -> bytes:
         """ Return the binary data to be/which was signed """
-        packed = self.packed()
 
-        field = type(packed).fields_spec[-1]
-        assert field.name == "signature", "signature is not the last field"
+        def data_to_sign() -> bytes:
+            packed = self.packed()
 
-        # this slice must be from the end of the buffer
-        return packed.data[: -field.size_bytes]
+            field = type(packed).fields_spec[-1]
+            assert field.name == "signature", "signature is not the last field"
+
+            # this slice must be from the end of the buffer
+            return bytes(packed.data[: -field.size_bytes])
+
+        return self._memoize("data_to_sign", data_to_sign)
 
     def sign(self, signer: Signer):
         """ Sign message using signer. """
@@ -287,6 +330,10 @@ class SignedMessage(AuthenticatedMessage):
     @property  # type: ignore
     @cached(_senders_cache, key=attrgetter("signature"))
     def sender(self) -> Optional[Address]:
+        return self._recover_sender()
+
+    def _recover_sender(self) -> Optional[Address]:
+        """ Recover the signer of the message, bypassing the senders cache """
         if not self.signature:
             return None
         data_that_was_signed = self._data_to_sign()
@@ -354,17 +401,18 @@ class EnvelopeMessage(SignedRetrieableMessage):
 
     @property
     def message_hash(self):
-        packed = self.packed()
-        klass = type(packed)
+        def message_hash() -> bytes:
+            packed = self.packed()
+            klass = type(packed)
 
-        field = klass.fields_spec[-1]
-        assert field.name == "signature", "signature is not the last field"
+            field = klass.fields_spec[-1]
+            assert field.name == "signature", "signature is not the last field"
 
-        data = packed.data
-        message_data = data[: -field.size_bytes]
-        message_hash = sha3(message_data)
+            data = packed.data
+            message_data = data[: -field.size_bytes]
+            return sha3(message_data)
 
-        return message_hash
+        return self._memoize("message_hash", message_hash)
 
     def _data_to_sign(self) -> bytes:
         balance_hash = hash_balance_data(
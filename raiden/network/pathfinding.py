@@ -7,6 +7,7 @@ from enum import IntEnum, unique
 import click
 import requests
 import structlog
+from cachetools import TTLCache
 from eth_utils import to_checksum_address, to_hex
 from web3 import Web3
 
@@ -66,6 +67,22 @@ class PFSError(IntEnum):
 
 
 MAX_PATHS_QUERY_ATTEMPTS = 2
+# Seconds for which the paths returned by the PFS are reused for payments
+# between the same nodes
+PATHS_CACHE_TTL = 10
+PATHS_CACHE_SIZE = 256
+
+# Keep the connections to the PFS open across the requests
+session = requests.Session()
+
+# Paths returned by the PFS keyed by (url, token network, from, to, amount
+# bucket), with the queried amount. Cleared for a token network when one of
+# our balance proofs changes.
+paths_cache: TTLCache = TTLCache(maxsize=PATHS_CACHE_SIZE, ttl=PATHS_CACHE_TTL)
+
+# Last IOU accepted by the PFS keyed by (url, token network, sender, receiver),
+# so the PFS is only asked for it when the local copy may be outdated.
+last_ious: Dict[Tuple[str, TokenNetworkAddress, Address, str], Dict[str, Any]] = dict()
 
 
 def get_pfs_info(url: str) -> Optional[Dict]:
@@ -191,7 +208,7 @@ def get_last_iou(
 
     try:
         return (
-            requests.get(
+            session.get(
                 f"{url}/api/v1/{to_checksum_address(token_network_address)}/payment/iou",
                 params=dict(
                     sender=sender, receiver=receiver, timestamp=timestamp, signature=signature
@@ -279,16 +296,26 @@ def create_current_iou(
 ) -> Dict[str, Any]:
 
     url = config["pathfinding_service_address"]
+    iou_key = _iou_key(config, token_network_address, our_address)
 
     latest_iou = None
-    if not scrap_existing_iou:
-        latest_iou = get_last_iou(
-            url=url,
-            token_network_address=token_network_address,
-            sender=our_address,
-            receiver=config["pathfinding_eth_address"],
-            privkey=privkey,
-        )
+    if scrap_existing_iou:
+        last_ious.pop(iou_key, None)
+    else:
+        latest_iou = last_ious.get(iou_key)
+
+        if latest_iou is None:
+            latest_iou = get_last_iou(
+                url=url,
+                token_network_address=token_network_address,
+                sender=our_address,
+                receiver=config["pathfinding_eth_address"],
+                privkey=privkey,
+            )
+        else:
+            # the IOU is updated in place, the local copy is only replaced
+            # once the PFS accepted the new one
+            latest_iou = dict(latest_iou)
 
     if latest_iou is None:
         return make_iou(
@@ -303,9 +330,22 @@ def create_current_iou(
         return update_iou(iou=latest_iou, privkey=privkey, added_amount=added_amount)
 
 
+def _iou_key(
+    config: Dict[str, Any],
+    token_network_address: Union[TokenNetworkAddress, TokenNetworkID],
+    our_address: Address,
+) -> Tuple[str, TokenNetworkAddress, Address, str]:
+    return (
+        config["pathfinding_service_address"],
+        TokenNetworkAddress(token_network_address),
+        our_address,
+        config["pathfinding_eth_address"],
+    )
+
+
 def post_pfs_paths(url, token_network_address, payload):
     try:
-        response = requests.post(
+        response = session.post(
             f"{url}/api/v1/{to_checksum_address(token_network_address)}/paths",
             json=payload,
             timeout=DEFAULT_HTTP_REQUEST_TIMEOUT,
@@ -372,6 +412,7 @@ def query_paths(
     }
     offered_fee = service_config.get("pathfinding_fee", service_config["pathfinding_max_fee"])
     scrap_existing_iou = False
+    iou_key = _iou_key(service_config, token_network_address, our_address)
 
     for retries in reversed(range(MAX_PATHS_QUERY_ATTEMPTS)):
         payload["iou"] = create_current_iou(
@@ -385,10 +426,16 @@ def query_paths(
         )
 
         try:
-            return post_pfs_paths(
+            result = post_pfs_paths(
                 url=url, token_network_address=token_network_address, payload=payload
             )
+            last_ious[iou_key] = payload["iou"]
+            return result
         except ServiceRequestIOURejected as error:
+            # the local IOU is not consistent with the PFS anymore, the next
+            # attempt fetches it from the PFS again
+            last_ious.pop(iou_key, None)
+
             code = error.error_code
             if retries == 0 or code in (PFSError.WRONG_IOU_RECIPIENT, PFSError.DEPOSIT_TOO_LOW):
                 raise
@@ -401,6 +448,71 @@ def query_paths(
                 else:
                     raise
             log.info(f"PFS rejected our IOU, reason: {error}. Attempting again.")
+        except ServiceRequestFailed:
+            # it is unknown whether the PFS received the IOU
+            last_ious.pop(iou_key, None)
+            raise
 
     # If we got no results after MAX_PATHS_QUERY_ATTEMPTS return empty list of paths
     return list()
+
+
+def _paths_cache_key(
+    service_config: Dict[str, Any],
+    token_network_address: Union[TokenNetworkAddress, TokenNetworkID],
+    route_from: InitiatorAddress,
+    route_to: TargetAddress,
+    value: PaymentAmount,
+) -> Tuple[str, TokenNetworkAddress, InitiatorAddress, TargetAddress, int]:
+    # amounts are bucketed by powers of two
+    return (
+        service_config["pathfinding_service_address"],
+        TokenNetworkAddress(token_network_address),
+        route_from,
+        route_to,
+        value.bit_length(),
+    )
+
+
+def get_cached_paths(
+    service_config: Dict[str, Any],
+    token_network_address: Union[TokenNetworkAddress, TokenNetworkID],
+    route_from: InitiatorAddress,
+    route_to: TargetAddress,
+    value: PaymentAmount,
+) -> Optional[List[Dict[str, Any]]]:
+    """ Returns the paths recently returned by the PFS for a payment between
+    the same nodes, if they were queried for at least `value`.
+    """
+    key = _paths_cache_key(service_config, token_network_address, route_from, route_to, value)
+    cached = paths_cache.get(key)
+
+    if cached is not None:
+        cached_value, paths = cached
+        if value <= cached_value:
+            return paths
+
+    return None
+
+
+def cache_paths(
+    service_config: Dict[str, Any],
+    token_network_address: Union[TokenNetworkAddress, TokenNetworkID],
+    route_from: InitiatorAddress,
+    route_to: TargetAddress,
+    value: PaymentAmount,
+    paths: List[Dict[str, Any]],
+) -> None:
+    key = _paths_cache_key(service_config, token_network_address, route_from, route_to, value)
+    paths_cache[key] = (value, paths)
+
+
+def invalidate_cached_paths(
+    token_network_address: Union[TokenNetworkAddress, TokenNetworkID]
+) -> None:
+    """ Drops the cached paths of the token network, called when one of our
+    balance proofs changed the capacities the paths were computed with.
+    """
+    for key in list(paths_cache.keys()):
+        if key[1] == token_network_address:
+            paths_cache.pop(key, None)
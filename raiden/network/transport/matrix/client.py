@@ -44,6 +44,9 @@ class Room(MatrixRoom):
     def _mkmembers(self, member: User):
         if member.user_id not in self._members:
             self._members[member.user_id] = member
+        elif member.displayname:
+            # keep the displayname of known members up to date, it's validated by its signature
+            self._members[member.user_id].displayname = member.displayname
 
     def _rmmembers(self, user_id: str):
         self._members.pop(user_id, None)
@@ -8,6 +8,7 @@ import structlog
 from eth_utils import is_binary_address, to_checksum_address, to_normalized_address
 from gevent.event import Event
 from gevent.lock import Semaphore
+from gevent.pool import Pool
 from gevent.queue import JoinableQueue
 from matrix_client.errors import MatrixRequestError
 
@@ -27,6 +28,7 @@ from raiden.messages import (
 )
 from raiden.network.transport.matrix.client import GMatrixClient, Room, User
 from raiden.network.transport.matrix.utils import (
+    BINARY_FRAMING_CONTENT_KEY,
     JOIN_RETRIES,
     AddressReachability,
     UserAddressManager,
@@ -35,11 +37,17 @@ from raiden.network.transport.matrix.utils import (
     login_or_register,
     make_client,
     make_room_alias,
+    pack_binary_frames,
+    update_user_displayname,
     validate_and_parse_message,
     validate_userid_signature,
 )
 from raiden.network.transport.udp import udp_utils
 from raiden.raiden_service import RaidenService
+from raiden.settings import (
+    DEFAULT_TRANSPORT_MATRIX_MAX_CONCURRENT_SENDS,
+    DEFAULT_TRANSPORT_MATRIX_MAX_QUEUED_MESSAGES,
+)
 from raiden.transfer import views
 from raiden.transfer.identifiers import QueueIdentifier
 from raiden.transfer.mediated_transfer.events import CHANNEL_IDENTIFIER_GLOBAL_QUEUE
@@ -47,7 +55,6 @@ from raiden.transfer.state import (
     NODE_NETWORK_REACHABLE,
     NODE_NETWORK_UNKNOWN,
     NODE_NETWORK_UNREACHABLE,
-    QueueIdsToQueues,
 )
 from raiden.transfer.state_change import (
     ActionChangeNodeNetworkState,
@@ -144,13 +151,25 @@ class _RetryQueue(Runnable):
                 self.transport._config["retry_interval"] * 10,
             )
             expiration_generator = self._expiration_generator(timeout_generator)
-            self._message_queue.append(
+
+            # keep the queue sorted by channel_identifier (so global/unordered queue goes
+            # first), inside a queue preserve the order in which messages were enqueued
+            channel_identifier = queue_identifier.channel_identifier
+            index = len(self._message_queue)
+            while (
+                index > 0
+                and self._message_queue[index - 1].queue_identifier.channel_identifier
+                > channel_identifier
+            ):
+                index -= 1
+            self._message_queue.insert(
+                index,
                 _RetryQueue._MessageData(
                     queue_identifier=queue_identifier,
                     message=message,
                     text=json.dumps(message.to_dict()),
                     expiration_generator=expiration_generator,
-                )
+                ),
             )
         self.notify()
 
@@ -190,34 +209,34 @@ class _RetryQueue(Runnable):
                 "Partner not reachable. Skipping.", partner=pex(self.receiver), status=status
             )
             return
-        # sort output by channel_identifier (so global/unordered queue goes first)
-        # inside queue, preserve order in which messages were enqueued
-        ordered_queue = sorted(
-            self._message_queue, key=lambda d: d.queue_identifier.channel_identifier
-        )
-        message_texts = [
-            data.text
-            for data in ordered_queue
+        messages_to_send = [
+            data
+            for data in self._message_queue
             # if expired_gen generator yields False, message was sent recently, so skip it
             if next(data.expiration_generator)
         ]
 
+        chain_state = views.state_from_raiden(self.transport._raiden_service)
+        queueids_to_queues = views.get_all_messagequeues(chain_state)
+        messageids_to_queueids = views.get_messageids_to_queueids(chain_state)
+
         def message_is_in_queue(data: _RetryQueue._MessageData) -> bool:
-            return any(
-                isinstance(data.message, RetrieableMessage)
-                and send_event.message_identifier == data.message.message_identifier
-                for send_event in self.transport._queueids_to_queues[data.queue_identifier]
-            )
+            if not isinstance(data.message, RetrieableMessage):
+                return False
+
+            key = (data.queue_identifier.recipient, data.message.message_identifier)
+            return data.queue_identifier in messageids_to_queueids.get(key, ())
 
         # clean after composing, so any queued messages (e.g. Delivered) are sent at least once
-        for msg_data in self._message_queue[:]:
+        remaining_messages = list()
+        for msg_data in self._message_queue:
             remove = False
             if isinstance(msg_data.message, (Delivered, Ping, Pong)):
                 # e.g. Delivered, send only once and then clear
                 # TODO: Is this correct? Will a missed Delivered be 'fixed' by the
                 #       later `Processed` message?
                 remove = True
-            elif msg_data.queue_identifier not in self.transport._queueids_to_queues:
+            elif msg_data.queue_identifier not in queueids_to_queues:
                 remove = True
                 self.log.debug(
                     "Stopping message send retry",
@@ -234,12 +253,13 @@ class _RetryQueue(Runnable):
                     reason="Message was removed from queue",
                 )
 
-            if remove:
-                self._message_queue.remove(msg_data)
+            if not remove:
+                remaining_messages.append(msg_data)
+
+        self._message_queue = remaining_messages
 
-        if message_texts:
-            self.log.debug("Send", receiver=pex(self.receiver), messages=message_texts)
-            self.transport._send_raw(self.receiver, "\n".join(message_texts))
+        if messages_to_send:
+            self.transport._send_scheduler.enqueue(self.receiver, messages_to_send)
 
     def _run(self):
         self.greenlet.name = (
@@ -249,6 +269,8 @@ class _RetryQueue(Runnable):
         )
         # run while transport parent is running
         while not self.transport._stop_event.ready():
+            # don't add to the send backlog of the transport until it's below its limit
+            self.transport._send_scheduler.wait_for_capacity()
             # once entered the critical section, block any other enqueue or notify attempt
             with self._lock:
                 self._notify_event.clear()
@@ -264,6 +286,141 @@ class _RetryQueue(Runnable):
         return f"<{self.__class__.__name__} for {to_normalized_address(self.receiver)}>"
 
 
+class _SendScheduler(Runnable):
+    """ A helper Runnable which sends the batches of all the _RetryQueues through transport
+
+    The batches pending for a receiver are coalesced into a single request, at most
+    `max_concurrent_sends` requests to the homeserver are in flight, and the _RetryQueues wait
+    for the queue depth to get below `max_queued_messages` before sending more. A single request
+    per receiver is in flight, so its messages arrive in order.
+
+    `queue_depth`, `sent_requests`, `average_send_latency` and `max_send_latency` can be read
+    to monitor the sends.
+    """
+
+    # weight of a new sample in the moving average of the send latency
+    LATENCY_SMOOTHING = 0.1
+
+    def __init__(
+        self, transport: "MatrixTransport", max_concurrent_sends: int, max_queued_messages: int
+    ):
+        self.transport = transport
+        self.max_queued_messages = max_queued_messages
+        # batches waiting for a free slot, by receiver, in the order they were enqueued
+        self._pending: Dict[Address, List[_RetryQueue._MessageData]] = dict()
+        # receivers with a request in flight, their batches wait until it is done
+        self._sending: Set[Address] = set()
+        self._pending_event = Event()
+        self._stop_event = Event()
+        self._capacity_event = Event()
+        self._capacity_event.set()
+        self._pool = Pool(max_concurrent_sends)
+
+        # messages pending or being sent
+        self.queue_depth = 0
+        self.sent_requests = 0
+        self.average_send_latency = 0.0
+        self.max_send_latency = 0.0
+        super().__init__()
+
+    @property
+    def log(self):
+        return self.transport.log
+
+    def start(self):
+        self._stop_event.clear()
+        super().start()
+
+    def stop(self):
+        """ Synchronously stop, the requests in flight are waited for """
+        self._stop_event.set()
+        self.notify()
+        if self.greenlet:
+            self.greenlet.join()
+
+    def enqueue(self, receiver: Address, messages: List[_RetryQueue._MessageData]):
+        """ Add messages to the batch pending for receiver, and notify main loop """
+        pending = self._pending.setdefault(receiver, list())
+        pending_ids = {id(data) for data in pending}
+        new_messages = [data for data in messages if id(data) not in pending_ids]
+        pending.extend(new_messages)
+
+        self.queue_depth += len(new_messages)
+        if self.queue_depth >= self.max_queued_messages:
+            self._capacity_event.clear()
+        self._pending_event.set()
+
+    def wait_for_capacity(self):
+        """ Block until the queue depth is below `max_queued_messages` """
+        self._capacity_event.wait()
+
+    def notify(self):
+        """ Notify main loop and the waiting _RetryQueues, e.g. to stop """
+        self._pending_event.set()
+        self._capacity_event.set()
+
+    def _send(self, receiver: Address, messages: List[_RetryQueue._MessageData]):
+        self.log.debug(
+            "Send",
+            receiver=pex(receiver),
+            messages=[data.message for data in messages],
+            queue_depth=self.queue_depth,
+        )
+        if receiver in self.transport._binary_framing_peers:
+            text = pack_binary_frames(data.message for data in messages)
+        else:
+            text = "\n".join(data.text for data in messages)
+
+        started_at = time.monotonic()
+        try:
+            self.transport._send_raw(receiver, text)
+        finally:
+            latency = time.monotonic() - started_at
+            self.sent_requests += 1
+            self.average_send_latency += self.LATENCY_SMOOTHING * (
+                latency - self.average_send_latency
+            )
+            self.max_send_latency = max(self.max_send_latency, latency)
+
+            self.queue_depth -= len(messages)
+            if self.queue_depth < self.max_queued_messages:
+                self._capacity_event.set()
+
+            self._sending.discard(receiver)
+            if receiver in self._pending:
+                self._pending_event.set()
+
+    def _stopped(self) -> bool:
+        return self._stop_event.is_set() or self.transport._stop_event.ready()
+
+    def _next_receiver(self) -> Optional[Address]:
+        """ Returns the first receiver with a pending batch and no request in flight """
+        receivers = (receiver for receiver in self._pending if receiver not in self._sending)
+        return next(receivers, None)
+
+    def _run(self):
+        self.greenlet.name = f"SendScheduler node:{pex(self.transport._raiden_service.address)}"
+        while not self._stopped():
+            self._pending_event.clear()
+            while self._next_receiver() is not None and not self._stopped():
+                # pick the receiver once a slot is free, so its batch coalesces meanwhile
+                self._pool.wait_available()
+                receiver = self._next_receiver()
+                messages = self._pending.pop(receiver)
+                self._sending.add(receiver)
+                self._pool.spawn(self._send, receiver, messages).link_exception(self.on_error)
+            self._pending_event.wait(self.transport._config["retry_interval"])
+
+        # the _RetryQueues resend what is left once the transport is restarted
+        self._pool.join()
+        self._pending.clear()
+        self.queue_depth = 0
+        self._capacity_event.set()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} queue_depth={self.queue_depth}>"
+
+
 class MatrixTransport(Runnable):
     _room_prefix = "raiden"
     _room_sep = "_"
@@ -301,6 +458,17 @@ class MatrixTransport(Runnable):
         self.greenlets: List[gevent.Greenlet] = list()
 
         self._address_to_retrier: Dict[Address, _RetryQueue] = dict()
+        self._send_scheduler = _SendScheduler(
+            transport=self,
+            max_concurrent_sends=config.get(
+                "max_concurrent_sends", DEFAULT_TRANSPORT_MATRIX_MAX_CONCURRENT_SENDS
+            ),
+            max_queued_messages=config.get(
+                "max_queued_messages", DEFAULT_TRANSPORT_MATRIX_MAX_QUEUED_MESSAGES
+            ),
+        )
+        # peers which advertised they can parse binary framed messages
+        self._binary_framing_peers: Set[Address] = set()
 
         self._global_rooms: Dict[str, Optional[Room]] = dict()
         self._global_send_queue: JoinableQueue[Tuple[str, Message]] = JoinableQueue()
@@ -321,6 +489,7 @@ class MatrixTransport(Runnable):
 
         self._client.add_invite_listener(self._handle_invite)
         self._client.add_listener(self._handle_to_device_message, event_type="to_device")
+        self._client.add_listener(self._handle_member_event, event_type="m.room.member")
 
         self._health_lock = Semaphore()
         self._getroom_lock = Semaphore()
@@ -384,6 +553,9 @@ class MatrixTransport(Runnable):
         self._client.sync_thread.link_value(on_success)
         self.greenlets = [self._client.sync_thread]
 
+        self._send_scheduler.start()
+        self._send_scheduler.greenlet.link_exception(self.on_error)
+
         self._client.set_presence_state(UserPresence.ONLINE.value)
 
         # (re)start any _RetryQueue which was initialized before start
@@ -427,6 +599,7 @@ class MatrixTransport(Runnable):
         for retrier in self._address_to_retrier.values():
             if retrier:
                 retrier.notify()
+        self._send_scheduler.stop()
 
         self._client.set_presence_state(UserPresence.OFFLINE.value)
 
@@ -573,11 +746,6 @@ class MatrixTransport(Runnable):
             self._prioritize_global_messages = False
             self._global_send_event.wait(self._config["retry_interval"])
 
-    @property
-    def _queueids_to_queues(self) -> QueueIdsToQueues:
-        chain_state = views.state_from_raiden(self._raiden_service)
-        return views.get_all_messagequeues(chain_state)
-
     @property
     def _user_id(self) -> Optional[str]:
         return getattr(self, "_client", None) and getattr(self._client, "user_id", None)
@@ -707,6 +875,16 @@ class MatrixTransport(Runnable):
             peer=to_checksum_address(peer_address),
         )
 
+    def _handle_member_event(self, event):
+        """ Keep the known displaynames up to date for the validation of the users """
+        if self._stop_event.ready() or event["content"].get("membership") != "join":
+            return
+
+        user_id = event["state_key"]
+        displayname = event["content"].get("displayname")
+        update_user_displayname(user_id, displayname)
+        self._get_user(user_id).displayname = displayname
+
     def _handle_message(self, room, event) -> bool:
         """ Handle text messages sent to listening rooms """
         if (
@@ -784,6 +962,13 @@ class MatrixTransport(Runnable):
             self._address_mgr.force_user_presence(user, UserPresence.ONLINE)
             self._address_mgr.refresh_address_presence(peer_address)
 
+        # A peer may be downgraded, it is only sent binary frames while its
+        # latest message advertises it
+        if event["content"].get(BINARY_FRAMING_CONTENT_KEY):
+            self._binary_framing_peers.add(peer_address)
+        else:
+            self._binary_framing_peers.discard(peer_address)
+
         messages = validate_and_parse_message(event["content"]["body"], peer_address)
 
         if not messages:
@@ -875,7 +1060,9 @@ class MatrixTransport(Runnable):
         self.log.debug(
             "Send raw", receiver=pex(receiver_address), room=room, data=data.replace("\n", "\\n")
         )
-        room.send_text(data)
+        # advertise that we can parse binary framed messages, which JSON-only peers ignore
+        content = {"msgtype": "m.text", "body": data, BINARY_FRAMING_CONTENT_KEY: True}
+        self._client.api.send_message_event(room.room_id, "m.room.message", content)
 
     def _get_room_for_address(self, address: Address, allow_missing_peers=False) -> Optional[Room]:
         if self._stop_event.ready():
@@ -1238,7 +1425,11 @@ class MatrixTransport(Runnable):
         """ Sends send-to-device events to a all known devices of a peer without retries. """
         user_ids = self._address_mgr.get_userids_for_address(address)
 
-        data = {user_id: {"*": json.dumps(message.to_dict())} for user_id in user_ids}
+        if address in self._binary_framing_peers:
+            text = pack_binary_frames([message])
+        else:
+            text = json.dumps(message.to_dict())
+        data = {user_id: {"*": text} for user_id in user_ids}
 
         return self._client.api.send_to_device("m.to_device_message", data)
 
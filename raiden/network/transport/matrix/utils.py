@@ -1,9 +1,11 @@
+import base64
 import json
 import re
+import struct
 from binascii import Error as DecodeError
 from collections import defaultdict
 from enum import Enum
-from operator import attrgetter, itemgetter
+from operator import itemgetter
 from random import Random
 from typing import (
     Any,
@@ -22,10 +24,9 @@ from urllib.parse import urlparse
 
 import gevent
 import structlog
-from cachetools import LRUCache, cached
+from cachetools import LRUCache
 from eth_utils import decode_hex, encode_hex, to_canonical_address, to_normalized_address
 from gevent.event import Event
-from gevent.lock import Semaphore
 from matrix_client.errors import MatrixError, MatrixRequestError
 
 from raiden.exceptions import InvalidProtocolMessage, InvalidSignature, TransportError
@@ -34,6 +35,7 @@ from raiden.messages import (
     SignedMessage,
     decode as message_from_bytes,
     from_dict as message_from_dict,
+    recover_senders,
 )
 from raiden.network.transport.matrix.client import GMatrixClient, Room, User
 from raiden.network.utils import get_http_rtt
@@ -48,6 +50,10 @@ JOIN_RETRIES = 10
 USERID_RE = re.compile(r"^@(0x[0-9a-f]{40})(?:\.[0-9a-f]{8})?(?::.+)?$")
 ROOM_NAME_SEPARATOR = "_"
 ROOM_NAME_PREFIX = "raiden"
+# Content key of the room messages of peers which can parse binary framed messages
+BINARY_FRAMING_CONTENT_KEY = "raiden.binary_framing"
+BINARY_FRAMING_PREFIX = "b64:"
+FRAME_LENGTH = struct.Struct(">I")
 
 
 class UserPresence(Enum):
@@ -422,9 +428,26 @@ def login_or_register(
     return user
 
 
-@cached(cache=LRUCache(128), key=attrgetter("user_id", "displayname"), lock=Semaphore())
+# Last known displayname of the users, updated from the membership events
+_userid_to_displayname: LRUCache = LRUCache(maxsize=4096)
+# Result of the displayname signature validation, by (user_id, displayname)
+_userid_signatures_cache: LRUCache = LRUCache(maxsize=4096)
+
+
+def update_user_displayname(user_id: str, displayname: Optional[str]) -> None:
+    """ Record the new displayname of a user, e.g. from a `m.room.member` event """
+    if displayname:
+        _userid_to_displayname[user_id] = displayname
+    else:
+        _userid_to_displayname.pop(user_id, None)
+
+
 def validate_userid_signature(user: User) -> Optional[Address]:
-    """ Validate a userId format and signature on displayName, and return its address"""
+    """ Validate a userId format and signature on displayName, and return its address
+
+    The displayname is only fetched from the homeserver if it's neither set on `user` nor
+    known from `update_user_displayname`, and the validation is cached per displayname.
+    """
     # display_name should be an address in the USERID_RE format
     match = USERID_RE.match(user.user_id)
     if not match:
@@ -433,20 +456,29 @@ def validate_userid_signature(user: User) -> Optional[Address]:
     encoded_address = match.group(1)
     address: Address = to_canonical_address(encoded_address)
 
+    displayname = user.displayname or _userid_to_displayname.get(user.user_id)
+    if not displayname:
+        try:
+            displayname = user.get_display_name()
+        except (MatrixRequestError, json.decoder.JSONDecodeError):
+            return None
+        if not displayname:
+            return None
+    _userid_to_displayname[user.user_id] = displayname
+
+    cache_key = (user.user_id, displayname)
+    if cache_key in _userid_signatures_cache:
+        return _userid_signatures_cache[cache_key]
+
     try:
-        displayname = user.get_display_name()
         recovered = recover(data=user.user_id.encode(), signature=decode_hex(displayname))
         if not (address and recovered and recovered == address):
-            return None
-    except (
-        DecodeError,
-        TypeError,
-        InvalidSignature,
-        MatrixRequestError,
-        json.decoder.JSONDecodeError,
-    ):
-        return None
-    return address
+            recovered = None
+    except (DecodeError, TypeError, InvalidSignature):
+        recovered = None
+
+    _userid_signatures_cache[cache_key] = recovered
+    return recovered
 
 
 def sort_servers_closest(servers: Sequence[str]) -> Sequence[Tuple[str, float]]:
@@ -526,6 +558,93 @@ def make_room_alias(chain_id: ChainID, *suffixes: str) -> str:
     return ROOM_NAME_SEPARATOR.join([ROOM_NAME_PREFIX, network_name, *suffixes])
 
 
+def pack_binary_frames(messages: Iterable[Message]) -> str:
+    """ Pack `messages` in a text body with their binary encoding, length prefixed.
+
+    This is more compact and faster to parse than the JSON lines, but it can only be sent to
+    peers which advertised support for it with `BINARY_FRAMING_CONTENT_KEY`.
+    """
+    frames = b"".join(
+        FRAME_LENGTH.pack(len(data)) + data for data in (message.encode() for message in messages)
+    )
+    return BINARY_FRAMING_PREFIX + base64.b64encode(frames).decode()
+
+
+def _parse_binary_frames(data: str, peer_address: Address) -> List[Message]:
+    try:
+        frames = base64.b64decode(data[len(BINARY_FRAMING_PREFIX) :], validate=True)
+    except ValueError as ex:
+        log.warning(
+            "Can't parse binary framed Message data",
+            message_data=data,
+            peer_address=pex(peer_address),
+            _exc=ex,
+        )
+        return []
+
+    messages = list()
+    offset = 0
+    while offset < len(frames):
+        frame_start = offset + FRAME_LENGTH.size
+        length = FRAME_LENGTH.unpack_from(frames, offset)[0] if frame_start <= len(frames) else 0
+        offset = frame_start + length
+
+        frame = frames[frame_start:offset]
+        if not frame or len(frame) != length:
+            log.warning(
+                "Binary framed Message data is malformed",
+                message_data=data,
+                peer_address=pex(peer_address),
+            )
+            break
+
+        try:
+            message = message_from_bytes(frame)
+            if not message:
+                raise InvalidProtocolMessage
+        except (AssertionError, InvalidProtocolMessage) as ex:
+            log.warning(
+                "Binary framed Message data is not a valid Message",
+                message_data=encode_hex(frame),
+                peer_address=pex(peer_address),
+                _exc=ex,
+            )
+            continue
+        messages.append(message)
+
+    return messages
+
+
+def _parse_json_lines(data: str, peer_address: Address) -> List[Message]:
+    messages = list()
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message_dict = json.loads(line)
+            message = message_from_dict(message_dict)
+        except (UnicodeDecodeError, json.JSONDecodeError) as ex:
+            log.warning(
+                "Can't parse ToDevice Message data JSON",
+                message_data=line,
+                peer_address=pex(peer_address),
+                _exc=ex,
+            )
+            continue
+        except InvalidProtocolMessage as ex:
+            log.warning(
+                "ToDevice Message data JSON are not a valid ToDevice Message",
+                message_data=line,
+                peer_address=pex(peer_address),
+                _exc=ex,
+            )
+            continue
+        messages.append(message)
+
+    return messages
+
+
 def validate_and_parse_message(data, peer_address) -> List[Message]:
     messages = list()
 
@@ -562,29 +681,13 @@ def validate_and_parse_message(data, peer_address) -> List[Message]:
             messages.append(message)
 
     else:
-        for line in data.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                message_dict = json.loads(line)
-                message = message_from_dict(message_dict)
-            except (UnicodeDecodeError, json.JSONDecodeError) as ex:
-                log.warning(
-                    "Can't parse ToDevice Message data JSON",
-                    message_data=line,
-                    peer_address=pex(peer_address),
-                    _exc=ex,
-                )
-                continue
-            except InvalidProtocolMessage as ex:
-                log.warning(
-                    "ToDevice Message data JSON are not a valid ToDevice Message",
-                    message_data=line,
-                    peer_address=pex(peer_address),
-                    _exc=ex,
-                )
-                continue
+        if data.startswith(BINARY_FRAMING_PREFIX):
+            parsed_messages = _parse_binary_frames(data, peer_address)
+        else:
+            parsed_messages = _parse_json_lines(data, peer_address)
+
+        signed_messages = list()
+        for message in parsed_messages:
             if not isinstance(message, SignedMessage):
                 log.warning(
                     "ToDevice Message not a SignedMessage!",
@@ -592,6 +695,12 @@ def validate_and_parse_message(data, peer_address) -> List[Message]:
                     peer_address=pex(peer_address),
                 )
                 continue
+            signed_messages.append(message)
+
+        # Recover the senders of the whole batch at once, outside of the event loop
+        recover_senders(signed_messages, map_function=gevent.get_hub().threadpool.map)
+
+        for message in signed_messages:
             if message.sender != peer_address:
                 log.warning(
                     "ToDevice Message not signed by sender!",
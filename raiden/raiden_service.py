@@ -15,12 +15,7 @@ from raiden import constants, routing
 from raiden.blockchain.events import BlockchainEvents
 from raiden.blockchain_events_handler import on_blockchain_event
 from raiden.connection_manager import ConnectionManager
-from raiden.constants import (
-    EMPTY_SECRET,
-    GENESIS_BLOCK_NUMBER,
-    SNAPSHOT_STATE_CHANGES_COUNT,
-    Environment,
-)
+from raiden.constants import EMPTY_SECRET, GENESIS_BLOCK_NUMBER, Environment
 from raiden.exceptions import (
     InvalidAddress,
     InvalidDBData,
@@ -36,12 +31,14 @@ from raiden.messages import (
     UpdatePFS,
     message_from_sendevent,
 )
+from raiden.network import pathfinding
 from raiden.network.blockchain_service import BlockChainService
 from raiden.network.proxies.secret_registry import SecretRegistry
 from raiden.network.proxies.service_registry import ServiceRegistry
 from raiden.network.proxies.token_network_registry import TokenNetworkRegistry
 from raiden.settings import MEDIATION_FEE, MONITORING_MIN_CAPACITY, MONITORING_REWARD
 from raiden.storage import serialize, sqlite, wal
+from raiden.storage.versions import archive_db_file
 from raiden.tasks import AlarmTask
 from raiden.transfer import channel, node, views
 from raiden.transfer.architecture import Event as RaidenEvent, StateChange
@@ -197,6 +194,7 @@ def update_services_from_balance_proof(
     chain_state: "ChainState",
     balance_proof: Union[BalanceProofSignedState, BalanceProofUnsignedState],
 ) -> None:
+    pathfinding.invalidate_cached_paths(balance_proof.canonical_identifier.token_network_address)
     update_path_finding_service_from_balance_proof(
         raiden=raiden, chain_state=chain_state, new_balance_proof=balance_proof
     )
@@ -327,11 +325,10 @@ class RaidenService(Runnable):
         self.stop_event.set()  # inits as stopped
         self.greenlets: List[Greenlet] = list()
 
-        self.snapshot_group = 0
-
         self.contract_manager = ContractManager(config["contracts_path"])
         self.database_path = config["database_path"]
         self.wal = None
+        self._tracked_commit: Optional[AsyncResult] = None
         if self.database_path != ":memory:":
             database_dir = os.path.dirname(config["database_path"])
             os.makedirs(database_dir, exist_ok=True)
@@ -401,15 +398,36 @@ class RaidenService(Runnable):
 
         self.maybe_upgrade_db()
 
+        # Once created the archive is always attached, since it contains part
+        # of the history
+        archive_path = None
+        if self.database_path != ":memory:":
+            archive_path = archive_db_file(self.database_path)
+            if not self.config["database"]["archive_history"] and not os.path.exists(archive_path):
+                archive_path = None
+
         storage = sqlite.SerializedSQLiteStorage(
-            database_path=self.database_path, serializer=serialize.JSONSerializer()
+            database_path=self.database_path,
+            serializer=serialize.JSONSerializer(),
+            read_connections=self.config["database"]["read_connections"],
+            snapshot_serializer=serialize.SNAPSHOT_SERIALIZERS[
+                self.config["database"]["snapshot_serializer"]
+            ](),
+            archive_path=archive_path,
         )
         storage.update_version()
         storage.log_run()
         self.wal = wal.restore_to_state_change(
-            transition_function=node.state_transition,
+            transition_function=node.state_transition_structural_sharing,
             storage=storage,
             state_change_identifier="latest",
+            copy_state=False,
+            group_commit_window=self.config["database"]["group_commit_window"],
+            snapshot_policy=wal.SnapshotPolicy(
+                state_changes_count=self.config["database"]["snapshot_state_changes_count"],
+                interval=self.config["database"]["snapshot_interval"],
+                max_replay_time=self.config["database"]["snapshot_max_replay_time"],
+            ),
         )
 
         if self.wal.state_manager.current_state is None:
@@ -455,6 +473,19 @@ class RaidenService(Runnable):
                 node=pex(self.address),
             )
 
+            if self.config["database"]["archive_history"] and archive_path is not None:
+                archived_count = storage.archive_history(
+                    channel_state.canonical_identifier
+                    for channel_state in views.list_all_channelstate(
+                        self.wal.state_manager.current_state
+                    )
+                )
+                log.debug(
+                    "Archived history",
+                    archived_state_changes=archived_count,
+                    node=pex(self.address),
+                )
+
             known_networks = views.get_payment_network_identifiers(views.state_from_raiden(self))
             if known_networks and self.default_registry.address not in known_networks:
                 configured_registry = pex(self.default_registry.address)
@@ -466,10 +497,6 @@ class RaidenService(Runnable):
                     f"smart contracts {known_registries}"
                 )
 
-        # Restore the current snapshot group
-        state_change_qty = self.wal.storage.count_state_changes()
-        self.snapshot_group = state_change_qty // SNAPSHOT_STATE_CHANGES_COUNT
-
         # Install the filters using the latest confirmed from_block value,
         # otherwise blockchain logs can be lost.
         self.install_all_blockchain_filters(
@@ -548,8 +575,11 @@ class RaidenService(Runnable):
 
         self.blockchain_events.uninstall_all_event_listeners()
 
-        # Close storage DB to release internal DB lock
-        self.wal.storage.conn.close()
+        # Write the pending snapshot, commit the state changes of a pending
+        # group and close storage DB to release internal DB lock
+        self.wal.wait_snapshot()
+        self.wal.flush()
+        self.wal.storage.close()
 
         if self.db_lock is not None:
             self.db_lock.release()
@@ -647,10 +677,32 @@ class RaidenService(Runnable):
         )
 
         old_state = views.state_from_raiden(self)
-        new_state, raiden_event_list = self.wal.log_and_dispatch(state_change)
+        new_state, raiden_event_list, pending_commit = self.wal.log_and_dispatch_uncommitted(
+            state_change
+        )
+        touched_channels = self.wal.state_manager.last_touched_channels
 
-        for changed_balance_proof in views.detect_balance_proof_change(old_state, new_state):
-            update_services_from_balance_proof(self, new_state, changed_balance_proof)
+        if pending_commit is not None and pending_commit is not self._tracked_commit:
+            # A failed commit leaves the node's state ahead of the database,
+            # the waiting greenlet stops the node in that case
+            self._tracked_commit = pending_commit
+            self.add_pending_greenlet(gevent.spawn(pending_commit.get))
+
+        changed_balance_proofs = list(
+            views.detect_balance_proof_change(old_state, new_state, touched_channels)
+        )
+        if pending_commit is None:
+            for changed_balance_proof in changed_balance_proofs:
+                update_services_from_balance_proof(self, new_state, changed_balance_proof)
+        elif changed_balance_proofs:
+            self.add_pending_greenlet(
+                gevent.spawn(
+                    self._update_services_after_commit,
+                    pending_commit,
+                    new_state,
+                    changed_balance_proofs,
+                )
+            )
 
         log.debug(
             "Raiden events",
@@ -665,19 +717,35 @@ class RaidenService(Runnable):
         if self.ready_to_process_events:
             for raiden_event in raiden_event_list:
                 greenlets.append(
-                    self.handle_event(chain_state=new_state, raiden_event=raiden_event)
+                    self.handle_event(
+                        chain_state=new_state,
+                        raiden_event=raiden_event,
+                        pending_commit=pending_commit,
+                    )
                 )
 
-            state_changes_count = self.wal.storage.count_state_changes()
-            new_snapshot_group = state_changes_count // SNAPSHOT_STATE_CHANGES_COUNT
-            if new_snapshot_group > self.snapshot_group:
-                log.debug("Storing snapshot", snapshot_id=new_snapshot_group)
-                self.wal.snapshot()
-                self.snapshot_group = new_snapshot_group
+            snapshot_greenlet = self.wal.maybe_snapshot()
+            if snapshot_greenlet is not None:
+                self.add_pending_greenlet(snapshot_greenlet)
 
         return greenlets
 
-    def handle_event(self, chain_state: ChainState, raiden_event: RaidenEvent) -> Greenlet:
+    def _update_services_after_commit(
+        self,
+        pending_commit: AsyncResult,
+        chain_state: ChainState,
+        changed_balance_proofs: List[Union[BalanceProofSignedState, BalanceProofUnsignedState]],
+    ) -> None:
+        pending_commit.get()
+        for changed_balance_proof in changed_balance_proofs:
+            update_services_from_balance_proof(self, chain_state, changed_balance_proof)
+
+    def handle_event(
+        self,
+        chain_state: ChainState,
+        raiden_event: RaidenEvent,
+        pending_commit: Optional[AsyncResult] = None,
+    ) -> Greenlet:
         """Spawn a new thread to handle a Raiden event.
 
         This will spawn a new greenlet to handle each event, which is
@@ -694,13 +762,24 @@ class RaidenService(Runnable):
 
             This is spawing a new greenlet for /each/ transaction. It's
             therefore /required/ that there is *NO* order among these.
+
+            If `pending_commit` is given the event is handled only once the
+            state change which produced it is committed.
         """
-        return gevent.spawn(self._handle_event, chain_state, raiden_event)
+        return gevent.spawn(self._handle_event, chain_state, raiden_event, pending_commit)
 
-    def _handle_event(self, chain_state: ChainState, raiden_event: RaidenEvent):
+    def _handle_event(
+        self,
+        chain_state: ChainState,
+        raiden_event: RaidenEvent,
+        pending_commit: Optional[AsyncResult] = None,
+    ):
         assert isinstance(chain_state, ChainState)
         assert isinstance(raiden_event, RaidenEvent)
 
+        if pending_commit is not None:
+            pending_commit.get()
+
         try:
             self.raiden_event_handler.on_raiden_event(
                 raiden=self, chain_state=chain_state, event=raiden_event
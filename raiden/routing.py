@@ -6,13 +6,14 @@ import structlog
 from eth_utils import to_canonical_address, to_checksum_address
 
 from raiden.exceptions import ServiceRequestFailed
-from raiden.network.pathfinding import query_paths
+from raiden.network.pathfinding import cache_paths, get_cached_paths, query_paths
 from raiden.transfer import channel, views
 from raiden.transfer.state import CHANNEL_STATE_OPENED, ChainState, RouteState
 from raiden.utils import pex
 from raiden.utils.typing import (
     Address,
     ChannelID,
+    FeeAmount,
     InitiatorAddress,
     NamedTuple,
     Optional,
@@ -70,6 +71,7 @@ def get_best_routes(
 class Neighbour(NamedTuple):
     length: int
     nonrefundable: bool
+    mediation_fee: FeeAmount
     partner_address: Address
     channelid: ChannelID
 
@@ -84,12 +86,14 @@ def get_best_routes_internal(
 ) -> List[RouteState]:
     """ Returns a list of channels that can be used to make a transfer.
 
-    This will filter out channels that are not open and don't have enough
-    capacity.
+    This will filter out channels that are not open, don't have enough
+    capacity, or whose partner can only reach the target through this node.
+
+    The routes are ranked by the length of the shortest path from the
+    partner to the target, then by the refund capacity and the mediation
+    fee of the channel. Only the capacity and the fee of our own channels
+    are known, the rest of the path is ranked by its length.
     """
-    # TODO: Route ranking.
-    # Rate each route to optimize the fee price/quality of each route and add a
-    # rate from in the range [0.0,1.0].
 
     available_routes = list()
 
@@ -99,6 +103,8 @@ def get_best_routes_internal(
         return list()
 
     neighbors_heap: List[Neighbour] = list()
+    # paths going back through this node are loops, they can not be used
+    distances = token_network.network_graph.distances_to(to_address, excluded=from_address)
     try:
         all_neighbors = networkx.all_neighbors(token_network.network_graph.network, from_address)
     except networkx.NetworkXError:
@@ -127,23 +133,40 @@ def get_best_routes_internal(
             )
             continue
 
+        length = distances.get(partner_address)
+        if length is None:
+            # there is no path from the partner to the target
+            continue
+
+        # a mediator deducts its fee from the amount forwarded to the partner
+        transferred_amount = amount
+        if previous_address is not None:
+            transferred_amount = amount - channel_state.mediation_fee
+
+        distributable = channel.get_distributable(
+            channel_state.our_state, channel_state.partner_state
+        )
+        if transferred_amount > distributable:
+            log.debug(
+                "Channel has not enough capacity, ignoring",
+                from_address=pex(from_address),
+                partner_address=pex(partner_address),
+                routing_source="Internal Routing",
+            )
+            continue
+
         nonrefundable = amount > channel.get_distributable(
             channel_state.partner_state, channel_state.our_state
         )
 
-        try:
-            length = networkx.shortest_path_length(
-                token_network.network_graph.network, partner_address, to_address
-            )
-            neighbour = Neighbour(
-                length=length,
-                nonrefundable=nonrefundable,
-                partner_address=partner_address,
-                channelid=channel_state.identifier,
-            )
-            heappush(neighbors_heap, neighbour)
-        except (networkx.NetworkXNoPath, networkx.NodeNotFound):
-            pass
+        neighbour = Neighbour(
+            length=length,
+            nonrefundable=nonrefundable,
+            mediation_fee=channel_state.mediation_fee,
+            partner_address=partner_address,
+            channelid=channel_state.identifier,
+        )
+        heappush(neighbors_heap, neighbour)
 
     if not neighbors_heap:
         log.warning(
@@ -171,22 +194,42 @@ def get_best_routes_pfs(
     privkey: bytes,
 ) -> Tuple[bool, List[RouteState]]:
 
-    try:
-        result = query_paths(
-            service_config=config,
-            our_address=to_checksum_address(chain_state.our_address),
-            privkey=privkey,
-            current_block_number=chain_state.block_number,
-            token_network_address=token_network_id,
-            route_from=from_address,
-            route_to=to_address,
-            value=amount,
-        )
-    except ServiceRequestFailed as e:
-        log_message = e.args[0]
-        log_info = e.args[1] if len(e.args) > 1 else {}
-        log.warning(log_message, **log_info)
-        return False, []
+    result = get_cached_paths(
+        service_config=config,
+        token_network_address=token_network_id,
+        route_from=from_address,
+        route_to=to_address,
+        value=amount,
+    )
+
+    if result is None:
+        try:
+            result = query_paths(
+                service_config=config,
+                our_address=to_checksum_address(chain_state.our_address),
+                privkey=privkey,
+                current_block_number=chain_state.block_number,
+                token_network_address=token_network_id,
+                route_from=from_address,
+                route_to=to_address,
+                value=amount,
+            )
+        except ServiceRequestFailed as e:
+            log_message = e.args[0]
+            log_info = e.args[1] if len(e.args) > 1 else {}
+            log.warning(log_message, **log_info)
+            return False, []
+
+        # an empty answer is not reused, the PFS may find a path later
+        if result:
+            cache_paths(
+                service_config=config,
+                token_network_address=token_network_id,
+                route_from=from_address,
+                route_to=to_address,
+                value=amount,
+                paths=result,
+            )
 
     paths = []
     for path_object in result:
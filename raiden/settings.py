@@ -16,6 +16,9 @@ DEFAULT_TRANSPORT_THROTTLE_FILL_RATE = 10.0
 DEFAULT_TRANSPORT_UDP_RETRY_INTERVAL = 1.0
 # matrix gets spammed with the default retry-interval of 1s, wait a little more
 DEFAULT_TRANSPORT_MATRIX_RETRY_INTERVAL = 5.0
+# the matrix client keeps up to 4 connections to the homeserver
+DEFAULT_TRANSPORT_MATRIX_MAX_CONCURRENT_SENDS = 4
+DEFAULT_TRANSPORT_MATRIX_MAX_QUEUED_MESSAGES = 1000
 DEFAULT_MATRIX_KNOWN_SERVERS = {
     Environment.PRODUCTION: (
         "https://raw.githubusercontent.com/raiden-network/raiden-transport"
@@ -43,6 +46,29 @@ DEFAULT_NAT_INVITATION_TIMEOUT = 15
 
 DEFAULT_SHUTDOWN_TIMEOUT = 2
 
+# Maximum seconds during which state changes are grouped into a single database
+# commit, the group is committed earlier once the node is idle. Zero commits
+# every state change on its own
+DEFAULT_WAL_GROUP_COMMIT_WINDOW = 0.0
+
+# Number of read only database connections used for the API queries, zero
+# disables the SQLite WAL journal mode and reads go through the write connection
+DEFAULT_DB_READ_CONNECTIONS = 0
+
+# Besides every `SNAPSHOT_STATE_CHANGES_COUNT` state changes, a snapshot of the
+# node state is taken once the given number of seconds have passed since the
+# last snapshot, or replaying the state changes since the last snapshot is
+# estimated to take longer than the given number of seconds
+DEFAULT_SNAPSHOT_INTERVAL = 3600.0
+DEFAULT_SNAPSHOT_MAX_REPLAY_TIME = 10.0
+
+# Encoding of new snapshots, either "json" or the more compact "binary"
+DEFAULT_SNAPSHOT_SERIALIZER = "json"
+
+# Move the history of the settled channels, which is not needed to restore the
+# node state, to a separate archive database on startup
+DEFAULT_DB_ARCHIVE_HISTORY = False
+
 DEFAULT_PATHFINDING_MAX_PATHS = 3
 DEFAULT_PATHFINDING_MAX_FEE = 1000
 DEFAULT_PATHFINDING_IOU_TIMEOUT = 50000  # now the pfs has 200h to cash in
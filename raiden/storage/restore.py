@@ -11,9 +11,10 @@ def channel_state_until_state_change(
 ) -> typing.Optional[NettingChannelState]:
     """ Go through WAL state changes until a certain balance hash is found. """
     wal = restore_to_state_change(
-        transition_function=node.state_transition,
+        transition_function=node.state_transition_structural_sharing,
         storage=raiden.wal.storage,
         state_change_identifier=state_change_identifier,
+        copy_state=False,
     )
 
     msg = "There is a state change, therefore the state must not be None"
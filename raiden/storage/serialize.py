@@ -6,8 +6,12 @@ with sanitized input, to avoid the risk of exploits.
 """
 import importlib
 import json
+from functools import lru_cache
 
-from raiden.utils.typing import Any
+import msgpack
+from eth_utils import to_checksum_address
+
+from raiden.utils.typing import Any, Dict, Union
 
 
 def _import_type(type_name):
@@ -24,6 +28,27 @@ def _import_type(type_name):
     return klass
 
 
+# Classes already resolved by `get_type`, keyed by the `_type` metadata
+_type_registry: Dict[str, type] = dict()
+
+
+def get_type(type_name: str) -> type:
+    """ Return the class for `type_name`, the module is imported only the
+    first time the type is seen.
+    """
+    klass = _type_registry.get(type_name)
+
+    if klass is None:
+        klass = _import_type(type_name)
+
+        msg = "_type must point to a class with `from_dict` static method"
+        assert hasattr(klass, "from_dict"), msg
+
+        _type_registry[type_name] = klass
+
+    return klass
+
+
 def from_dict_hook(data):
     """Decode internal objects encoded using `to_dict_hook`.
 
@@ -39,12 +64,7 @@ def from_dict_hook(data):
     """
     type_ = data.get("_type", None)
     if type_ is not None:
-        klass = _import_type(type_)
-
-        msg = "_type must point to a class with `from_dict` static method"
-        assert hasattr(klass, "from_dict"), msg
-
-        return klass.from_dict(data)
+        return get_type(type_).from_dict(data)
     return data
 
 
@@ -103,3 +123,260 @@ class JSONSerializer(SerializationBase):
     @staticmethod
     def deserialize(data):
         return json.loads(data, object_hook=from_dict_hook)
+
+
+# Integer tags used by the `BinarySerializer` instead of the type names. The
+# tags are persisted, an existing tag must never be changed or reused, new
+# types are appended. Types without a tag are encoded with their name.
+BINARY_TYPE_TAGS: Dict[int, str] = {
+    1: "raiden.transfer.identifiers.QueueIdentifier",
+    2: "raiden.transfer.identifiers.CanonicalIdentifier",
+    3: "raiden.transfer.state.InitiatorTask",
+    4: "raiden.transfer.state.MediatorTask",
+    5: "raiden.transfer.state.TargetTask",
+    6: "raiden.transfer.state.ChainState",
+    7: "raiden.transfer.state.PaymentNetworkState",
+    8: "raiden.transfer.state.TokenNetworkState",
+    9: "raiden.transfer.state.TokenNetworkGraphState",
+    10: "raiden.transfer.state.PaymentMappingState",
+    11: "raiden.transfer.state.RouteState",
+    12: "raiden.transfer.state.BalanceProofUnsignedState",
+    13: "raiden.transfer.state.BalanceProofSignedState",
+    14: "raiden.transfer.state.HashTimeLockState",
+    15: "raiden.transfer.state.UnlockPartialProofState",
+    16: "raiden.transfer.state.UnlockProofState",
+    17: "raiden.transfer.state.TransactionExecutionStatus",
+    18: "raiden.transfer.state.MerkleTreeState",
+    19: "raiden.transfer.state.NettingChannelEndState",
+    20: "raiden.transfer.state.NettingChannelState",
+    21: "raiden.transfer.state.TransactionChannelNewBalance",
+    22: "raiden.transfer.state.TransactionOrder",
+    23: "raiden.transfer.mediated_transfer.state.InitiatorPaymentState",
+    24: "raiden.transfer.mediated_transfer.state.InitiatorTransferState",
+    25: "raiden.transfer.mediated_transfer.state.WaitingTransferState",
+    26: "raiden.transfer.mediated_transfer.state.MediatorTransferState",
+    27: "raiden.transfer.mediated_transfer.state.TargetTransferState",
+    28: "raiden.transfer.mediated_transfer.state.LockedTransferUnsignedState",
+    29: "raiden.transfer.mediated_transfer.state.LockedTransferSignedState",
+    30: "raiden.transfer.mediated_transfer.state.TransferDescriptionWithSecretState",
+    31: "raiden.transfer.mediated_transfer.state.MediationPairState",
+    32: "raiden.transfer.state_change.Block",
+    33: "raiden.transfer.state_change.ActionUpdateTransportAuthData",
+    34: "raiden.transfer.state_change.ActionCancelPayment",
+    35: "raiden.transfer.state_change.ActionChannelClose",
+    36: "raiden.transfer.state_change.ActionChannelSetFee",
+    37: "raiden.transfer.state_change.ActionCancelTransfer",
+    38: "raiden.transfer.state_change.ContractReceiveChannelNew",
+    39: "raiden.transfer.state_change.ContractReceiveChannelClosed",
+    40: "raiden.transfer.state_change.ActionInitChain",
+    41: "raiden.transfer.state_change.ActionNewTokenNetwork",
+    42: "raiden.transfer.state_change.ContractReceiveChannelNewBalance",
+    43: "raiden.transfer.state_change.ContractReceiveChannelSettled",
+    44: "raiden.transfer.state_change.ActionLeaveAllNetworks",
+    45: "raiden.transfer.state_change.ActionChangeNodeNetworkState",
+    46: "raiden.transfer.state_change.ContractReceiveNewPaymentNetwork",
+    47: "raiden.transfer.state_change.ContractReceiveNewTokenNetwork",
+    48: "raiden.transfer.state_change.ContractReceiveSecretReveal",
+    49: "raiden.transfer.state_change.ContractReceiveChannelBatchUnlock",
+    50: "raiden.transfer.state_change.ContractReceiveRouteNew",
+    51: "raiden.transfer.state_change.ContractReceiveRouteClosed",
+    52: "raiden.transfer.state_change.ContractReceiveUpdateTransfer",
+    53: "raiden.transfer.state_change.ReceiveUnlock",
+    54: "raiden.transfer.state_change.ReceiveDelivered",
+    55: "raiden.transfer.state_change.ReceiveProcessed",
+    56: "raiden.transfer.mediated_transfer.state_change.ActionInitInitiator",
+    57: "raiden.transfer.mediated_transfer.state_change.ActionInitMediator",
+    58: "raiden.transfer.mediated_transfer.state_change.ActionInitTarget",
+    59: "raiden.transfer.mediated_transfer.state_change.ReceiveLockExpired",
+    60: "raiden.transfer.mediated_transfer.state_change.ReceiveSecretRequest",
+    61: "raiden.transfer.mediated_transfer.state_change.ReceiveSecretReveal",
+    62: "raiden.transfer.mediated_transfer.state_change.ReceiveTransferRefundCancelRoute",
+    63: "raiden.transfer.mediated_transfer.state_change.ReceiveTransferRefund",
+    64: "raiden.transfer.events.ContractSendChannelClose",
+    65: "raiden.transfer.events.ContractSendChannelSettle",
+    66: "raiden.transfer.events.ContractSendChannelUpdateTransfer",
+    67: "raiden.transfer.events.ContractSendChannelBatchUnlock",
+    68: "raiden.transfer.events.ContractSendSecretReveal",
+    69: "raiden.transfer.events.EventPaymentSentSuccess",
+    70: "raiden.transfer.events.EventPaymentSentFailed",
+    71: "raiden.transfer.events.EventPaymentReceivedSuccess",
+    72: "raiden.transfer.events.EventInvalidReceivedTransferRefund",
+    73: "raiden.transfer.events.EventInvalidReceivedLockExpired",
+    74: "raiden.transfer.events.EventInvalidReceivedLockedTransfer",
+    75: "raiden.transfer.events.EventInvalidReceivedUnlock",
+    76: "raiden.transfer.events.SendProcessed",
+    77: "raiden.transfer.mediated_transfer.events.SendLockExpired",
+    78: "raiden.transfer.mediated_transfer.events.SendLockedTransfer",
+    79: "raiden.transfer.mediated_transfer.events.SendSecretReveal",
+    80: "raiden.transfer.mediated_transfer.events.SendBalanceProof",
+    81: "raiden.transfer.mediated_transfer.events.SendSecretRequest",
+    82: "raiden.transfer.mediated_transfer.events.SendRefundTransfer",
+    83: "raiden.transfer.mediated_transfer.events.EventUnlockSuccess",
+    84: "raiden.transfer.mediated_transfer.events.EventUnlockFailed",
+    85: "raiden.transfer.mediated_transfer.events.EventUnlockClaimSuccess",
+    86: "raiden.transfer.mediated_transfer.events.EventUnlockClaimFailed",
+    87: "raiden.transfer.mediated_transfer.events.EventUnexpectedSecretReveal",
+}
+BINARY_TYPE_NAMES_TO_TAGS = {type_name: tag for tag, type_name in BINARY_TYPE_TAGS.items()}
+
+# Map key of the type metadata of an encoded object. JSON objects only have
+# string keys, so this cannot clash with the object's fields.
+BINARY_TYPE_KEY = 0
+
+# Extension types used for the strings which are encoded as raw bytes, and for
+# the integers which are out of the range of msgpack.
+EXT_HEX = 1
+EXT_CHECKSUM_ADDRESS = 2
+EXT_BIG_INT = 3
+
+
+@lru_cache(maxsize=4096)
+def _checksum_address(address: bytes) -> str:
+    return to_checksum_address(address)
+
+
+def _to_binary_string(value: str) -> Union[str, msgpack.ExtType]:
+    """ Encode the hex strings produced by `serialize_bytes` and
+    `to_checksum_address` as raw bytes, if the original string can be
+    reconstructed exactly.
+    """
+    if not value.startswith("0x"):
+        return value
+
+    try:
+        raw = bytes.fromhex(value[2:])
+    except ValueError:
+        return value
+
+    if value == "0x" + raw.hex():
+        return msgpack.ExtType(EXT_HEX, raw)
+
+    if len(raw) == 20 and value == _checksum_address(raw):
+        return msgpack.ExtType(EXT_CHECKSUM_ADDRESS, raw)
+
+    return value
+
+
+def _to_binary_value(value: Any) -> Any:
+    """ Convert a value returned by `to_dict` to its binary representation.
+
+    Objects are left untouched, these are handled by `to_binary_hook`.
+    """
+    if isinstance(value, str):
+        return _to_binary_string(value)
+
+    if isinstance(value, int) and not -(2 ** 63) <= value < 2 ** 64:
+        return msgpack.ExtType(EXT_BIG_INT, str(value).encode())
+
+    if isinstance(value, (list, tuple)):
+        return [_to_binary_value(item) for item in value]
+
+    if isinstance(value, dict):
+        # Keys are converted to strings as it is done by the json module, so
+        # the decoded objects are identical for both serializers.
+        return {
+            _to_binary_string(key if isinstance(key, str) else json.dumps(key)): (
+                _to_binary_value(item)
+            )
+            for key, item in value.items()
+        }
+
+    return value
+
+
+def to_binary_hook(obj):
+    """ Convert internal objects to their binary representation.
+
+    This is the counterpart of `to_dict_hook`, the type metadata is encoded
+    with an integer tag from `BINARY_TYPE_TAGS`, and `_version` is omitted
+    since it is always zero.
+    """
+    if hasattr(obj, "to_dict"):
+        result = _to_binary_value(obj.to_dict())
+        assert isinstance(result, dict), "to_dict must return a dictionary"
+
+        type_name = f"{obj.__module__}.{obj.__class__.__name__}"
+        result[BINARY_TYPE_KEY] = BINARY_TYPE_NAMES_TO_TAGS.get(type_name, type_name)
+        return result
+
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not serializable")
+
+
+def _binary_ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_HEX:
+        return "0x" + data.hex()
+
+    if code == EXT_CHECKSUM_ADDRESS:
+        return _checksum_address(data)
+
+    if code == EXT_BIG_INT:
+        return int(data)
+
+    raise TypeError(f"Unknown extension type {code}")
+
+
+def from_binary_hook(data: Dict) -> Dict:
+    """ Restore the `_type` and `_version` metadata of an object encoded with
+    `to_binary_hook`, the result is identical to the decoded JSON object.
+    """
+    type_tag = data.pop(BINARY_TYPE_KEY, None)
+
+    if type_tag is not None:
+        if isinstance(type_tag, int):
+            if type_tag not in BINARY_TYPE_TAGS:
+                raise TypeError(f"Unknown type tag {type_tag}")
+            type_tag = BINARY_TYPE_TAGS[type_tag]
+
+        data["_type"] = type_tag
+        data["_version"] = 0
+
+    return data
+
+
+def _binary_object_hook(data: Dict) -> Any:
+    return from_dict_hook(from_binary_hook(data))
+
+
+def binary_to_json(data: bytes) -> str:
+    """ Convert data encoded with `BinarySerializer` to the equivalent
+    `JSONSerializer` encoding, without instantiating the objects.
+
+    This is used to run the database migrations, which work on the JSON
+    representation of older versions of the objects.
+    """
+    document = msgpack.unpackb(
+        data,
+        raw=False,
+        strict_map_key=False,
+        ext_hook=_binary_ext_hook,
+        object_hook=from_binary_hook,
+    )
+    return json.dumps(document)
+
+
+class BinarySerializer(SerializationBase):
+    """ Compact binary serializer based on msgpack.
+
+    Objects are converted with the same `to_dict`/`from_dict` hooks used by
+    the `JSONSerializer`, but the type names are replaced by integer tags and
+    the hex encoded bytes by raw bytes.
+    """
+
+    @staticmethod
+    def serialize(obj):
+        return msgpack.packb(_to_binary_value(obj), default=to_binary_hook, use_bin_type=True)
+
+    @staticmethod
+    def deserialize(data):
+        return msgpack.unpackb(
+            data,
+            raw=False,
+            strict_map_key=False,
+            ext_hook=_binary_ext_hook,
+            object_hook=_binary_object_hook,
+        )
+
+
+# Serializers which can be used for the snapshots, selected by the
+# `snapshot_serializer` setting of the database configuration.
+SNAPSHOT_SERIALIZERS = {"json": JSONSerializer, "binary": BinarySerializer}
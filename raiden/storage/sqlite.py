@@ -1,13 +1,35 @@
 import sqlite3
 import threading
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+import gevent
+from eth_utils import to_checksum_address
+from gevent.queue import Queue
 
 from raiden.constants import RAIDEN_DB_VERSION, SQLITE_MIN_REQUIRED_VERSION
 from raiden.exceptions import InvalidDBData, InvalidNumberInput
-from raiden.storage.serialize import SerializationBase
-from raiden.storage.utils import DB_SCRIPT_CREATE_TABLES, TimestampedEvent
+from raiden.storage.serialize import BinarySerializer, JSONSerializer, SerializationBase
+from raiden.storage.utils import (
+    DB_ARCHIVED_TABLES,
+    DB_INDEXED_JSON_FIELDS,
+    DB_SCRIPT_CREATE_ARCHIVE_TABLES,
+    DB_SCRIPT_CREATE_TABLES,
+    TimestampedEvent,
+)
+from raiden.transfer.identifiers import CanonicalIdentifier
 from raiden.utils import get_system_spec
-from raiden.utils.typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from raiden.utils.typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 
 class EventRecord(NamedTuple):
@@ -59,24 +81,118 @@ def _filter_from_dict(current: Dict[str, Any]) -> Dict[str, Any]:
     return filter_
 
 
+def _json_field(table: str, field: str, args: List[Any]) -> str:
+    """ Returns the expression to extract `field` from the `data` column of
+    `table`.
+
+    The path of indexed fields is inlined so the expression matches the one
+    of the index, otherwise it is appended to `args`.
+    """
+    if field in DB_INDEXED_JSON_FIELDS[table]:
+        return f"json_extract(data, '$.{field}')"
+
+    args.append(f"$.{field}")
+    return "json_extract(data, ?)"
+
+
+def _fetchall(conn: sqlite3.Connection, query: str, args: Any) -> List[Tuple]:
+    return conn.execute(query, args).fetchall()
+
+
+def _attach_archive(conn: sqlite3.Connection, archive_path: str) -> None:
+    """ Attach the archive database to `conn` and create the temporary
+    `<table>_history` views, which join the archived and the current rows.
+    """
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+
+    for table, columns in DB_ARCHIVED_TABLES.items():
+        conn.execute(
+            f"CREATE TEMP VIEW IF NOT EXISTS {table}_history AS "
+            f"SELECT {columns} FROM archive.{table} "
+            f"UNION ALL "
+            f"SELECT {columns} FROM main.{table}"
+        )
+
+
+class ReadOnlyConnectionPool:
+    """ A pool of read only connections to the database.
+
+    The queries are executed in the hub's threadpool, so long reads done for
+    the API don't stall the greenlets writing to the WAL. Every query sees a
+    consistent snapshot of the committed data.
+
+    Note:
+        This requires the database to be in the WAL journal mode, otherwise
+        the readers and the writer would lock each other out.
+    """
+
+    def __init__(self, database_path: str, size: int, archive_path: str = None) -> None:
+        uri = Path(database_path).absolute().as_uri() + "?mode=ro"
+
+        self.connections: Queue = Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(
+                uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+            )
+            conn.text_factory = str
+
+            if archive_path is not None:
+                _attach_archive(conn, Path(archive_path).absolute().as_uri() + "?mode=ro")
+
+            self.connections.put(conn)
+
+    def fetchall(self, query: str, args: Any) -> List[Tuple]:
+        conn = self.connections.get()
+        try:
+            return gevent.get_hub().threadpool.apply(_fetchall, (conn, query, args))
+        finally:
+            self.connections.put(conn)
+
+    def close(self) -> None:
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
 class SQLiteStorage:
-    def __init__(self, database_path):
+    def __init__(self, database_path, read_connections: int = 0, archive_path: str = None):
+        """
+        Args:
+            database_path: Path to the database file, or ":memory:".
+            read_connections: Number of read only connections used for the
+                API queries. If non zero the database is switched to the WAL
+                journal mode, so these connections can read concurrently with
+                the writes. Not supported for in-memory databases.
+            archive_path: Path to the archive database, which receives the
+                history moved by `archive_history`. The queries for the
+                history, i.e. restoring an older state and the events, read
+                from both databases.
+        """
+        use_read_pool = read_connections > 0 and database_path != ":memory:"
+
         conn = sqlite3.connect(database_path, detect_types=sqlite3.PARSE_DECLTYPES)
         conn.text_factory = str
         conn.execute("PRAGMA foreign_keys=ON")
 
-        # Skip the acquire/release cycle for the exclusive write lock.
-        # References:
-        # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
-        # https://sqlite.org/pragma.html#pragma_locking_mode
-        conn.execute("PRAGMA locking_mode=EXCLUSIVE")
-
-        # Keep the journal around and skip inode updates.
-        # References:
-        # https://sqlite.org/atomiccommit.html#_persistent_rollback_journals
-        # https://sqlite.org/pragma.html#pragma_journal_mode
         try:
-            conn.execute("PRAGMA journal_mode=PERSIST")
+            if use_read_pool:
+                # Readers don't block the writer and see a snapshot of the
+                # database. The exclusive locking mode cannot be used since it
+                # would lock out the read connections.
+                # References:
+                # https://sqlite.org/wal.html
+                conn.execute("PRAGMA journal_mode=WAL")
+            else:
+                # Skip the acquire/release cycle for the exclusive write lock.
+                # References:
+                # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
+                # https://sqlite.org/pragma.html#pragma_locking_mode
+                conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+
+                # Keep the journal around and skip inode updates.
+                # References:
+                # https://sqlite.org/atomiccommit.html#_persistent_rollback_journals
+                # https://sqlite.org/pragma.html#pragma_journal_mode
+                conn.execute("PRAGMA journal_mode=PERSIST")
         except sqlite3.DatabaseError:
             raise InvalidDBData(
                 f"Existing DB {database_path} was found to be corrupt at Raiden startup. "
@@ -86,6 +202,26 @@ class SQLiteStorage:
         with conn:
             conn.executescript(DB_SCRIPT_CREATE_TABLES)
 
+        # Tables, or views if there is an archive, used to query the history
+        self.state_changes_history = "state_changes"
+        self.state_snapshot_history = "state_snapshot"
+        self.state_events_history = "state_events"
+
+        if archive_path is not None:
+            with closing(sqlite3.connect(archive_path)) as archive_conn:
+                archive_conn.executescript(DB_SCRIPT_CREATE_ARCHIVE_TABLES)
+
+            _attach_archive(conn, archive_path)
+            self.state_changes_history = "state_changes_history"
+            self.state_snapshot_history = "state_snapshot_history"
+            self.state_events_history = "state_events_history"
+
+        self.read_pool: Optional[ReadOnlyConnectionPool] = None
+        if use_read_pool:
+            self.read_pool = ReadOnlyConnectionPool(
+                database_path, read_connections, archive_path=archive_path
+            )
+
         # When writting to a table where the primary key is the identifier and we want
         # to return said identifier we use cursor.lastrowid, which uses sqlite's last_insert_rowid
         # https://github.com/python/cpython/blob/2.7/Modules/_sqlite/cursor.c#L727-L732
@@ -138,7 +274,7 @@ class SQLiteStorage:
         return int(query[0][0])
 
     def write_state_change(self, state_change, log_time):
-        with self.write_lock, self.conn:
+        with self.write_lock, self._autocommit():
             cursor = self.conn.execute(
                 "INSERT INTO state_changes(identifier, data, log_time) VALUES(null, ?, ?)",
                 (state_change, log_time),
@@ -148,7 +284,7 @@ class SQLiteStorage:
         return last_id
 
     def write_state_snapshot(self, statechange_id, snapshot):
-        with self.write_lock, self.conn:
+        with self.write_lock, self._autocommit():
             cursor = self.conn.execute(
                 "INSERT INTO state_snapshot(statechange_id, data) VALUES(?, ?)",
                 (statechange_id, snapshot),
@@ -164,7 +300,7 @@ class SQLiteStorage:
             state_change_identifier: Id of the state change that generate these events.
             events: List of Event objects.
         """
-        with self.write_lock, self.conn:
+        with self.write_lock, self._autocommit():
             self.conn.executemany(
                 "INSERT INTO state_events("
                 "   identifier, source_statechange_id, log_time, data"
@@ -217,9 +353,9 @@ class SQLiteStorage:
                 state_change_identifier = 0
 
         cursor = self.conn.execute(
-            "SELECT statechange_id, data FROM state_snapshot "
-            "WHERE statechange_id <= ? "
-            "ORDER BY identifier DESC LIMIT 1",
+            f"SELECT statechange_id, data FROM {self.state_snapshot_history} "
+            f"WHERE statechange_id <= ? "
+            f"ORDER BY identifier DESC LIMIT 1",
             (state_change_identifier,),
         )
         rows = cursor.fetchall()
@@ -242,13 +378,12 @@ class SQLiteStorage:
         where_clauses = []
         args = []
         for field, value in filters.items():
-            where_clauses.append("json_extract(data, ?)=?")
-            args.append(f"$.{field}")
+            where_clauses.append(_json_field("state_events", field, args) + "=?")
             args.append(value)
 
         cursor.execute(
             "SELECT identifier, source_statechange_id, data FROM state_events WHERE "
-            f"{' AND '.join(where_clauses)}"
+            f"{' AND '.join(where_clauses)} "
             "ORDER BY identifier DESC LIMIT 1",
             args,
         )
@@ -271,19 +406,25 @@ class SQLiteStorage:
     def _form_and_execute_json_query(
         self,
         query: str,
+        table: str,
         limit: int = None,
         offset: int = None,
         filters: List[Tuple[str, Any]] = None,
         logical_and: bool = True,
-    ) -> sqlite3.Cursor:
+    ) -> List[Tuple]:
         limit, offset = _sanitize_limit_and_offset(limit, offset)
-        cursor = self.conn.cursor()
         where_clauses = []
         args: List[Union[str, int]] = []
         if filters:
             for field, value in filters:
-                where_clauses.append(f"json_extract(data, ?) LIKE ?")
-                args.append(f"$.{field}")
+                expression = _json_field(table, field, args)
+
+                # The LIKE operator cannot use an expression index, fallback
+                # to an equality test if there is no wildcard in the pattern.
+                if field in DB_INDEXED_JSON_FIELDS[table] and "%" not in str(value):
+                    where_clauses.append(f"{expression}=?")
+                else:
+                    where_clauses.append(f"{expression} LIKE ?")
                 args.append(value)
 
             if logical_and:
@@ -295,8 +436,7 @@ class SQLiteStorage:
         args.append(limit)
         args.append(offset)
 
-        cursor.execute(query, args)
-        return cursor
+        return self._read_query(query, args)
 
     def get_latest_state_change_by_data_field(self, filters: Dict[str, Any]) -> StateChangeRecord:
         """ Return all state changes filtered by a named field and value."""
@@ -306,8 +446,7 @@ class SQLiteStorage:
         args = []
         filters = _filter_from_dict(filters)
         for field, value in filters.items():
-            where_clauses.append("json_extract(data, ?)=?")
-            args.append(f"$.{field}")
+            where_clauses.append(_json_field("state_changes", field, args) + "=?")
             args.append(value)
 
         where = " AND ".join(where_clauses)
@@ -345,14 +484,15 @@ class SQLiteStorage:
         Additionally the returned state changes can be optionally filtered with
         the `filters` parameter to search for specific data in the state change data.
         """
-        cursor = self._form_and_execute_json_query(
+        rows = self._form_and_execute_json_query(
             query="SELECT identifier, data FROM state_changes ",
+            table="state_changes",
             limit=limit,
             offset=offset,
             filters=filters,
             logical_and=logical_and,
         )
-        result = [StateChangeRecord(state_change_identifier=row[0], data=row[1]) for row in cursor]
+        result = [StateChangeRecord(state_change_identifier=row[0], data=row[1]) for row in rows]
 
         return result
 
@@ -400,33 +540,42 @@ class SQLiteStorage:
 
         if to_identifier == "latest":
             cursor.execute(
-                "SELECT data FROM state_changes WHERE identifier >= ? ORDER BY identifier ASC",
+                f"SELECT data FROM {self.state_changes_history} WHERE identifier >= ? "
+                f"ORDER BY identifier ASC",
                 (from_identifier,),
             )
         else:
             cursor.execute(
-                "SELECT data FROM state_changes WHERE identifier "
-                "BETWEEN ? AND ? ORDER BY identifier ASC",
+                f"SELECT data FROM {self.state_changes_history} WHERE identifier "
+                f"BETWEEN ? AND ? ORDER BY identifier ASC",
                 (from_identifier, to_identifier),
             )
 
         result = [entry[0] for entry in cursor]
         return result
 
+    def _read_query(self, query: str, args: Any) -> List[Tuple]:
+        """ Execute a read only query done on behalf of the API.
+
+        If the read pool is enabled the query doesn't go through the write
+        connection, so it only sees committed data.
+        """
+        if self.read_pool is not None:
+            return self.read_pool.fetchall(query, args)
+
+        return _fetchall(self.conn, query, args)
+
     def _query_events(self, limit: int = None, offset: int = None):
         limit, offset = _sanitize_limit_and_offset(limit, offset)
-        cursor = self.conn.cursor()
 
-        cursor.execute(
-            """
-            SELECT data, log_time FROM state_events
+        return self._read_query(
+            f"""
+            SELECT data, log_time FROM {self.state_events_history}
                 ORDER BY identifier ASC LIMIT ? OFFSET ?
             """,
             (limit, offset),
         )
 
-        return cursor.fetchall()
-
     def _get_event_records(
         self,
         limit: int = None,
@@ -441,8 +590,9 @@ class SQLiteStorage:
         Additionally the returned events can be optionally filtered with
         the `filters` parameter to search for specific data in the event data.
         """
-        cursor = self._form_and_execute_json_query(
+        rows = self._form_and_execute_json_query(
             query="SELECT identifier, source_statechange_id, data FROM state_events ",
+            table="state_events",
             limit=limit,
             offset=offset,
             filters=filters,
@@ -451,7 +601,7 @@ class SQLiteStorage:
 
         result = [
             EventRecord(event_identifier=row[0], state_change_identifier=row[1], data=row[2])
-            for row in cursor
+            for row in rows
         ]
         return result
 
@@ -515,10 +665,147 @@ class SQLiteStorage:
         cursor.executemany("UPDATE state_snapshot SET data=? WHERE identifier=?", snapshots_data)
         self.maybe_commit()
 
+    def archive_history(self, keep_channels: Iterable[CanonicalIdentifier]) -> int:
+        """ Move the history which is not necessary to run the node to the
+        archive database, and return the number of archived state changes.
+
+        Only the state changes before the latest snapshot are archived, since
+        these are not replayed on a restart. The state changes containing a
+        balance proof for one of the `keep_channels`, or which produced an
+        event with such a balance proof, are kept together with their events,
+        because these are looked up to settle and unlock the channel. Older
+        snapshots are archived as well.
+        """
+        assert self.state_changes_history != "state_changes", "no archive attached"
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(statechange_id) FROM main.state_snapshot")
+        archive_before = cursor.fetchone()[0]
+        if archive_before is None:
+            return 0
+
+        has_kept_balance_proof = (
+            "EXISTS ("
+            "SELECT 1 FROM temp.keep_channels WHERE "
+            "token_network_address = json_extract("
+            "data, '$.balance_proof.canonical_identifier.token_network_address'"
+            ") AND channel_identifier = json_extract("
+            "data, '$.balance_proof.canonical_identifier.channel_identifier'"
+            "))"
+        )
+
+        with self.write_lock, self.transaction():
+            cursor.execute(
+                "CREATE TEMP TABLE keep_channels (token_network_address TEXT, "
+                "channel_identifier TEXT)"
+            )
+            cursor.executemany(
+                "INSERT INTO temp.keep_channels VALUES(?, ?)",
+                [
+                    (
+                        to_checksum_address(canonical_identifier.token_network_address),
+                        str(canonical_identifier.channel_identifier),
+                    )
+                    for canonical_identifier in keep_channels
+                ],
+            )
+
+            # The state change of the last event is also kept, otherwise the
+            # identifiers of the events written after the archival could
+            # collide with the archived ones.
+            cursor.execute(
+                f"CREATE TEMP TABLE archived_state_changes AS "
+                f"SELECT identifier FROM main.state_changes WHERE identifier < ? "
+                f"EXCEPT SELECT identifier FROM main.state_changes "
+                f"WHERE identifier < ? AND {has_kept_balance_proof} "
+                f"EXCEPT SELECT source_statechange_id FROM main.state_events "
+                f"WHERE source_statechange_id < ? AND {has_kept_balance_proof} "
+                f"EXCEPT SELECT MAX(source_statechange_id) FROM main.state_events",
+                (archive_before, archive_before, archive_before),
+            )
+
+            archived = "IN (SELECT identifier FROM temp.archived_state_changes)"
+            moves = [
+                ("state_changes", f"identifier {archived}", ()),
+                ("state_snapshot", "statechange_id < ?", (archive_before,)),
+                ("state_events", f"source_statechange_id {archived}", ()),
+            ]
+            for table, where, args in moves:
+                columns = DB_ARCHIVED_TABLES[table]
+                cursor.execute(
+                    f"INSERT INTO archive.{table}({columns}) "
+                    f"SELECT {columns} FROM main.{table} WHERE {where}",
+                    args,
+                )
+
+            # Delete the rows which reference the state changes first
+            for table, where, args in reversed(moves):
+                cursor.execute(f"DELETE FROM main.{table} WHERE {where}", args)
+
+            cursor.execute("SELECT COUNT(1) FROM temp.archived_state_changes")
+            archived_count = cursor.fetchone()[0]
+
+            cursor.execute("DROP TABLE temp.keep_channels")
+            cursor.execute("DROP TABLE temp.archived_state_changes")
+
+        return archived_count
+
+    def merge_archive(self, archive_path: str) -> None:
+        """ Move the history from the archive at `archive_path` back to this
+        database, used to run the migrations on the whole history.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("ATTACH DATABASE ? AS merged_archive", (archive_path,))
+
+        try:
+            with self.write_lock, self.transaction():
+                # Insert the referenced state changes first
+                for table, columns in DB_ARCHIVED_TABLES.items():
+                    cursor.execute(
+                        f"INSERT INTO main.{table}({columns}) "
+                        f"SELECT {columns} FROM merged_archive.{table}"
+                    )
+        finally:
+            cursor.execute("DETACH DATABASE merged_archive")
+
     def maybe_commit(self):
         if not self.in_transaction:
             self.conn.commit()
 
+    @contextmanager
+    def _autocommit(self):
+        """ Commit the writes done inside the context, unless a transaction was
+        started with `begin_transaction`, in which case the writes are
+        committed together with the transaction.
+        """
+        if self.in_transaction:
+            yield
+        else:
+            with self.conn:
+                yield
+
+    def begin_transaction(self) -> None:
+        """ Start a transaction which spans multiple writes, used to group
+        the commits of multiple state changes.
+        """
+        with self.write_lock:
+            self.conn.execute("BEGIN")
+            self.in_transaction = True
+
+    def commit_transaction(self) -> None:
+        with self.write_lock:
+            try:
+                self.conn.commit()
+            finally:
+                self.in_transaction = False
+
+    def rollback_transaction(self) -> None:
+        with self.write_lock:
+            try:
+                self.conn.rollback()
+            finally:
+                self.in_transaction = False
+
     @contextmanager
     def transaction(self):
         cursor = self.conn.cursor()
@@ -533,24 +820,62 @@ class SQLiteStorage:
         finally:
             self.in_transaction = False
 
-    def __del__(self):
+    def close(self):
+        if self.read_pool is not None:
+            self.read_pool.close()
         self.conn.close()
 
+    def __del__(self):
+        self.close()
+
+
+def deserialize_snapshot(data: Union[str, bytes]) -> Any:
+    """ Decode a snapshot written with either the `JSONSerializer`, which is
+    stored as text, or the `BinarySerializer`, which is stored as a blob.
+    """
+    if isinstance(data, bytes):
+        return BinarySerializer.deserialize(data)
+
+    return JSONSerializer.deserialize(data)
+
 
 class SerializedSQLiteStorage(SQLiteStorage):
-    def __init__(self, database_path, serializer: SerializationBase):
-        super().__init__(database_path)
+    def __init__(
+        self,
+        database_path,
+        serializer: SerializationBase,
+        read_connections: int = 0,
+        snapshot_serializer: SerializationBase = None,
+        archive_path: str = None,
+    ) -> None:
+        """
+        Args:
+            serializer: Serializer for the state changes and events.
+            snapshot_serializer: Serializer used to write new snapshots, either
+                the `JSONSerializer` or the `BinarySerializer`. Defaults to
+                `serializer`. Snapshots are always read with the serializer
+                they were written with, so this can be changed for an existing
+                database.
+        """
+        super().__init__(
+            database_path, read_connections=read_connections, archive_path=archive_path
+        )
 
         self.serializer = serializer
+        self.snapshot_serializer = snapshot_serializer or serializer
 
     def write_state_change(self, state_change, log_time):
         serialized_data = self.serializer.serialize(state_change)
         return super().write_state_change(serialized_data, log_time)
 
     def write_state_snapshot(self, statechange_id, snapshot):
-        serialized_data = self.serializer.serialize(snapshot)
+        serialized_data = self.snapshot_serializer.serialize(snapshot)
         return super().write_state_snapshot(statechange_id, serialized_data)
 
+    def write_serialized_state_snapshot(self, statechange_id, serialized_snapshot):
+        """ Save a snapshot serialized with `self.snapshot_serializer`. """
+        return super().write_state_snapshot(statechange_id, serialized_snapshot)
+
     def write_events(self, state_change_identifier, events, log_time):
         """ Save events.
 
@@ -570,7 +895,7 @@ class SerializedSQLiteStorage(SQLiteStorage):
 
         if row:
             last_applied_state_change_id = row[0]
-            snapshot_state = self.serializer.deserialize(row[1])
+            snapshot_state = deserialize_snapshot(row[1])
             return (last_applied_state_change_id, snapshot_state)
 
         return None
@@ -584,7 +909,7 @@ class SerializedSQLiteStorage(SQLiteStorage):
 
         if row[1]:
             last_applied_state_change_id = row[0]
-            snapshot_state = self.serializer.deserialize(row[1])
+            snapshot_state = deserialize_snapshot(row[1])
             result = (last_applied_state_change_id, snapshot_state)
         else:
             result = (0, None)
@@ -47,10 +47,30 @@ CREATE TABLE IF NOT EXISTS runs (
 );
 """
 
+# JSON fields of the `data` column which are used in lookups. These are
+# indexed with expression indexes, which are only used by the query planner if
+# the query has the exact same expression, i.e. the path must be inlined as a
+# literal and not passed as a query parameter.
+#
+# The canonical identifier, sender and recipient are always queried together
+# with the balance hash or the locksroot, which are selective enough on their
+# own, so these are not indexed to keep the cost of the writes down.
+DB_INDEXED_JSON_FIELDS = {
+    "state_changes": ("_type", "balance_proof.balance_hash", "balance_proof.locksroot"),
+    "state_events": ("_type", "balance_proof.balance_hash", "balance_proof.locksroot"),
+}
+
+DB_CREATE_JSON_INDEXES = "".join(
+    f"CREATE INDEX IF NOT EXISTS {table}_{field.replace('.', '_')} "
+    f"ON {table}(json_extract(data, '$.{field}'));\n"
+    for table, fields in DB_INDEXED_JSON_FIELDS.items()
+    for field in fields
+)
+
 DB_SCRIPT_CREATE_TABLES = """
 PRAGMA foreign_keys=off;
 BEGIN TRANSACTION;
-{}{}{}{}{}
+{}{}{}{}{}{}
 COMMIT;
 PRAGMA foreign_keys=on;
 """.format(
@@ -59,4 +79,40 @@ PRAGMA foreign_keys=on;
     DB_CREATE_SNAPSHOT,
     DB_CREATE_STATE_EVENTS,
     DB_CREATE_RUNS,
+    DB_CREATE_JSON_INDEXES,
 )
+
+# The archive database holds the history which is not necessary to run the
+# node. Rows are moved to it with their original identifiers, and there are no
+# foreign keys, since the state changes, events and snapshots which reference
+# each other may be split between the two databases.
+DB_SCRIPT_CREATE_ARCHIVE_TABLES = """
+BEGIN TRANSACTION;
+CREATE TABLE IF NOT EXISTS state_changes (
+    identifier INTEGER PRIMARY KEY,
+    data JSON,
+    log_time TEXT
+);
+CREATE TABLE IF NOT EXISTS state_snapshot (
+    identifier INTEGER PRIMARY KEY,
+    statechange_id INTEGER,
+    data JSON
+);
+CREATE TABLE IF NOT EXISTS state_events (
+    identifier INTEGER PRIMARY KEY,
+    source_statechange_id INTEGER NOT NULL,
+    log_time TEXT,
+    data JSON
+);
+{}
+COMMIT;
+""".format(
+    DB_CREATE_JSON_INDEXES
+)
+
+# Columns of the tables which can be archived
+DB_ARCHIVED_TABLES = {
+    "state_changes": "identifier, data, log_time",
+    "state_snapshot": "identifier, statechange_id, data",
+    "state_events": "identifier, source_statechange_id, log_time, data",
+}
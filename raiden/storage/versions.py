@@ -6,6 +6,14 @@ from raiden.utils.typing import List, Optional
 VERSION_RE = re.compile(r"^v(\d+)_log[.]db$")
 
 
+def archive_db_file(db_path: str) -> str:
+    """Returns the path of the archive database for the database `db_path`,
+    e.g. `v16_log_archive.db` for `v16_log.db`.
+    """
+    root, extension = os.path.splitext(db_path)
+    return f"{root}_archive{extension}"
+
+
 def latest_db_file(paths: List[str]) -> Optional[str]:
     """Returns the path with the highest `version` number.
 
@@ -1,17 +1,26 @@
+import time
 from datetime import datetime
 
+import gevent
 import gevent.lock
 import structlog
+from gevent.event import AsyncResult
 
+from raiden.constants import SNAPSHOT_STATE_CHANGES_COUNT
 from raiden.storage.sqlite import SerializedSQLiteStorage
 from raiden.transfer.architecture import Event, State, StateChange, StateManager
-from raiden.utils.typing import Callable, Generic, List, Tuple, TypeVar
+from raiden.utils.typing import Any, Callable, Generic, List, Optional, Tuple, TypeVar
 
 log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
 
 
 def restore_to_state_change(
-    transition_function: Callable, storage: SerializedSQLiteStorage, state_change_identifier: int
+    transition_function: Callable,
+    storage: SerializedSQLiteStorage,
+    state_change_identifier: int,
+    copy_state: bool = True,
+    group_commit_window: float = 0.0,
+    snapshot_policy: Optional["SnapshotPolicy"] = None,
 ) -> "WriteAheadLog":
     msg = "state change identifier 'latest' or an integer greater than zero"
     assert state_change_identifier == "latest" or state_change_identifier > 0, msg
@@ -36,21 +45,90 @@ def restore_to_state_change(
         from_identifier=from_state_change_id, to_identifier=state_change_identifier
     )
 
-    state_manager = StateManager(transition_function, chain_state)
-    wal = WriteAheadLog(state_manager, storage)
+    state_manager = StateManager(transition_function, chain_state, copy_state=copy_state)
+    wal = WriteAheadLog(
+        state_manager,
+        storage,
+        group_commit_window=group_commit_window,
+        snapshot_policy=snapshot_policy,
+    )
 
     log.debug("Replaying state changes", num_state_changes=len(unapplied_state_changes))
     for state_change in unapplied_state_changes:
-        wal.state_manager.dispatch(state_change)
+        wal.dispatch(state_change)
 
     return wal
 
 
+class SnapshotPolicy:
+    """ Decides when a new snapshot must be taken.
+
+    The number of state changes and the time spent dispatching them since the
+    last snapshot are tracked in memory, the latter is an estimate of how long
+    it would take to replay them on a restart.
+
+    Args:
+        state_changes_count: Snapshot after this many state changes.
+        interval: If set, snapshot when this many seconds have passed since
+            the last snapshot and there is at least one new state change.
+        max_replay_time: If set, snapshot when replaying the state changes
+            since the last snapshot is estimated to take longer than this many
+            seconds.
+    """
+
+    def __init__(
+        self,
+        state_changes_count: int = SNAPSHOT_STATE_CHANGES_COUNT,
+        interval: Optional[float] = None,
+        max_replay_time: Optional[float] = None,
+    ) -> None:
+        if state_changes_count <= 0:
+            raise ValueError("state_changes_count must be a positive integer")
+
+        self.state_changes_count = state_changes_count
+        self.interval = interval
+        self.max_replay_time = max_replay_time
+
+        self.pending_state_changes = 0
+        self.pending_replay_time = 0.0
+        self.last_snapshot_time = time.monotonic()
+
+    def record(self, dispatch_duration: float) -> None:
+        """ Account for a state change which is not in a snapshot yet. """
+        self.pending_state_changes += 1
+        self.pending_replay_time += dispatch_duration
+
+    def reset(self) -> None:
+        """ Mark the state changes recorded so far as snapshotted. """
+        self.pending_state_changes = 0
+        self.pending_replay_time = 0.0
+        self.last_snapshot_time = time.monotonic()
+
+    def should_snapshot(self) -> bool:
+        if self.pending_state_changes == 0:
+            return False
+
+        if self.pending_state_changes >= self.state_changes_count:
+            return True
+
+        if self.max_replay_time is not None and self.pending_replay_time >= self.max_replay_time:
+            return True
+
+        elapsed = time.monotonic() - self.last_snapshot_time
+        return self.interval is not None and elapsed >= self.interval
+
+
 ST = TypeVar("ST", bound=State)
 
 
 class WriteAheadLog(Generic[ST]):
-    def __init__(self, state_manager: StateManager[ST], storage: SerializedSQLiteStorage) -> None:
+    def __init__(
+        self,
+        state_manager: StateManager[ST],
+        storage: SerializedSQLiteStorage,
+        group_commit_window: float = 0.0,
+        snapshot_policy: SnapshotPolicy = None,
+    ) -> None:
         self.state_manager = state_manager
         self.state_change_id = None
         self.storage = storage
@@ -61,6 +139,26 @@ class WriteAheadLog(Generic[ST]):
         # execution order.
         self._lock = gevent.lock.Semaphore()
 
+        # If set, the state changes logged until the node is idle, but for at
+        # most this many seconds, are saved in a single database transaction,
+        # and a single commit is paid for the whole group.
+        self.group_commit_window = group_commit_window
+        self._pending_commit: Optional[AsyncResult] = None
+        self._commit_error: Optional[BaseException] = None
+
+        self.snapshot_policy = snapshot_policy
+        self._snapshot_greenlet: Optional[gevent.Greenlet] = None
+
+    def dispatch(self, state_change: StateChange) -> Tuple[ST, List[Event]]:
+        """ Apply a state change without logging it, e.g. to replay the WAL. """
+        start = time.monotonic()
+        result = self.state_manager.dispatch(state_change)
+
+        if self.snapshot_policy is not None:
+            self.snapshot_policy.record(time.monotonic() - start)
+
+        return result
+
     def log_and_dispatch(self, state_change: StateChange) -> Tuple[ST, List[Event]]:
         """ Log and apply a state change.
 
@@ -69,18 +167,93 @@ class WriteAheadLog(Generic[ST]):
         to restore the node state.
 
         Events produced by applying state change are also saved.
+
+        With group commit enabled this function blocks until the transaction
+        containing the state change is committed. The events are returned
+        only once the state change is durable, so their side effects are never
+        executed for a state change which could be lost on a crash.
         """
+        state, events, pending_commit = self.log_and_dispatch_uncommitted(state_change)
+
+        if pending_commit is not None:
+            pending_commit.get()
+
+        return state, events
+
+    def log_and_dispatch_uncommitted(
+        self, state_change: StateChange
+    ) -> Tuple[ST, List[Event], Optional[AsyncResult]]:
+        """ Like `log_and_dispatch`, but without waiting for the group commit.
+
+        A greenlet which dispatches several state changes in a row joins a
+        single group this way. The returned result is set once the state change
+        is committed, or raises if the commit failed, it is None if the state
+        change already is durable. The side effects of the events must not be
+        executed before it is set.
+        """
+        pending_commit = None
 
         with self._lock:
+            if self._commit_error is not None:
+                raise RuntimeError("The write-ahead log failed to commit") from self._commit_error
+
+            if self.group_commit_window > 0:
+                pending_commit = self._join_group_commit()
+
             timestamp = datetime.utcnow().isoformat(timespec="milliseconds")
             state_change_id = self.storage.write_state_change(state_change, timestamp)
             self.state_change_id = state_change_id
 
-            state, events = self.state_manager.dispatch(state_change)
+            state, events = self.dispatch(state_change)
 
             self.storage.write_events(state_change_id, events, timestamp)
 
-        return state, events
+        return state, events, pending_commit
+
+    def _join_group_commit(self) -> AsyncResult:
+        """ Return the pending commit for the current group, starting a new
+        group if there is none.
+        """
+        if self._pending_commit is None:
+            self.storage.begin_transaction()
+            self._pending_commit = AsyncResult()
+            gevent.spawn(self._flush_when_idle)
+
+        return self._pending_commit
+
+    def _flush_when_idle(self) -> None:
+        # Commit once the greenlets which are ready to run, e.g. the one which
+        # started the group, yielded
+        with gevent.Timeout(self.group_commit_window, False):
+            gevent.idle()
+        self.flush()
+
+    def flush(self) -> None:
+        """ Commit the pending group of state changes, if any.
+
+        If the commit fails the transaction is rolled back. The in-memory
+        state is then ahead of the database, so no other state change is
+        accepted and the error is raised by the pending commit, which must
+        stop the node.
+        """
+        with self._lock:
+            pending_commit = self._pending_commit
+            self._pending_commit = None
+
+            if pending_commit is None:
+                return
+
+            try:
+                self.storage.commit_transaction()
+            except Exception as e:  # pylint: disable=broad-except
+                log.critical("Committing the write-ahead log failed", exc_info=True)
+                self._commit_error = e
+                try:
+                    self.storage.rollback_transaction()
+                finally:
+                    pending_commit.set_exception(e)
+            else:
+                pending_commit.set()
 
     def snapshot(self) -> None:
         """ Snapshot the application state.
@@ -89,13 +262,70 @@ class WriteAheadLog(Generic[ST]):
         restart or a crash.
         """
         with self._lock:
-            current_state = self.state_manager.current_state
-            state_change_id = self.state_change_id
+            state_change_id, current_state = self._snapshot_target()
 
             # otherwise no state change was dispatched
             if state_change_id:
                 self.storage.write_state_snapshot(state_change_id, current_state)
 
+    def maybe_snapshot(self) -> Optional[gevent.Greenlet]:
+        """ Start a snapshot in the background if the policy requires it, and
+        return the greenlet writing it.
+
+        A dispatch never changes the state it starts from, the state manager
+        either deep copies it or copies the modified paths with structural
+        sharing. The current state is therefore serialized in the hub's
+        threadpool while new state changes are applied. Only the insert of the
+        serialized snapshot runs on the hub, the database connection may not
+        be used from another thread.
+        """
+        policy = self.snapshot_policy
+        snapshot_running = self._snapshot_greenlet is not None
+        if policy is None or snapshot_running or not policy.should_snapshot():
+            return None
+
+        with self._lock:
+            state_change_id, current_state = self._snapshot_target()
+
+        # otherwise no state change was dispatched
+        if not state_change_id:
+            return None
+
+        log.debug("Storing snapshot", state_change_id=state_change_id)
+        self._snapshot_greenlet = gevent.spawn(
+            self._write_snapshot, state_change_id, current_state
+        )
+        return self._snapshot_greenlet
+
+    def wait_snapshot(self) -> None:
+        """ Wait for the background snapshot to be written, if any. """
+        snapshot_greenlet = self._snapshot_greenlet
+        if snapshot_greenlet is not None:
+            snapshot_greenlet.join()
+
+    def _snapshot_target(self) -> Tuple[Optional[int], Optional[ST]]:
+        """ Returns the current state and the id of the last state change
+        applied to it. The snapshot policy is reset if there is a state to
+        snapshot, must be called with the lock held.
+        """
+        state_change_id = self.state_change_id
+        if not state_change_id:
+            return None, None
+
+        if self.snapshot_policy is not None:
+            self.snapshot_policy.reset()
+
+        return state_change_id, self.state_manager.current_state
+
+    def _write_snapshot(self, state_change_id: int, state: Any) -> None:
+        try:
+            serialized_state = gevent.get_hub().threadpool.apply(
+                self.storage.snapshot_serializer.serialize, (state,)
+            )
+            self.storage.write_serialized_state_snapshot(state_change_id, serialized_state)
+        finally:
+            self._snapshot_greenlet = None
+
     @property
     def version(self):
         return self.storage.get_version()
@@ -1,4 +1,5 @@
 import re
+import time
 from json.decoder import JSONDecodeError
 
 import click
@@ -24,7 +25,7 @@ from raiden.network.proxies.user_deposit import UserDeposit
 from raiden.settings import MIN_REI_THRESHOLD
 from raiden.utils import gas_reserve, pex, to_rdn
 from raiden.utils.runnable import Runnable
-from raiden.utils.typing import Tuple
+from raiden.utils.typing import Any, Dict, Optional, Tuple
 
 REMOVE_CALLBACK = object()
 log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
@@ -142,9 +143,16 @@ class AlarmTask(Runnable):
         self.known_block_number = None
         self._stop_event = None
 
-        # TODO: Start with a larger sleep_time and decrease it as the
-        # probability of a new block increases.
+        # Polling interval once a new block is expected, see `_next_poll_interval`
         self.sleep_time = 0.5
+        # Without a block filter the polling interval is at most this fraction
+        # of the block time
+        self.max_poll_interval_fraction = 0.2
+        # Weight of a newly observed block interval in the block time estimate
+        self.block_time_smoothing = 0.1
+        self.block_time: Optional[float] = None
+        self._last_block_received_at: Optional[float] = None
+        self._block_filter: Any = None
 
     def __repr__(self):
         return f"<{self.__class__.__name__} node:{pex(self.chain.client.address)}>"
@@ -160,6 +168,7 @@ class AlarmTask(Runnable):
             self.loop_until_stop()
         finally:
             self.callbacks = list()
+            self._uninstall_block_filter()
 
     def is_primed(self):
         """True if the first_run has been called."""
@@ -192,18 +201,86 @@ class AlarmTask(Runnable):
         msg = "Only start the AlarmTask after it has been primed with the first_run"
         assert self.is_primed(), msg
 
-        sleep_time = self.sleep_time
-        while self._stop_event.wait(sleep_time) is not True:
+        while self._stop_event.wait(self._next_poll_interval()) is not True:
             try:
-                latest_block = self.chain.get_block(block_identifier="latest")
+                latest_block = self._poll_latest_block()
             except JSONDecodeError as e:
                 raise EthNodeCommunicationError(str(e))
 
-            self._maybe_run_callbacks(latest_block)
+            if latest_block is not None:
+                self._maybe_run_callbacks(latest_block)
+
+    def _next_poll_interval(self) -> float:
+        """ Returns the time to wait before polling for a new block.
+
+        Polling a block filter is cheap, so it is polled every `sleep_time`.
+        Otherwise the full block is polled, the task sleeps until the next
+        block is expected according to the estimated block time, but at most
+        a fraction of the block time so that a block mined earlier is not
+        detected late, and then polls every `sleep_time` until it is received.
+        """
+        no_estimate = self.block_time is None or self._last_block_received_at is None
+        if self._block_filter is not None or no_estimate:
+            return self.sleep_time
+
+        next_block_expected_in = self._last_block_received_at + self.block_time - time.monotonic()
+        max_poll_interval = self.block_time * self.max_poll_interval_fraction
+        return max(self.sleep_time, min(next_block_expected_in, max_poll_interval))
+
+    def _update_block_time(self, received_at: float, new_blocks: int) -> None:
+        """ Refines the block time estimate with the interval since the last
+        block was received.
+        """
+        if self.block_time is None or self._last_block_received_at is None:
+            return
+
+        observed_block_time = (received_at - self._last_block_received_at) / new_blocks
+        self.block_time += self.block_time_smoothing * (observed_block_time - self.block_time)
+
+    def _install_block_filter(self) -> Any:
+        """ Installs a block filter in the Ethereum client, `None` if it is not
+        supported, e.g. by load balanced providers.
+        """
+        try:
+            return self.chain.client.web3.eth.filter("latest")
+        except ValueError:
+            log.debug("Block filters are not supported, polling for the latest block")
+            return None
+
+    def _uninstall_block_filter(self) -> None:
+        block_filter, self._block_filter = self._block_filter, None
+        if block_filter is not None:
+            try:
+                self.chain.client.web3.eth.uninstallFilter(block_filter.filter_id)
+            except ValueError:
+                pass
+
+    def _poll_latest_block(self) -> Optional[Dict]:
+        """ Returns the latest block, `None` if the block filter reports no
+        new block.
+
+        Polling the block filter only transfers the hashes of the new blocks,
+        the latest block is fetched only once there is one.
+        """
+        if self._block_filter is not None:
+            try:
+                new_block_hashes = self._block_filter.get_new_entries()
+            except ValueError:
+                # The client drops the filters on restarts and after a period
+                # of inactivity, the full block is polled until it is replaced
+                log.debug("Block filter lost, reinstalling it")
+                self._block_filter = self._install_block_filter()
+            else:
+                if not new_block_hashes:
+                    return None
+
+        return self.chain.get_block(block_identifier="latest")
 
     def first_run(self, known_block_number):
         """ Blocking call to update the local state, if necessary. """
         assert self.callbacks, "callbacks not set"
+        self.block_time = self.chain.estimate_blocktime()
+        self._block_filter = self._install_block_filter()
         latest_block = self.chain.get_block(block_identifier="latest")
 
         log.debug(
@@ -240,6 +317,11 @@ class AlarmTask(Runnable):
                 old_block_hash=to_hex(latest_block["hash"]),
             )
         elif missed_blocks > 0:
+            # The callbacks may take a while, the block is received now
+            received_at = time.monotonic()
+            self._update_block_time(received_at, missed_blocks)
+            self._last_block_received_at = received_at
+
             log_details = dict(
                 known_block_number=self.known_block_number,
                 latest_block_number=latest_block_number,
@@ -0,0 +1,103 @@
+""" Benchmark the binary encoding of the protocol messages.
+
+Times packing, unpacking, signing, sender recovery and the repeated hashing
+done by the retry queues and logs, for every message type.
+"""
+import argparse
+import cProfile
+import pstats
+import timeit
+
+from raiden.constants import EMPTY_MERKLE_ROOT, PROTOCOL_VERSION
+from raiden.messages import (
+    Delivered,
+    LockExpired,
+    Ping,
+    Processed,
+    RevealSecret,
+    SecretRequest,
+    Unlock,
+    decode,
+)
+from raiden.tests.utils import factories
+from raiden.tests.utils.factories import UNIT_CHAIN_ID, UNIT_SECRETHASH
+from raiden.tests.utils.messages import make_mediated_transfer, make_refund_transfer
+from raiden.utils.signer import LocalSigner
+
+
+def make_messages():
+    envelope = dict(
+        chain_id=UNIT_CHAIN_ID,
+        message_identifier=1,
+        nonce=1,
+        token_network_address=factories.make_address(),
+        channel_identifier=1,
+        transferred_amount=0,
+        locked_amount=0,
+        locksroot=EMPTY_MERKLE_ROOT,
+    )
+
+    return [
+        Processed(message_identifier=1),
+        Delivered(delivered_message_identifier=1),
+        Ping(nonce=1, current_protocol_version=PROTOCOL_VERSION),
+        SecretRequest(
+            message_identifier=1,
+            payment_identifier=1,
+            secrethash=UNIT_SECRETHASH,
+            amount=1,
+            expiration=10,
+        ),
+        RevealSecret(message_identifier=1, secret=factories.make_secret()),
+        Unlock(payment_identifier=1, secret=factories.make_secret(), **envelope),
+        LockExpired(recipient=factories.make_address(), secrethash=UNIT_SECRETHASH, **envelope),
+        make_mediated_transfer(),
+        make_refund_transfer(),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--profile", action="store_true", default=False)
+    args = parser.parse_args()
+
+    signer = LocalSigner(factories.make_privkey_address()[0])
+    messages = make_messages()
+    for message in messages:
+        message.sign(signer)
+
+    def hash_repeatedly(message):
+        for _ in range(10):
+            hash(message)
+            repr(message)
+
+    print(f"{'message':<16} {'pack':>8} {'unpack':>8} {'sign':>8} {'recover':>8} {'hash':>8}")
+    for message in messages:
+        data = message.encode()
+        benchmarks = (
+            lambda: message.packed(),
+            lambda: decode(data),
+            lambda: message.sign(signer),
+            lambda: decode(data).sender,
+            lambda: hash_repeatedly(decode(data)),
+        )
+        timings = [
+            timeit.timeit(function, number=args.number) / args.number * 1e6
+            for function in benchmarks
+        ]
+        print(
+            f"{type(message).__name__:<16} "
+            + " ".join(f"{timing:>6.1f}us" for timing in timings)
+        )
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        for message in messages:
+            data = message.encode()
+            profiler.runcall(lambda: [hash_repeatedly(decode(data)) for _ in range(args.number)])
+        pstats.Stats(profiler).strip_dirs().sort_stats("time").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
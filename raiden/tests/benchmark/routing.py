@@ -0,0 +1,112 @@
+""" Benchmark the internal routing on a large token network.
+
+Builds a scale-free token network graph and times `get_best_routes_internal`
+to random targets, with the distances computed for every payment and with
+the distances cached for the target.
+"""
+import argparse
+import cProfile
+import pstats
+import random
+import timeit
+
+import networkx
+
+from raiden.routing import get_best_routes_internal
+from raiden.tests.utils import factories
+from raiden.tests.utils.factories import UNIT_CHAIN_ID
+from raiden.transfer.state import ChainState, PaymentNetworkState, TokenNetworkState
+
+
+def make_chain_state(number_of_nodes: int, number_of_channels: int) -> ChainState:
+    chain_state = ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=1,
+        block_hash=factories.make_block_hash(),
+        our_address=factories.make_address(),
+        chain_id=UNIT_CHAIN_ID,
+    )
+    payment_network = PaymentNetworkState(factories.make_address(), [])
+    token_network = TokenNetworkState(factories.make_address(), factories.make_address())
+    payment_network.tokenidentifiers_to_tokennetworks[token_network.address] = token_network
+    payment_network.tokenaddresses_to_tokenidentifiers[
+        token_network.token_address
+    ] = token_network.address
+    chain_state.identifiers_to_paymentnetworks[payment_network.address] = payment_network
+
+    topology = networkx.barabasi_albert_graph(number_of_nodes, 2)
+    addresses = [factories.make_address() for _ in range(number_of_nodes)]
+    network_graph = token_network.network_graph
+    for channel_identifier, (node1, node2) in enumerate(topology.edges()):
+        network_graph.add_channel(channel_identifier, addresses[node1], addresses[node2])
+
+    for partner_address in random.sample(addresses, number_of_channels):
+        channel_state = factories.create(
+            factories.NettingChannelStateProperties(
+                our_state=factories.NettingChannelEndStateProperties(
+                    address=chain_state.our_address, balance=random.randint(0, 100)
+                ),
+                partner_state=factories.NettingChannelEndStateProperties(
+                    address=partner_address, balance=random.randint(0, 100)
+                ),
+                token_address=token_network.token_address,
+                payment_network_identifier=payment_network.address,
+                canonical_identifier=factories.make_canonical_identifier(
+                    token_network_address=token_network.address
+                ),
+            )
+        )
+
+        channel_identifier = channel_state.identifier
+        token_network.channelidentifiers_to_channels[channel_identifier] = channel_state
+        token_network.partneraddresses_to_channelidentifiers[partner_address].append(
+            channel_identifier
+        )
+        network_graph.add_channel(channel_identifier, chain_state.our_address, partner_address)
+
+    return chain_state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--payments", type=int, default=100)
+    parser.add_argument("--profile", action="store_true", default=False)
+    args = parser.parse_args()
+
+    chain_state = make_chain_state(args.nodes, args.channels)
+    payment_network = next(iter(chain_state.identifiers_to_paymentnetworks.values()))
+    token_network = next(iter(payment_network.tokenidentifiers_to_tokennetworks.values()))
+    network_graph = token_network.network_graph
+    print(f"Graph: {len(network_graph.network)} nodes, {len(network_graph.network.edges)} edges")
+
+    targets = random.sample(list(network_graph.network.nodes), args.payments)
+
+    def route(clear_cache: bool):
+        for target in targets:
+            if clear_cache:
+                network_graph._target_to_distances.clear()
+
+            get_best_routes_internal(
+                chain_state=chain_state,
+                token_network_id=token_network.address,
+                from_address=chain_state.our_address,
+                to_address=target,
+                amount=10,
+                previous_address=None,
+            )
+
+    route(clear_cache=True)
+    for name, clear_cache in (("uncached", True), ("cached", False)):
+        elapsed = timeit.timeit(lambda: route(clear_cache), number=1)
+        print(f"{name:<10} {elapsed / args.payments * 1000:.3f}ms per payment")
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(route, True)
+        pstats.Stats(profiler).strip_dirs().sort_stats("time").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
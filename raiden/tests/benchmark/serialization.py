@@ -0,0 +1,110 @@
+""" Benchmark the deserialization of a large ChainState snapshot.
+
+Compares the decoding with the type registry used by `from_dict_hook`
+against importing the class of every decoded object.
+"""
+import argparse
+import cProfile
+import json
+import pstats
+import random
+import timeit
+
+from raiden.storage.serialize import JSONSerializer, _import_type
+from raiden.tests.utils import factories
+from raiden.tests.utils.factories import UNIT_CHAIN_ID
+from raiden.transfer.state import (
+    ChainState,
+    HashTimeLockState,
+    PaymentNetworkState,
+    TokenNetworkState,
+)
+from raiden.utils import sha3
+
+
+def from_dict_hook_uncached(data):
+    type_ = data.get("_type", None)
+    if type_ is not None:
+        return _import_type(type_).from_dict(data)
+    return data
+
+
+def make_chain_state(number_of_channels: int, number_of_locks: int) -> ChainState:
+    chain_state = ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=1,
+        block_hash=factories.make_block_hash(),
+        our_address=factories.make_address(),
+        chain_id=UNIT_CHAIN_ID,
+    )
+    payment_network = PaymentNetworkState(factories.make_address(), [])
+    token_network = TokenNetworkState(factories.make_address(), factories.make_address())
+    payment_network.tokenidentifiers_to_tokennetworks[token_network.address] = token_network
+    payment_network.tokenaddresses_to_tokenidentifiers[
+        token_network.token_address
+    ] = token_network.address
+    chain_state.identifiers_to_paymentnetworks[payment_network.address] = payment_network
+
+    for _ in range(number_of_channels):
+        channel_state = factories.create(
+            factories.NettingChannelStateProperties(
+                our_state=factories.NettingChannelEndStateProperties(
+                    address=chain_state.our_address, merkletree_width=number_of_locks
+                ),
+                partner_state=factories.NettingChannelEndStateProperties(
+                    merkletree_width=number_of_locks
+                ),
+                token_address=token_network.token_address,
+                payment_network_identifier=payment_network.address,
+                canonical_identifier=factories.make_canonical_identifier(
+                    token_network_address=token_network.address
+                ),
+            )
+        )
+
+        for lock_number in range(number_of_locks):
+            secrethash = sha3(factories.make_secret(lock_number))
+            lock = HashTimeLockState(amount=1, expiration=100, secrethash=secrethash)
+            channel_state.partner_state.secrethashes_to_lockedlocks[secrethash] = lock
+
+        channel_identifier = channel_state.identifier
+        token_network.channelidentifiers_to_channels[channel_identifier] = channel_state
+        token_network.partneraddresses_to_channelidentifiers[
+            channel_state.partner_state.address
+        ].append(channel_identifier)
+
+    return chain_state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--locks", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--profile", action="store_true", default=False)
+    args = parser.parse_args()
+
+    chain_state = make_chain_state(args.channels, args.locks)
+    data = JSONSerializer.serialize(chain_state)
+    print(f"Snapshot size: {len(data)} bytes")
+
+    def deserialize_uncached():
+        return json.loads(data, object_hook=from_dict_hook_uncached)
+
+    def deserialize():
+        return JSONSerializer.deserialize(data)
+
+    assert deserialize_uncached() == deserialize() == chain_state
+
+    for name, function in (("import per object", deserialize_uncached), ("registry", deserialize)):
+        elapsed = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{name:<20} {elapsed:.3f}s")
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(deserialize)
+        pstats.Stats(profiler).strip_dirs().sort_stats("time").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
@@ -423,6 +423,8 @@ def test_matrix_message_retry(
     message = Processed(message_identifier=0)
     transport._raiden_service.sign(message)
     chain_state.queueids_to_queues[queueid] = [message]
+    # the queue is populated without the message index, it must be rebuilt
+    chain_state.messageids_to_queueids = None
     retry_queue.enqueue_global(message)
 
     gevent.sleep(1)
@@ -0,0 +1,76 @@
+from unittest.mock import Mock
+
+from raiden.tasks import AlarmTask
+
+
+def make_alarm_task(block_filter=None, block_time=15):
+    chain = Mock()
+    chain.estimate_blocktime.return_value = block_time
+    chain.get_block.return_value = {"number": 10, "hash": b"\x01" * 32, "gasLimit": 1}
+    if block_filter is None:
+        chain.client.web3.eth.filter.side_effect = ValueError("method not found")
+    else:
+        chain.client.web3.eth.filter.return_value = block_filter
+
+    alarm_task = AlarmTask(chain)
+    alarm_task.register_callback(Mock())
+    alarm_task.first_run(known_block_number=9)
+    return alarm_task
+
+
+def test_alarm_task_sleeps_until_the_next_block_is_expected():
+    alarm_task = make_alarm_task(block_time=15)
+    assert alarm_task.callbacks[0].call_count == 1
+
+    # The interval is capped, so that an early block is not detected late
+    assert alarm_task._next_poll_interval() == 15 * alarm_task.max_poll_interval_fraction
+
+    alarm_task._last_block_received_at -= 14
+    assert alarm_task.sleep_time <= alarm_task._next_poll_interval() <= 1
+
+    # Once the next block is overdue the task polls every `sleep_time`
+    alarm_task._last_block_received_at -= 60
+    assert alarm_task._next_poll_interval() == alarm_task.sleep_time
+
+
+def test_alarm_task_polls_the_block_filter_every_sleep_time():
+    alarm_task = make_alarm_task(block_filter=Mock(), block_time=15)
+    assert alarm_task._next_poll_interval() == alarm_task.sleep_time
+
+
+def test_alarm_task_reestimates_the_block_time():
+    alarm_task = make_alarm_task(block_time=15)
+
+    # Two blocks are received 10 seconds after the last one
+    alarm_task._last_block_received_at -= 10
+    alarm_task.chain.get_block.return_value = {"number": 12, "hash": b"\x02" * 32, "gasLimit": 1}
+    alarm_task._maybe_run_callbacks(alarm_task.chain.get_block.return_value)
+
+    assert alarm_task.known_block_number == 12
+    assert 13.9 <= alarm_task.block_time <= 14.1
+
+
+def test_alarm_task_polls_the_block_filter():
+    block_filter = Mock()
+    block_filter.get_new_entries.return_value = []
+    alarm_task = make_alarm_task(block_filter=block_filter)
+    chain = alarm_task.chain
+    chain.get_block.reset_mock()
+
+    assert alarm_task._poll_latest_block() is None
+    chain.get_block.assert_not_called()
+
+    block_filter.get_new_entries.return_value = [b"\x02" * 32]
+    assert alarm_task._poll_latest_block() == chain.get_block.return_value
+
+    # A lost filter is reinstalled, the latest block is polled meanwhile
+    block_filter.get_new_entries.side_effect = ValueError("filter not found")
+    chain.client.web3.eth.filter.side_effect = ValueError("method not found")
+    assert alarm_task._poll_latest_block() == chain.get_block.return_value
+    assert alarm_task._block_filter is None
+
+
+def test_alarm_task_polls_the_latest_block_without_block_filter():
+    alarm_task = make_alarm_task(block_filter=None)
+    assert alarm_task._block_filter is None
+    assert alarm_task._poll_latest_block() == alarm_task.chain.get_block.return_value
@@ -112,3 +112,17 @@ def test_refund_transfer_min_max(amount, payment_identifier, nonce, transferred_
     refund_transfer.sign(signer)
     assert refund_transfer.sender == ADDRESS
     assert decode(refund_transfer.encode()) == refund_transfer
+
+
+def test_encoding_is_memoized_until_the_message_changes():
+    ping = Ping(nonce=0, current_protocol_version=constants.PROTOCOL_VERSION)
+    ping.sign(signer)
+
+    data = ping.encode()
+    assert ping.encode() is data
+    assert ping.hash == sha3(data)
+
+    ping.nonce = 1
+    assert ping.encode() != data
+    assert ping.hash == sha3(ping.encode())
+    assert decode(ping.encode()).nonce == 1
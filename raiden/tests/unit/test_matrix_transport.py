@@ -1,9 +1,13 @@
+import base64
+import json
 import random
 from unittest.mock import Mock, create_autospec
 from urllib.parse import urlparse
 
+import gevent
 import pytest
 from eth_utils import decode_hex, encode_hex, to_canonical_address, to_normalized_address
+from gevent.event import Event
 from matrix_client.errors import MatrixRequestError
 from matrix_client.room import Room
 from matrix_client.user import User
@@ -11,15 +15,21 @@ from matrix_client.user import User
 import raiden.network.transport.matrix.client
 import raiden.network.transport.matrix.utils
 from raiden.exceptions import TransportError
+from raiden.messages import Delivered, Processed, _senders_cache
+from raiden.network.transport.matrix.transport import _RetryQueue, _SendScheduler
 from raiden.network.transport.matrix.utils import (
+    BINARY_FRAMING_PREFIX,
     join_global_room,
     login_or_register,
     make_client,
     make_room_alias,
+    pack_binary_frames,
     sort_servers_closest,
+    update_user_displayname,
+    validate_and_parse_message,
     validate_userid_signature,
 )
-from raiden.tests.utils.factories import make_signer
+from raiden.tests.utils.factories import make_address, make_signer
 from raiden.utils.signer import recover
 
 
@@ -110,41 +120,55 @@ def test_validate_userid_signature():
     assert validate_userid_signature(user) is None
     assert user.get_display_name.call_count == 1
 
-    # successfuly recover valid displayname
+    # successfuly recover valid displayname, it's set so it isn't fetched
     user.displayname = encode_hex(signer.sign(user.user_id.encode()))
     assert validate_userid_signature(user) == signer.address
-    assert user.get_display_name.call_count == 2
+    assert user.get_display_name.call_count == 1
+
+    # assert another call will cache the result
+    assert validate_userid_signature(user) == signer.address
+    assert user.get_display_name.call_count == 1
 
-    # assert another call will cache the result and avoid wasteful get_display_name call
+    # the known displayname is used for users without one, e.g. new User instances
+    valid_displayname = user.displayname
+    user.displayname = None
     assert validate_userid_signature(user) == signer.address
+    assert user.get_display_name.call_count == 1
+
+    # until it is changed by a membership event
+    update_user_displayname(user.user_id, None)
+    user.get_display_name.side_effect = MatrixRequestError(code=404)
+    assert validate_userid_signature(user) is None
     assert user.get_display_name.call_count == 2
 
+    # a failed request isn't cached
+    user.get_display_name.side_effect = lambda: valid_displayname
+    assert validate_userid_signature(user) == signer.address
+    assert user.get_display_name.call_count == 3
+
     # non-hex displayname should be gracefully handled
     user.displayname = "random gibberish"
     assert validate_userid_signature(user) is None
-    assert user.get_display_name.call_count == 3
 
     # valid signature but from another user should also return None
     user.displayname = encode_hex(make_signer().sign(user.user_id.encode()))
     assert validate_userid_signature(user) is None
-    assert user.get_display_name.call_count == 4
 
     # same address, but different user_id, even if valid, should be rejected
     # (prevent personification)
     user.displayname = encode_hex(signer.sign(user.user_id.encode()))
     user.user_id = f"@{to_normalized_address(signer.address)}.deadbeef:{server_name}"
     assert validate_userid_signature(user) is None
-    assert user.get_display_name.call_count == 5
 
     # but non-default but valid user_id should be accepted
     user.displayname = encode_hex(signer.sign(user.user_id.encode()))
     assert validate_userid_signature(user) == signer.address
-    assert user.get_display_name.call_count == 6
 
     # non-compliant user_id shouldn't even call get_display_name
     user.user_id = f"@my_user:{server_name}"
+    user.displayname = None
     assert validate_userid_signature(user) is None
-    assert user.get_display_name.call_count == 6
+    assert user.get_display_name.call_count == 3
 
 
 def test_sort_servers_closest(monkeypatch):
@@ -207,3 +231,143 @@ def test_make_room_alias():
     assert make_room_alias(1, "discovery") == "raiden_mainnet_discovery"
     assert make_room_alias(3, "0xdeadbeef", "0xabbacada") == "raiden_ropsten_0xdeadbeef_0xabbacada"
     assert make_room_alias(1337, "monitoring") == "raiden_1337_monitoring"
+
+
+def test_validate_and_parse_message_recovers_the_senders_of_the_batch():
+    signer = make_signer()
+    messages = [Processed(message_identifier=identifier) for identifier in range(5)]
+    for message in messages:
+        message.sign(signer)
+    forged = Processed(message_identifier=5)
+    forged.sign(make_signer())
+
+    batch = messages[:2] + [forged] + messages[2:]
+    data = "\n".join(json.dumps(message.to_dict()) for message in batch)
+    parsed = validate_and_parse_message(data, signer.address)
+
+    # The forged message is dropped, the others are kept in their original order
+    assert parsed == messages
+    for message in batch:
+        assert message.signature in _senders_cache
+    assert _senders_cache[forged.signature] != signer.address
+
+
+def test_validate_and_parse_message_binary_frames():
+    signer = make_signer()
+    messages = [Processed(message_identifier=identifier) for identifier in range(3)]
+    messages.append(Delivered(delivered_message_identifier=3))
+    for message in messages:
+        message.sign(signer)
+
+    data = pack_binary_frames(messages)
+    json_data = "\n".join(json.dumps(message.to_dict()) for message in messages)
+    assert len(data) < len(json_data)
+    assert validate_and_parse_message(data, signer.address) == messages
+
+    # messages from another signer are dropped, as with the JSON lines
+    assert validate_and_parse_message(data, make_signer().address) == []
+
+    # a truncated body keeps the complete messages before the truncated one
+    frames = base64.b64decode(data[len(BINARY_FRAMING_PREFIX) :])
+    truncated = BINARY_FRAMING_PREFIX + base64.b64encode(frames[:-1]).decode()
+    assert validate_and_parse_message(truncated, signer.address) == messages[:-1]
+
+    assert validate_and_parse_message(BINARY_FRAMING_PREFIX + "%%%", signer.address) == []
+
+
+def make_scheduled_transport(send_raw):
+    """ A transport mock with what the `_SendScheduler` uses of it. """
+    transport = Mock()
+    transport._stop_event = Event()
+    transport._config = {"retry_interval": 0.1}
+    transport._binary_framing_peers = set()
+    transport._raiden_service.address = make_address()
+    transport._send_raw = send_raw
+    return transport
+
+
+def make_message_data(text):
+    return _RetryQueue._MessageData(
+        queue_identifier=None, message=None, text=text, expiration_generator=iter(())
+    )
+
+
+def test_send_scheduler_coalesces_and_bounds_the_sends():
+    in_flight = list()
+    max_in_flight = list()
+    sent = dict()
+
+    def send_raw(receiver, text):
+        in_flight.append(receiver)
+        max_in_flight.append(len(in_flight))
+        gevent.sleep(0.01)
+        sent[receiver] = text
+        in_flight.remove(receiver)
+
+    scheduler = _SendScheduler(
+        make_scheduled_transport(send_raw), max_concurrent_sends=2, max_queued_messages=5
+    )
+
+    receivers = [make_address() for _ in range(4)]
+    first = make_message_data("first")
+    scheduler.enqueue(receivers[0], [first])
+    # a retry of a message still pending is coalesced with it
+    scheduler.enqueue(receivers[0], [first, make_message_data("second")])
+    for receiver in receivers[1:]:
+        scheduler.enqueue(receiver, [make_message_data("other")])
+
+    assert scheduler.queue_depth == 5
+    assert not scheduler._capacity_event.is_set()
+
+    scheduler.start()
+    with gevent.Timeout(5):
+        scheduler.wait_for_capacity()
+        while scheduler.queue_depth:
+            gevent.sleep(0.01)
+
+    assert sent[receivers[0]] == "first\nsecond"
+    assert len(sent) == 4
+    assert max(max_in_flight) == 2
+    assert scheduler.sent_requests == 4
+    assert scheduler.max_send_latency >= scheduler.average_send_latency > 0
+
+    with gevent.Timeout(5):
+        scheduler.stop()
+    assert scheduler.greenlet.successful()
+
+
+def test_send_scheduler_sends_the_batches_of_a_receiver_in_order():
+    sent = list()
+    release_first_send = Event()
+
+    def send_raw(receiver, text):
+        sent.append(text)
+        if text == "first":
+            release_first_send.wait()
+
+    scheduler = _SendScheduler(
+        make_scheduled_transport(send_raw), max_concurrent_sends=2, max_queued_messages=5
+    )
+
+    receiver = make_address()
+    scheduler.start()
+    scheduler.enqueue(receiver, [make_message_data("first")])
+    gevent.sleep(0.05)
+    assert sent == ["first"]
+
+    # While the first batch is in flight the next ones wait and coalesce, even with a free slot
+    scheduler.enqueue(receiver, [make_message_data("second")])
+    scheduler.enqueue(receiver, [make_message_data("third")])
+    gevent.sleep(0.05)
+    assert sent == ["first"]
+
+    release_first_send.set()
+    with gevent.Timeout(5):
+        while scheduler.queue_depth:
+            gevent.sleep(0.01)
+
+    assert sent == ["first", "second\nthird"]
+
+    with gevent.Timeout(5):
+        scheduler.stop()
+    assert scheduler.greenlet.successful()
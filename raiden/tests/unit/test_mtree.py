@@ -5,6 +5,8 @@ from raiden.exceptions import HashLengthNot32
 from raiden.transfer.merkle_tree import (
     MERKLEROOT,
     compute_layers,
+    compute_layers_with,
+    compute_layers_without,
     compute_merkleproof_for,
     merkleroot,
     validate_proof,
@@ -136,3 +138,30 @@ def test_many(tree_up_to=10):
 
         reversed_tree = MerkleTreeState(compute_layers(reversed(leaves)))
         assert root == merkleroot(reversed_tree)
+
+
+def test_compute_layers_with_and_without():
+    leaves = [sha3(str(value).encode()) for value in range(20)]
+    layers = compute_layers(leaves[:1])
+
+    for number_of_leaves, leaf in enumerate(leaves[1:], start=2):
+        layers = compute_layers_with(layers, leaf)
+        assert layers == compute_layers(leaves[:number_of_leaves])
+
+    assert compute_layers_with(layers, leaves[0]) is None
+
+    tree = MerkleTreeState(layers)
+    for value in leaves:
+        proof = compute_merkleproof_for(tree, value)
+        assert validate_proof(proof, merkleroot(tree), value)
+
+    remaining = list(leaves)
+    for leaf in leaves[::2] + leaves[1:-1:2][::-1]:
+        remaining.remove(leaf)
+        layers = compute_layers_without(layers, leaf)
+        assert layers == compute_layers(remaining)
+
+    assert compute_layers_without(layers, leaves[0]) is None
+
+    with pytest.raises(IndexError):
+        compute_merkleproof_for(MerkleTreeState(layers), leaves[0])
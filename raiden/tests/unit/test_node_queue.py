@@ -3,7 +3,9 @@ import random
 from raiden.constants import EMPTY_HASH
 from raiden.tests.utils import factories
 from raiden.tests.utils.messages import make_mediated_transfer
-from raiden.transfer import node, state, state_change
+from raiden.transfer import node, state, state_change, views
+from raiden.transfer.architecture import ContractSendExpirableEvent
+from raiden.transfer.events import ContractSendChannelClose, ContractSendSecretReveal
 from raiden.transfer.identifiers import QueueIdentifier
 from raiden.transfer.mediated_transfer import events
 
@@ -37,6 +39,8 @@ def test_delivered_message_must_clean_unordered_messages(chain_id):
     )
 
     chain_state.queueids_to_queues[queue_identifier] = [first_message, second_message]
+    # the queue is populated without the message index, it must be rebuilt
+    chain_state.messageids_to_queueids = None
 
     delivered_message = state_change.ReceiveDelivered(recipient, message_identifier)
 
@@ -115,3 +119,104 @@ def test_channel_closed_must_clear_ordered_messages(
 
     iteration = node.handle_state_change(chain_state, closed)
     assert queue_identifier not in iteration.new_state.queueids_to_queues
+
+
+def test_processed_message_cleanup_uses_the_message_index(chain_id):
+    chain_state = state.ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=10,
+        block_hash=factories.make_block_hash(),
+        our_address=factories.make_address(),
+        chain_id=chain_id,
+    )
+    recipient = factories.make_address()
+    secret = factories.random_secret()
+
+    messages = [
+        events.SendSecretReveal(recipient, channel_identifier, message_identifier, secret)
+        for channel_identifier in (events.CHANNEL_IDENTIFIER_GLOBAL_QUEUE, 1)
+        for message_identifier in (1, 2, 3)
+    ]
+    for message in messages:
+        node.index_queued_message(chain_state, message)
+
+    global_queue = QueueIdentifier(recipient, events.CHANNEL_IDENTIFIER_GLOBAL_QUEUE)
+    channel_queue = QueueIdentifier(recipient, 1)
+    assert chain_state.messageids_to_queueids[(recipient, 2)] == {global_queue, channel_queue}
+
+    processed = state_change.ReceiveProcessed(recipient, 2)
+    iteration = node.state_transition_structural_sharing(chain_state, processed)
+    new_state = iteration.new_state
+
+    def queued_identifiers(queueid):
+        return [message.message_identifier for message in new_state.queueids_to_queues[queueid]]
+
+    assert (recipient, 2) not in new_state.messageids_to_queueids
+    assert queued_identifiers(global_queue) == [1, 3]
+    assert queued_identifiers(channel_queue) == [1, 3]
+
+    # The previous state keeps its own index
+    assert chain_state.messageids_to_queueids[(recipient, 2)] == {global_queue, channel_queue}
+
+    # Queues populated without the index, e.g. restored from a snapshot, are indexed on demand
+    new_state.queueids_to_queues[channel_queue].append(messages[4])
+    new_state.messageids_to_queueids = None
+    assert views.get_messageids_to_queueids(new_state)[(recipient, 2)] == {channel_queue}
+
+    node.unindex_message_queue(new_state, channel_queue)
+    assert channel_queue not in new_state.queueids_to_queues
+    assert new_state.messageids_to_queueids[(recipient, 1)] == {global_queue}
+    assert (recipient, 2) not in new_state.messageids_to_queueids
+
+
+def test_contract_receive_clears_only_the_indexed_pending_transactions(chain_id):
+    chain_state = state.ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=10,
+        block_hash=factories.make_block_hash(),
+        our_address=factories.make_address(),
+        chain_id=chain_id,
+    )
+    closed_identifier = factories.make_canonical_identifier(channel_identifier=1)
+    open_identifier = factories.make_canonical_identifier(channel_identifier=2)
+
+    close_closed = ContractSendChannelClose(closed_identifier, None, factories.make_block_hash())
+    close_open = ContractSendChannelClose(open_identifier, None, factories.make_block_hash())
+    expired_reveal = ContractSendSecretReveal(
+        expiration=5, secret=factories.random_secret(), triggered_by_block_hash=EMPTY_HASH
+    )
+    pending_reveal = ContractSendSecretReveal(
+        expiration=20, secret=factories.random_secret(), triggered_by_block_hash=EMPTY_HASH
+    )
+    for transaction in (close_closed, expired_reveal, close_open, pending_reveal):
+        node.append_pending_transaction(chain_state, transaction)
+
+    assert chain_state.pending_transactions_min_expiration == 5
+
+    closed = state_change.ContractReceiveChannelClosed(
+        transaction_hash=EMPTY_HASH,
+        transaction_from=factories.make_address(),
+        canonical_identifier=closed_identifier,
+        block_number=10,
+        block_hash=factories.make_block_hash(),
+    )
+    node.clear_pending_transactions(chain_state, closed)
+
+    assert chain_state.pending_transactions == [close_open, pending_reveal]
+    assert chain_state.pending_transactions_min_expiration == 20
+
+    keys_to_pending_transactions = node.get_keys_to_pending_transactions(chain_state)
+    assert node.state_change_pending_transaction_key(closed) not in keys_to_pending_transactions
+    assert keys_to_pending_transactions[ContractSendExpirableEvent] == (pending_reveal,)
+
+    # Pending transactions restored without the index are indexed on demand
+    restored_state = state.ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=10,
+        block_hash=factories.make_block_hash(),
+        our_address=chain_state.our_address,
+        chain_id=chain_id,
+    )
+    restored_state.pending_transactions = [close_closed, close_open]
+    node.clear_pending_transactions(restored_state, closed)
+    assert restored_state.pending_transactions == [close_open]
@@ -13,6 +13,7 @@ from eth_utils import (
 )
 
 from raiden.exceptions import ServiceRequestFailed, ServiceRequestIOURejected
+from raiden.network import pathfinding
 from raiden.network.pathfinding import (
     MAX_PATHS_QUERY_ATTEMPTS,
     PFSError,
@@ -36,6 +37,12 @@ from raiden.utils.typing import Address, TokenNetworkAddress
 from raiden_contracts.utils.proofs import sign_one_to_n_iou
 
 
+@pytest.fixture(autouse=True)
+def clear_pathfinding_caches():
+    pathfinding.paths_cache.clear()
+    pathfinding.last_ious.clear()
+
+
 def assert_checksum_address_in_url(url):
     message = "URL does not contain properly encoded address."
     assert any(is_checksum_address(token) for token in url.split("/")), message
@@ -105,7 +112,7 @@ def get_best_routes_with_iou_request_mocked(
 
         return Mock(json=Mock(return_value=iou_json_data or {}), status_code=200)
 
-    with patch.object(requests, "get", side_effect=iou_side_effect) as patched:
+    with patch.object(requests.Session, "get", side_effect=iou_side_effect) as patched:
         best_routes = get_best_routes(
             chain_state=chain_state,
             token_network_id=token_network_state.address,
@@ -191,7 +198,7 @@ def test_routing_mocked_pfs_happy_path(happy_path_fixture, our_address):
     address1, address2, _ = addresses
     channel_state1, channel_state2 = channel_states
 
-    with patch.object(requests, "post", return_value=response) as patched:
+    with patch.object(requests.Session, "post", return_value=response) as patched:
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -233,7 +240,7 @@ def test_routing_mocked_pfs_happy_path_with_updated_iou(happy_path_fixture, our_
     )
     last_iou = copy(iou)
 
-    with patch.object(requests, "post", return_value=response) as patched:
+    with patch.object(requests.Session, "post", return_value=response) as patched:
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -275,7 +282,7 @@ def test_routing_mocked_pfs_request_error(chain_state, token_network_state, our_
         address3: NODE_NETWORK_REACHABLE,
     }
 
-    with patch.object(requests, "post", side_effect=requests.RequestException()):
+    with patch.object(requests.Session, "post", side_effect=requests.RequestException()):
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -315,7 +322,7 @@ def test_routing_mocked_pfs_bad_http_code(chain_state, token_network_state, our_
     response.configure_mock(status_code=400)
     response.json = Mock(return_value=json_data)
 
-    with patch.object(requests, "post", return_value=response):
+    with patch.object(requests.Session, "post", return_value=response):
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -347,7 +354,7 @@ def test_routing_mocked_pfs_invalid_json(chain_state, token_network_state, our_a
     response.configure_mock(status_code=200)
     response.json = Mock(side_effect=ValueError())
 
-    with patch.object(requests, "post", return_value=response):
+    with patch.object(requests.Session, "post", return_value=response):
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -379,7 +386,7 @@ def test_routing_mocked_pfs_invalid_json_structure(chain_state, token_network_st
     response.configure_mock(status_code=400)
     response.json = Mock(return_value={})
 
-    with patch.object(requests, "post", return_value=response):
+    with patch.object(requests.Session, "post", return_value=response):
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -425,7 +432,7 @@ def test_routing_mocked_pfs_unavailable_peer(chain_state, token_network_state, o
     response = Mock()
     response.configure_mock(status_code=200)
     response.json = Mock(return_value=json_data)
-    with patch.object(requests, "post", return_value=response):
+    with patch.object(requests.Session, "post", return_value=response):
         routes = get_best_routes_with_iou_request_mocked(
             chain_state=chain_state,
             token_network_state=token_network_state,
@@ -449,7 +456,7 @@ def test_get_and_update_iou():
     )
     # RequestExceptions should be reraised as ServiceRequestFailed
     with pytest.raises(ServiceRequestFailed):
-        with patch.object(requests, "get", side_effect=requests.RequestException):
+        with patch.object(requests.Session, "get", side_effect=requests.RequestException):
             get_last_iou(**request_args)
 
     # invalid JSON should raise a ServiceRequestFailed
@@ -457,13 +464,13 @@ def test_get_and_update_iou():
     response.configure_mock(status_code=200)
     response.json = Mock(side_effect=ValueError)
     with pytest.raises(ServiceRequestFailed):
-        with patch.object(requests, "get", return_value=response):
+        with patch.object(requests.Session, "get", return_value=response):
             get_last_iou(**request_args)
 
     response = Mock()
     response.configure_mock(status_code=200)
     response.json = Mock(return_value={"other_key": "other_value"})
-    with patch.object(requests, "get", return_value=response):
+    with patch.object(requests.Session, "get", return_value=response):
         iou = get_last_iou(**request_args)
     assert iou is None, "get_pfs_iou should return None if pfs returns no iou."
 
@@ -480,7 +487,7 @@ def test_get_and_update_iou():
         block_number=10,
     )
     response.json = Mock(return_value=dict(last_iou=last_iou))
-    with patch.object(requests, "get", return_value=response):
+    with patch.object(requests.Session, "get", return_value=response):
         iou = get_last_iou(**request_args)
     assert iou == last_iou
 
@@ -502,7 +509,7 @@ def test_get_pfs_iou():
     privkey = bytes([2] * 32)
     sender = to_checksum_address(privatekey_to_address(privkey))
     receiver = factories.make_checksum_address()
-    with patch("raiden.network.pathfinding.requests.get") as get_mock:
+    with patch.object(requests.Session, "get") as get_mock:
         # No previous IOU
         get_mock.return_value.json.return_value = {"last_iou": None}
         assert (
@@ -604,8 +611,8 @@ def assert_failed_pfs_request(
 
     path_mocks = [request_mock(*data) for data in zip(responses, status_codes)]
 
-    with patch.object(requests, "get", return_value=request_mock()) as get_iou:
-        with patch.object(requests, "post", side_effect=path_mocks) as post_paths:
+    with patch.object(requests.Session, "get", return_value=request_mock()) as get_iou:
+        with patch.object(requests.Session, "post", side_effect=path_mocks) as post_paths:
             if expected_success:
                 query_paths(**paths_args)
             else:
@@ -740,3 +747,72 @@ def test_query_paths_with_multiple_errors(query_paths_args):
     assert_failed_pfs_request(
         query_paths_args, different_recoverable_errors, exception_type=ServiceRequestIOURejected
     )
+
+
+def test_query_paths_reuses_accepted_iou(query_paths_args, valid_response_json):
+    responses = [request_mock(valid_response_json), request_mock(valid_response_json)]
+
+    with patch.object(requests.Session, "get", return_value=request_mock()) as get_iou:
+        with patch.object(requests.Session, "post", side_effect=responses) as post_paths:
+            query_paths(**query_paths_args)
+            query_paths(**query_paths_args)
+
+    assert get_iou.call_count == 1
+    first_iou = post_paths.call_args_list[0][1]["json"]["iou"]
+    second_iou = post_paths.call_args_list[1][1]["json"]["iou"]
+    assert second_iou["amount"] == first_iou["amount"] + query_paths_args["service_config"][
+        "pathfinding_max_fee"
+    ]
+
+    # a rejected IOU is fetched from the PFS again
+    responses = [
+        request_mock(dict(error_code=PFSError.BAD_IOU.value, errors="broken iou"), 400),
+        request_mock(valid_response_json),
+    ]
+    with patch.object(requests.Session, "get", return_value=request_mock()) as get_iou:
+        with patch.object(requests.Session, "post", side_effect=responses):
+            query_paths(**query_paths_args)
+
+    assert get_iou.call_count == 1
+
+
+def test_routing_pfs_paths_are_cached(happy_path_fixture, our_address):
+    addresses, chain_state, _, response, token_network_state = happy_path_fixture
+    address1, address2, _ = addresses
+
+    with patch.object(requests.Session, "post", return_value=response) as patched:
+        routes = get_best_routes_with_iou_request_mocked(
+            chain_state=chain_state,
+            token_network_state=token_network_state,
+            from_address=our_address,
+            to_address=address1,
+            amount=50,
+        )
+        assert patched.call_count == 1
+
+        # smaller amounts of the same bucket reuse the paths
+        cached_routes = get_best_routes(
+            chain_state=chain_state,
+            token_network_id=token_network_state.address,
+            from_address=our_address,
+            to_address=address1,
+            amount=40,
+            previous_address=None,
+            config=CONFIG,
+            privkey=PRIVKEY,
+        )
+        assert cached_routes == routes
+        assert patched.call_count == 1
+
+        pathfinding.invalidate_cached_paths(token_network_state.address)
+        get_best_routes(
+            chain_state=chain_state,
+            token_network_id=token_network_state.address,
+            from_address=our_address,
+            to_address=address1,
+            amount=40,
+            previous_address=None,
+            config=CONFIG,
+            privkey=PRIVKEY,
+        )
+        assert patched.call_count == 2
@@ -1,12 +1,23 @@
+import json
 import random
+from unittest.mock import patch
 
+import msgpack
 import pytest
 from eth_utils import to_canonical_address
 from networkx import Graph
 
-from raiden.storage.serialize import JSONSerializer
+from raiden.storage.serialize import (
+    BINARY_TYPE_KEY,
+    BinarySerializer,
+    JSONSerializer,
+    binary_to_json,
+    get_type,
+)
 from raiden.tests.utils import factories
-from raiden.transfer import state, state_change
+from raiden.tests.utils.transfer import make_receive_transfer_mediated
+from raiden.transfer import node, state, state_change
+from raiden.transfer.mediated_transfer.state_change import ActionInitTarget
 from raiden.transfer.merkle_tree import compute_layers
 from raiden.transfer.state import make_empty_merkle_tree
 from raiden.utils import serialization
@@ -78,6 +89,15 @@ def test_decode_with_unknown_type():
         assert str(m) == "raiden.tests.unit.test_serialization.NonExistentClass"
 
 
+def test_get_type_is_cached():
+    type_name = "raiden.transfer.state_change.Block"
+    assert get_type(type_name) is state_change.Block
+
+    with patch("raiden.storage.serialize._import_type") as import_type:
+        assert get_type(type_name) is state_change.Block
+        assert not import_type.called
+
+
 def test_serialization_networkx_graph():
     p1 = to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4C")
     p2 = to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4D")
@@ -93,6 +113,29 @@ def test_serialization_networkx_graph():
     assert graph.edges == restored_graph.edges
 
 
+def test_serialization_token_network_graph_state():
+    p1 = to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4C")
+    p2 = to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4D")
+    p3 = to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4E")
+
+    graph_state = state.TokenNetworkGraphState(factories.make_address())
+    graph_state.network.add_edges_from([(p1, p2), (p2, p3)])
+    graph_state.channel_identifier_to_participants = {1: (p1, p2), 2: (p2, p3)}
+
+    data = graph_state.to_dict()
+    assert "network" not in data, "the graph must not be part of the snapshot"
+
+    restored = state.TokenNetworkGraphState.from_dict(data)
+    assert restored == graph_state
+    assert sorted(map(sorted, restored.network.edges)) == sorted(
+        map(sorted, graph_state.network.edges)
+    )
+
+    # snapshots of older versions contain the serialized graph
+    data["network"] = serialization.serialize_networkx_graph(graph_state.network)
+    assert state.TokenNetworkGraphState.from_dict(data) == graph_state
+
+
 def test_serialization_participants_tuple():
     participants = (
         to_canonical_address("0x5522070585a1a275631ba69c444ac0451AA9Fe4C"),
@@ -127,6 +170,24 @@ def test_serialization_merkletree_layers_empty():
     assert tree.layers == restored
 
 
+def test_serialization_merkletree_computes_layers_lazily():
+    leaves = [bytes([value]) * 32 for value in range(5)]
+    tree = state.MerkleTreeState(compute_layers(leaves))
+
+    with patch("raiden.transfer.state.compute_layers", wraps=compute_layers) as compute:
+        restored = JSONSerializer.deserialize(JSONSerializer.serialize(tree))
+
+        assert restored == tree
+        assert compute.call_count == 0
+
+        assert restored.layers == tree.layers
+        assert restored.layers == tree.layers
+        assert compute.call_count == 1
+
+    empty = JSONSerializer.deserialize(JSONSerializer.serialize(make_empty_merkle_tree()))
+    assert empty.layers == make_empty_merkle_tree().layers
+
+
 def test_actioninitchain_restore():
     """ ActionInitChain *must* restore the previous pseudo random generator
     state.
@@ -179,3 +240,50 @@ def test_chainstate_restore():
     decoded_obj = JSONSerializer.deserialize(JSONSerializer.serialize(original_obj))
 
     assert original_obj == decoded_obj
+
+
+def test_binary_serialization(chain_state, netting_channel_state):
+    partner_privkey, partner_address = factories.make_privkey_address()
+    netting_channel_state.partner_state.address = partner_address
+
+    lock = state.HashTimeLockState(
+        amount=3, expiration=50, secrethash=factories.make_keccak_hash()
+    )
+    mediated_transfer = make_receive_transfer_mediated(
+        channel_state=netting_channel_state,
+        privkey=partner_privkey,
+        nonce=1,
+        transferred_amount=0,
+        lock=lock,
+    )
+    init_target = ActionInitTarget(
+        route=factories.route_from_channel(netting_channel_state), transfer=mediated_transfer
+    )
+    node.state_transition(chain_state, init_target)
+    assert chain_state.payment_mapping.secrethashes_to_task
+
+    for obj in (chain_state, init_target):
+        json_data = JSONSerializer.serialize(obj)
+        binary_data = BinarySerializer.serialize(obj)
+
+        assert len(binary_data) < len(json_data)
+        assert BinarySerializer.deserialize(binary_data) == obj
+        assert json.loads(binary_to_json(binary_data)) == json.loads(json_data)
+
+
+def test_binary_serialization_values():
+    original_obj = MockObject(
+        hex_data="0x0a0b",
+        uppercase_hex="0x0A0B",
+        address="0x5522070585a1a275631ba69c444ac0451AA9Fe4C",
+        big_number=2 ** 256,
+        int_keys={1: "one", 2: None},
+        embedded=[MockObject(amount=1)],
+    )
+    decoded_obj = BinarySerializer.deserialize(BinarySerializer.serialize(original_obj))
+    assert decoded_obj == JSONSerializer.deserialize(JSONSerializer.serialize(original_obj))
+    assert decoded_obj.int_keys == {"1": "one", "2": None}
+
+    unknown_tag = msgpack.packb({BINARY_TYPE_KEY: 2 ** 16}, use_bin_type=True)
+    with pytest.raises(TypeError):
+        BinarySerializer.deserialize(unknown_tag)
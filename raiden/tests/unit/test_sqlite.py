@@ -8,6 +8,7 @@ from raiden.messages import Lock
 from raiden.storage.serialize import JSONSerializer
 from raiden.storage.sqlite import SerializedSQLiteStorage, SQLiteStorage
 from raiden.tests.utils import factories
+from raiden.transfer.events import EventPaymentReceivedSuccess
 from raiden.transfer.mediated_transfer.events import (
     SendBalanceProof,
     SendLockedTransfer,
@@ -22,7 +23,7 @@ from raiden.transfer.mediated_transfer.state_change import (
     ReceiveTransferRefundCancelRoute,
 )
 from raiden.transfer.state import BalanceProofUnsignedState
-from raiden.transfer.state_change import ReceiveUnlock
+from raiden.transfer.state_change import Block, ReceiveUnlock
 from raiden.transfer.utils import (
     get_event_with_balance_proof_by_balance_hash,
     get_state_change_with_balance_proof_by_balance_hash,
@@ -391,3 +392,159 @@ def test_batch_query_event_records():
     for events_batch in events_batch_query:
         events.extend(events_batch)
     assert len(events) == 2
+
+
+def test_read_connections(tmpdir):
+    database_path = str(tmpdir / "read_connections.db")
+    storage = SQLiteStorage(database_path, read_connections=2)
+    assert storage.read_pool is not None
+
+    state_change_identifier = storage.write_state_change(
+        state_change=json.dumps({"_type": "raiden.transfer.state_change.Block"}),
+        log_time=datetime.utcnow().isoformat(timespec="milliseconds"),
+    )
+    event_data = json.dumps({"_type": "raiden.transfer.events.EventPaymentReceivedSuccess"})
+    log_time = datetime.utcnow().isoformat(timespec="milliseconds")
+    storage.write_events([(None, state_change_identifier, log_time, event_data)])
+
+    assert storage.get_events() == [event_data]
+    events = []
+    for events_batch in storage.batch_query_event_records(batch_size=1):
+        events.extend(events_batch)
+    assert [event.data for event in events] == [event_data]
+
+    # The readers only see committed data
+    storage.begin_transaction()
+    storage.write_events([(None, state_change_identifier, log_time, event_data)])
+    assert len(storage.get_events()) == 1
+    storage.commit_transaction()
+    assert len(storage.get_events()) == 2
+
+    storage.close()
+
+
+def test_json_lookups_use_indexes():
+    storage = SQLiteStorage(":memory:")
+    conn = storage.conn
+    queries = []
+
+    class Recording:
+        def __init__(self, wrapped):
+            self.wrapped = wrapped
+
+        def __getattr__(self, name):
+            return getattr(self.wrapped, name)
+
+        def execute(self, query, args=()):
+            queries.append((query, args))
+            return self.wrapped.execute(query, args)
+
+        def cursor(self):
+            return Recording(self.wrapped.cursor())
+
+    storage.conn = Recording(conn)
+    storage.get_latest_state_change_by_data_field(
+        {"balance_proof.locksroot": "0x01", "balance_proof.sender": "0x02"}
+    )
+    storage.get_latest_event_by_data_field(
+        {"balance_proof.balance_hash": "0x01", "recipient": "0x02"}
+    )
+    for _ in storage.batch_query_state_changes(
+        batch_size=1, filters=[("_type", "raiden.transfer.state_change.Block")]
+    ):
+        pass
+    storage.conn = conn
+
+    assert len(queries) == 3
+    for query, args in queries:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", args).fetchall()
+        assert any("USING INDEX" in row[-1] for row in plan), query
+
+
+def test_archive_history(tmpdir):
+    database_path = str(tmpdir / "archive.db")
+    archive_path = str(tmpdir / "archive_archive.db")
+    storage = SerializedSQLiteStorage(database_path, JSONSerializer, archive_path=archive_path)
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec="milliseconds")
+
+    def write_unlock():
+        unlock = ReceiveUnlock(
+            message_identifier=next(counter),
+            secret=sha3(factories.make_secret(next(counter))),
+            balance_proof=make_signed_balance_proof_from_counter(counter),
+        )
+        identifier = storage.write_state_change(unlock, timestamp)
+        event = EventPaymentReceivedSuccess(
+            payment_network_identifier=factories.make_address(),
+            token_network_identifier=factories.make_address(),
+            identifier=next(counter),
+            amount=next(counter),
+            initiator=factories.make_address(),
+        )
+        storage.write_events(identifier, [event], timestamp)
+        return unlock
+
+    open_channel_unlock = write_unlock()
+    settled_channel_unlock = write_unlock()
+    storage.write_state_snapshot(2, "old snapshot")
+    write_unlock()
+    snapshot_identifier = storage.write_state_change(
+        Block(block_number=1, gas_limit=1, block_hash=factories.make_block_hash()), timestamp
+    )
+    storage.write_state_snapshot(snapshot_identifier, "snapshot")
+
+    state_changes = storage.get_statechanges_by_identifier(0, "latest")
+    events = storage.get_events()
+    assert len(state_changes) == 4
+
+    keep_channels = [open_channel_unlock.balance_proof.canonical_identifier]
+    assert storage.archive_history(keep_channels) == 1
+
+    def count(table):
+        return storage.conn.execute(f"SELECT COUNT(1) FROM {table}").fetchone()[0]
+
+    # The last event's state change is kept to preserve the event identifiers
+    assert count("main.state_changes") == 3
+    assert count("archive.state_changes") == 1
+    assert count("archive.state_events") == 1
+    assert count("archive.state_snapshot") == 1
+    assert storage.get_snapshot_closest_to_state_change(2) == (2, "old snapshot")
+    assert storage.get_statechanges_by_identifier(0, "latest") == state_changes
+    assert storage.get_events() == events
+
+    state_change_record = get_state_change_with_balance_proof_by_balance_hash(
+        storage=storage,
+        canonical_identifier=open_channel_unlock.balance_proof.canonical_identifier,
+        sender=open_channel_unlock.balance_proof.sender,
+        balance_hash=open_channel_unlock.balance_proof.balance_hash,
+    )
+    assert state_change_record.data == open_channel_unlock
+
+    state_change_record = get_state_change_with_balance_proof_by_balance_hash(
+        storage=storage,
+        canonical_identifier=settled_channel_unlock.balance_proof.canonical_identifier,
+        sender=settled_channel_unlock.balance_proof.sender,
+        balance_hash=settled_channel_unlock.balance_proof.balance_hash,
+    )
+    assert state_change_record.data is None
+
+    new_unlock = write_unlock()
+    assert storage.get_events()[: len(events)] == events
+    assert len(storage.get_events()) == len(events) + 1
+    storage.close()
+
+    storage = SerializedSQLiteStorage(database_path, JSONSerializer, archive_path=archive_path)
+    assert storage.get_statechanges_by_identifier(0, "latest") == state_changes + [new_unlock]
+    assert storage.get_snapshot_closest_to_state_change("latest") == (4, "snapshot")
+    # The last event was written by a newer state change
+    assert storage.archive_history(keep_channels) == 1
+    assert count("archive.state_changes") == 2
+    assert storage.get_statechanges_by_identifier(0, "latest") == state_changes + [new_unlock]
+
+    # Merging the archive restores the whole history in the main database
+    storage.close()
+    storage = SerializedSQLiteStorage(database_path, JSONSerializer)
+    storage.merge_archive(archive_path)
+    assert storage.get_statechanges_by_identifier(0, "latest") == state_changes + [new_unlock]
+    assert len(storage.get_events()) == len(events) + 1
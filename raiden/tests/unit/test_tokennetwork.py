@@ -1,4 +1,5 @@
 import copy
+from unittest.mock import patch
 
 import pytest
 
@@ -6,12 +7,14 @@ from raiden.constants import EMPTY_MERKLE_ROOT
 from raiden.routing import get_best_routes
 from raiden.tests.utils import factories
 from raiden.tests.utils.transfer import make_receive_transfer_mediated
-from raiden.transfer import node, token_network, views
+from raiden.transfer import channel, node, token_network, views
+from raiden.transfer.events import ContractSendChannelSettle
 from raiden.transfer.mediated_transfer.state_change import ActionInitMediator, ActionInitTarget
 from raiden.transfer.state import (
     NODE_NETWORK_REACHABLE,
     NODE_NETWORK_UNREACHABLE,
     HashTimeLockState,
+    TokenNetworkGraphState,
     TokenNetworkState,
 )
 from raiden.transfer.state_change import (
@@ -758,7 +761,8 @@ def test_routing_issue2663(chain_state, token_network_state, our_address):
         config={},
         privkey=b"",
     )
-    assert routes2[0].node_address == address1
+    # the channel to 1 has not enough capacity, the route goes over 2 and 3
+    assert [route.node_address for route in routes2] == [address2]
 
     # test routing with node 2 offline
     chain_state.nodeaddresses_to_networkstates = {
@@ -789,7 +793,8 @@ def test_routing_issue2663(chain_state, token_network_state, our_address):
         config={},
         privkey=b"",
     )
-    assert routes2[0].node_address == address1
+    # the channel to 1 has not enough capacity, the route goes over 2 and 3
+    assert [route.node_address for route in routes2] == [address2]
 
     # test routing with node 3 offline
     # the routing doesn't care as node 3 is not directly connected
@@ -822,7 +827,8 @@ def test_routing_issue2663(chain_state, token_network_state, our_address):
         config={},
         privkey=b"",
     )
-    assert routes2[0].node_address == address1
+    # the channel to 1 has not enough capacity, the route goes over 2 and 3
+    assert [route.node_address for route in routes2] == [address2]
 
     # test routing with node 1 offline
     chain_state.nodeaddresses_to_networkstates = {
@@ -854,7 +860,8 @@ def test_routing_issue2663(chain_state, token_network_state, our_address):
         config={},
         privkey=b"",
     )
-    assert routes2[0].node_address == address1
+    # the channel to 1 has not enough capacity, the route goes over 2 and 3
+    assert [route.node_address for route in routes2] == [address2]
 
 
 def test_routing_priority(chain_state, token_network_state, our_address):
@@ -1029,3 +1036,112 @@ def test_routing_priority(chain_state, token_network_state, our_address):
     )
     assert routes[0].node_address == address2
     assert routes[1].node_address == address1
+
+
+def test_network_graph_distances_are_invalidated_on_topology_changes():
+    graph_state = TokenNetworkGraphState(factories.make_address())
+    address1, address2, address3, address4 = (factories.make_address() for _ in range(4))
+
+    graph_state.add_channel(1, address1, address2)
+    graph_state.add_channel(2, address2, address3)
+    assert graph_state.distances_to(address3, address4) == {
+        address3: 0,
+        address2: 1,
+        address1: 2,
+    }
+    assert graph_state.distances_to(address3, address2) == {address3: 0}
+    assert graph_state.distances_to(address4, address1) == {}
+
+    graph_state.add_channel(3, address1, address3)
+    assert graph_state.distances_to(address3, address4) == {
+        address3: 0,
+        address2: 1,
+        address1: 1,
+    }
+
+    graph_state.remove_channel(2)
+    graph_state.remove_channel(2)
+    assert graph_state.distances_to(address3, address4) == {
+        address3: 0,
+        address1: 1,
+        address2: 2,
+    }
+
+
+def test_block_is_dispatched_to_due_channels_only(token_network_state, our_address):
+    open_block_number = 10
+    close_block_number = 20
+    channel_states = [
+        factories.make_channel(
+            our_address=our_address,
+            our_balance=10,
+            partner_balance=10,
+            token_network_identifier=token_network_state.address,
+        )
+        for _ in range(3)
+    ]
+    closed_channel = channel_states[0]
+
+    for channel_state in channel_states:
+        token_network.state_transition(
+            token_network_state=token_network_state,
+            state_change=ContractReceiveChannelNew(
+                transaction_hash=factories.make_transaction_hash(),
+                channel_state=channel_state,
+                block_number=open_block_number,
+                block_hash=factories.make_block_hash(),
+            ),
+            block_number=open_block_number,
+            block_hash=factories.make_block_hash(),
+        )
+
+    token_network.state_transition(
+        token_network_state=token_network_state,
+        state_change=ContractReceiveChannelClosed(
+            transaction_hash=factories.make_transaction_hash(),
+            transaction_from=closed_channel.partner_state.address,
+            canonical_identifier=closed_channel.canonical_identifier,
+            block_number=close_block_number,
+            block_hash=factories.make_block_hash(),
+        ),
+        block_number=close_block_number,
+        block_hash=factories.make_block_hash(),
+    )
+
+    settlement_end = close_block_number + closed_channel.settle_timeout
+    deadlines = token_network_state.channelidentifiers_to_deadlines
+    assert deadlines == {
+        closed_channel.identifier: settlement_end + 1,
+        channel_states[1].identifier: None,
+        channel_states[2].identifier: None,
+    }
+
+    def dispatch_block(block_number):
+        block_hash = factories.make_block_hash()
+        state_change = Block(block_number=block_number, gas_limit=1, block_hash=block_hash)
+        with patch.object(channel, "state_transition", wraps=channel.state_transition) as patched:
+            iteration = token_network.handle_block(
+                token_network_state, state_change, block_number, block_hash
+            )
+        return iteration.events, patched.call_count
+
+    assert dispatch_block(settlement_end) == ([], 0)
+
+    events, visited_channels = dispatch_block(settlement_end + 1)
+    assert visited_channels == 1
+    assert len(events) == 1
+    assert isinstance(events[0], ContractSendChannelSettle)
+    assert deadlines[closed_channel.identifier] is None
+
+    assert dispatch_block(settlement_end + 2) == ([], 0)
+
+    # channels added without a state transition are scheduled on the next block
+    restored_channel = copy.deepcopy(closed_channel)
+    restored_channel.settle_transaction = None
+    channels = token_network_state.channelidentifiers_to_channels
+    channels[closed_channel.identifier] = restored_channel
+    del deadlines[closed_channel.identifier]
+    assert token_network.has_due_channels(token_network_state, settlement_end + 3)
+    events, visited_channels = dispatch_block(settlement_end + 3)
+    assert visited_channels == 1
+    assert isinstance(events[0], ContractSendChannelSettle)
@@ -4,9 +4,18 @@ from pathlib import Path
 from unittest.mock import ANY, Mock, patch
 
 import raiden.utils.upgrades
-from raiden.storage.sqlite import SQLiteStorage
+from raiden.storage.serialize import BinarySerializer, JSONSerializer
+from raiden.storage.sqlite import SerializedSQLiteStorage, SQLiteStorage
+from raiden.tests.utils import factories
 from raiden.tests.utils.migrations import create_fake_web3_for_block_hash
-from raiden.utils.upgrades import VERSION_RE, UpgradeManager, UpgradeRecord, get_db_version
+from raiden.transfer.state_change import Block
+from raiden.utils.upgrades import (
+    VERSION_RE,
+    UpgradeManager,
+    UpgradeRecord,
+    convert_snapshots_to_json,
+    get_db_version,
+)
 
 
 def test_version_regex():
@@ -161,3 +170,21 @@ def test_sequential_version_numbers(tmp_path, monkeypatch):
         )
 
         assert get_db_version(db_path) == 19
+
+
+def test_convert_snapshots_to_json():
+    storage = SerializedSQLiteStorage(
+        ":memory:", serializer=JSONSerializer, snapshot_serializer=BinarySerializer
+    )
+    block = Block(block_number=1, gas_limit=1, block_hash=factories.make_block_hash())
+    state_change_identifier = storage.write_state_change(block, "2018-09-07T20:02:35.000")
+    storage.write_state_snapshot(state_change_identifier, block)
+
+    snapshot = storage.get_snapshots()[0]
+    assert isinstance(snapshot.data, bytes)
+
+    convert_snapshots_to_json(storage)
+
+    snapshot = storage.get_snapshots()[0]
+    assert json.loads(snapshot.data) == json.loads(JSONSerializer.serialize(block))
+    assert storage.get_latest_state_snapshot() == (state_change_identifier, block)
@@ -1,9 +1,13 @@
+from unittest.mock import Mock
+
 import pytest
-from eth_utils import decode_hex, to_canonical_address
+from eth_utils import decode_hex, to_canonical_address, to_checksum_address
 
 from raiden.constants import EMPTY_HASH
+from raiden.tests.utils.factories import make_address
 from raiden.tests.utils.mocks import MockWeb3
 from raiden.utils import block_specification_to_number, privatekey_to_publickey, sha3
+from raiden.utils.filters import StatelessFilter, get_new_entries_for_filters
 from raiden.utils.signer import LocalSigner, Signer, recover
 from raiden.utils.typing import BlockNumber
 
@@ -57,3 +61,44 @@ def test_block_speficiation_to_number():
 
     with pytest.raises(AssertionError):
         block_specification_to_number([1, 2], web3)
+
+
+def test_get_new_entries_for_filters():
+    web3 = MockWeb3(1)
+    registry_address = to_checksum_address(make_address())
+    token_network_address = to_checksum_address(make_address())
+    created_topic = "0x" + "11" * 32
+
+    registry_filter = StatelessFilter(
+        web3,
+        {
+            "fromBlock": 0,
+            "toBlock": "latest",
+            "address": registry_address,
+            "topics": [created_topic],
+        },
+    )
+    token_network_filter = StatelessFilter(
+        web3,
+        {"fromBlock": 0, "toBlock": "latest", "address": token_network_address, "topics": None},
+    )
+
+    logs = [
+        {"address": token_network_address, "topics": [decode_hex("0x" + "22" * 32)]},
+        {"address": registry_address, "topics": [decode_hex(created_topic)]},
+        {"address": registry_address, "topics": [decode_hex("0x" + "33" * 32)]},
+    ]
+    web3.eth.getLogs = Mock(return_value=logs)
+
+    filters = [registry_filter, token_network_filter]
+    assert get_new_entries_for_filters(filters, BlockNumber(10)) == [[logs[1]], [logs[0]]]
+
+    # A single query for both contracts, the topics are checked locally
+    web3.eth.getLogs.assert_called_once()
+    filter_params = web3.eth.getLogs.call_args[0][0]
+    assert set(filter_params["address"]) == {registry_address, token_network_address}
+    assert "topics" not in filter_params
+    assert registry_filter._last_block == token_network_filter._last_block == 10
+
+    assert get_new_entries_for_filters(filters, BlockNumber(10)) == [[], []]
+    web3.eth.getLogs.assert_called_once()
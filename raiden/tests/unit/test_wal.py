@@ -1,14 +1,15 @@
 import os
 import sqlite3
 
+import gevent
 import pytest
 
 from raiden.constants import RAIDEN_DB_VERSION
 from raiden.exceptions import InvalidDBData
-from raiden.storage.serialize import JSONSerializer
+from raiden.storage.serialize import BinarySerializer, JSONSerializer
 from raiden.storage.sqlite import SerializedSQLiteStorage
 from raiden.storage.utils import TimestampedEvent
-from raiden.storage.wal import WriteAheadLog, restore_to_state_change
+from raiden.storage.wal import SnapshotPolicy, WriteAheadLog, restore_to_state_change
 from raiden.tests.utils import factories
 from raiden.transfer.architecture import State, StateManager, TransitionResult
 from raiden.transfer.events import EventPaymentSentFailed
@@ -44,12 +45,12 @@ def state_transtion_acc(state, state_change):
     return TransitionResult(state, list())
 
 
-def new_wal(state_transition, state=None):
+def new_wal(state_transition, state=None, snapshot_policy=None):
     serializer = JSONSerializer
 
     state_manager = StateManager(state_transition, state)
     storage = SerializedSQLiteStorage(":memory:", serializer)
-    wal = WriteAheadLog(state_manager, storage)
+    wal = WriteAheadLog(state_manager, storage, snapshot_policy=snapshot_policy)
     return wal
 
 
@@ -228,3 +229,178 @@ def test_get_snapshot_closest_to_state_change():
 
     _, snapshot = wal.storage.get_snapshot_closest_to_state_change("latest")
     assert snapshot.state_changes == [block1, block2, block3]
+
+
+def test_wal_group_commit():
+    wal = new_wal(state_transtion_acc)
+    wal.group_commit_window = 0.05
+
+    commits = list()
+    commit_transaction = wal.storage.commit_transaction
+
+    def count_commits():
+        commits.append(len(wal.state_manager.current_state.state_changes))
+        commit_transaction()
+
+    wal.storage.commit_transaction = count_commits
+
+    def log_block(block_number):
+        block = Block(
+            block_number=block_number, gas_limit=1, block_hash=factories.make_transaction_hash()
+        )
+        wal.log_and_dispatch(block)
+        # the events must only be handled once the state change is durable
+        assert not wal.storage.in_transaction
+        return block_number
+
+    greenlets = [gevent.spawn(log_block, block_number) for block_number in range(1, 11)]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert commits == [10], "all state changes must be committed as a single group"
+
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0, to_identifier="latest"
+    )
+    assert [state_change.block_number for state_change in state_changes] == list(range(1, 11))
+
+    # once the group is committed a new one is started
+    log_block(11)
+    assert commits == [10, 11]
+
+
+def test_wal_group_commit_serial_caller():
+    wal = new_wal(state_transtion_acc)
+    wal.group_commit_window = 1
+
+    commits = list()
+    commit_transaction = wal.storage.commit_transaction
+
+    def count_commits():
+        commits.append(len(wal.state_manager.current_state.state_changes))
+        commit_transaction()
+
+    wal.storage.commit_transaction = count_commits
+
+    pending_commits = list()
+    for block_number in range(1, 6):
+        block = Block(
+            block_number=block_number, gas_limit=1, block_hash=factories.make_transaction_hash()
+        )
+        _, _, pending_commit = wal.log_and_dispatch_uncommitted(block)
+        pending_commits.append(pending_commit)
+
+    assert not commits, "the group must not be committed while the caller runs"
+    assert all(pending_commit is pending_commits[0] for pending_commit in pending_commits)
+
+    # The group is committed as soon as the caller yields, not after the window
+    with gevent.Timeout(0.5):
+        pending_commits[0].get()
+    assert commits == [5]
+
+
+def test_wal_group_commit_failure_rolls_back():
+    wal = new_wal(state_transtion_acc)
+    wal.group_commit_window = 0.05
+
+    def failing_commit():
+        raise sqlite3.OperationalError("disk I/O error")
+
+    wal.storage.commit_transaction = failing_commit
+
+    block = Block(block_number=1, gas_limit=1, block_hash=factories.make_transaction_hash())
+    with pytest.raises(sqlite3.OperationalError):
+        wal.log_and_dispatch(block)
+
+    assert not wal.storage.in_transaction
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0, to_identifier="latest"
+    )
+    assert state_changes == [], "the state change of the failed group must be rolled back"
+
+    # The in-memory state is ahead of the database, so no other state change
+    # may be logged
+    block = Block(block_number=2, gas_limit=1, block_hash=factories.make_transaction_hash())
+    with pytest.raises(RuntimeError):
+        wal.log_and_dispatch(block)
+
+
+def test_wal_snapshot_policy():
+    wal = new_wal(state_transtion_acc, snapshot_policy=SnapshotPolicy(state_changes_count=2))
+
+    def new_block(block_number):
+        return Block(
+            block_number=block_number, gas_limit=1, block_hash=factories.make_transaction_hash()
+        )
+
+    wal.log_and_dispatch(new_block(1))
+    assert wal.maybe_snapshot() is None
+
+    wal.log_and_dispatch(new_block(2))
+    snapshot_greenlet = wal.maybe_snapshot()
+    assert snapshot_greenlet is not None
+
+    # The snapshot is taken from the state at the time of the call
+    wal.log_and_dispatch(new_block(3))
+    assert wal.maybe_snapshot() is None
+    wal.wait_snapshot()
+    assert snapshot_greenlet.successful()
+    assert wal.snapshot_policy.pending_state_changes == 1
+
+    state_change_id, snapshot = wal.storage.get_latest_state_snapshot()
+    assert state_change_id == 2
+    assert [block.block_number for block in snapshot.state_changes] == [1, 2]
+
+    # The state changes replayed on a restore are accounted for
+    policy = SnapshotPolicy(state_changes_count=2)
+    restored_wal = restore_to_state_change(
+        transition_function=state_transtion_acc,
+        storage=wal.storage,
+        state_change_identifier="latest",
+        snapshot_policy=policy,
+    )
+    # the state change of the snapshot is replayed as well
+    assert policy.pending_state_changes == 2
+    restored_wal.log_and_dispatch(new_block(4))
+    assert restored_wal.maybe_snapshot() is not None
+    restored_wal.wait_snapshot()
+    assert restored_wal.storage.get_latest_state_snapshot()[0] == 4
+
+
+def test_snapshot_policy_triggers():
+    policy = SnapshotPolicy(state_changes_count=100, interval=None, max_replay_time=1.0)
+    assert not policy.should_snapshot()
+
+    policy.record(0.5)
+    assert not policy.should_snapshot()
+    policy.record(0.5)
+    assert policy.should_snapshot()
+
+    policy.reset()
+    assert not policy.should_snapshot()
+
+    policy = SnapshotPolicy(state_changes_count=100, interval=0)
+    assert not policy.should_snapshot(), "must not snapshot without new state changes"
+    policy.record(0)
+    assert policy.should_snapshot()
+
+
+def test_wal_snapshot_serializer():
+    wal = new_wal(state_transtion_acc)
+
+    block = Block(block_number=1, gas_limit=1, block_hash=factories.make_transaction_hash())
+    wal.log_and_dispatch(block)
+    wal.snapshot()
+    json_snapshot = wal.storage.get_latest_state_snapshot()
+
+    # Snapshots are read with the serializer they were written with, so the
+    # serializer can be changed for an existing database
+    wal.storage.snapshot_serializer = BinarySerializer
+    wal.snapshot()
+    assert isinstance(wal.storage.get_snapshots()[-1].data, bytes)
+
+    binary_snapshot = wal.storage.get_latest_state_snapshot()
+    assert binary_snapshot[1].state_changes == json_snapshot[1].state_changes == [block]
+
+    wal.storage.snapshot_serializer = JSONSerializer
+    wal.snapshot()
+    assert wal.storage.get_latest_state_snapshot()[1].state_changes == [block]
@@ -1,11 +1,34 @@
+from collections import defaultdict
+from copy import deepcopy
+from unittest.mock import patch
+
 from raiden.constants import EMPTY_MERKLE_ROOT
+from raiden.storage.serialize import JSONSerializer
+from raiden.tests.utils import factories
 from raiden.tests.utils.factories import HOP1, HOP2, UNIT_SECRETHASH, make_block_hash
+from raiden.tests.utils.transfer import make_receive_transfer_mediated
+from raiden.transfer import channel, views
+from raiden.transfer.architecture import StateManager
 from raiden.transfer.events import ContractSendChannelBatchUnlock
-from raiden.transfer.node import is_transaction_effect_satisfied, state_transition
+from raiden.transfer.mediated_transfer import target
+from raiden.transfer.mediated_transfer.events import EventUnlockClaimFailed
+from raiden.transfer.mediated_transfer.state_change import ActionInitTarget
+from raiden.transfer.node import (
+    CopyOnAccessDict,
+    is_transaction_effect_satisfied,
+    state_transition,
+    state_transition_structural_sharing,
+)
+from raiden.transfer.state import HashTimeLockState
 from raiden.transfer.state_change import (
+    ActionChangeNodeNetworkState,
+    Block,
     ContractReceiveChannelBatchUnlock,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelNew,
     ContractReceiveChannelSettled,
 )
+from raiden.utils import sha3
 
 
 def test_is_transaction_effect_satisfied(chain_state, token_network_id, netting_channel_state):
@@ -54,3 +77,187 @@ def test_is_transaction_effect_satisfied(chain_state, token_network_id, netting_
     iteration = state_transition(chain_state=chain_state, state_change=channel_settled)
 
     assert is_transaction_effect_satisfied(iteration.new_state, transaction, state_change)
+
+
+def test_state_transition_structural_sharing(chain_state, token_network_state):
+    """ The structural sharing transition must produce the same states as the
+    deep copying one, without modifying the previous state.
+    """
+    pkey, partner = factories.make_privkey_address()
+    channel_state = factories.create(
+        factories.NettingChannelStateProperties(
+            our_state=factories.NettingChannelEndStateProperties(
+                balance=10, address=chain_state.our_address
+            ),
+            partner_state=factories.NettingChannelEndStateProperties(balance=10, address=partner),
+            canonical_identifier=factories.make_canonical_identifier(
+                token_network_address=token_network_state.address
+            ),
+        )
+    )
+    other_channel_state = factories.create(
+        factories.NettingChannelStateProperties(
+            our_state=factories.NettingChannelEndStateProperties(address=chain_state.our_address),
+            canonical_identifier=factories.make_canonical_identifier(
+                token_network_address=token_network_state.address
+            ),
+        )
+    )
+
+    lock_secrethash = sha3(sha3(b"test_structural_sharing"))
+    lock = HashTimeLockState(amount=3, expiration=50, secrethash=lock_secrethash)
+    mediated_transfer = make_receive_transfer_mediated(
+        channel_state=channel_state, privkey=pkey, nonce=1, transferred_amount=0, lock=lock
+    )
+
+    state_changes = [
+        ContractReceiveChannelNew(
+            transaction_hash=factories.make_transaction_hash(),
+            channel_state=channel_state,
+            block_number=2,
+            block_hash=make_block_hash(),
+        ),
+        ContractReceiveChannelNew(
+            transaction_hash=factories.make_transaction_hash(),
+            channel_state=other_channel_state,
+            block_number=2,
+            block_hash=make_block_hash(),
+        ),
+        ActionInitTarget(
+            route=factories.route_from_channel(channel_state), transfer=mediated_transfer
+        ),
+        Block(block_number=3, gas_limit=1, block_hash=make_block_hash()),
+        ActionChangeNodeNetworkState(partner, "unreachable"),
+        ContractReceiveChannelClosed(
+            transaction_hash=factories.make_transaction_hash(),
+            transaction_from=partner,
+            canonical_identifier=channel_state.canonical_identifier,
+            block_number=4,
+            block_hash=make_block_hash(),
+        ),
+        Block(block_number=5, gas_limit=1, block_hash=make_block_hash()),
+    ]
+
+    deepcopy_manager = StateManager(state_transition, deepcopy(chain_state))
+    sharing_manager = StateManager(
+        state_transition_structural_sharing, deepcopy(chain_state), copy_state=False
+    )
+
+    for state_change in state_changes:
+        old_state = sharing_manager.current_state
+        old_state_copy = deepcopy(old_state)
+        # the snapshots serialize the previous state while the next state
+        # changes are dispatched
+        old_serialized_state = JSONSerializer.serialize(old_state)
+        old_token_network_state = views.get_token_network_by_identifier(
+            old_state, token_network_state.address
+        )
+        old_deadlines = dict(old_token_network_state.channelidentifiers_to_deadlines)
+        old_deadlines_queue = list(old_token_network_state.deadlines_queue)
+        old_task_deadlines = dict(old_state.payment_mapping.secrethashes_to_deadlines)
+        old_task_deadlines_queue = list(old_state.payment_mapping.deadlines_queue)
+
+        deepcopy_manager.dispatch(deepcopy(state_change))
+        new_state, _ = sharing_manager.dispatch(deepcopy(state_change))
+
+        assert old_state == old_state_copy, "the previous state must not be modified"
+        assert JSONSerializer.serialize(old_state) == old_serialized_state
+        assert old_token_network_state.channelidentifiers_to_deadlines == old_deadlines
+        assert old_token_network_state.deadlines_queue == old_deadlines_queue
+        assert old_state.payment_mapping.secrethashes_to_deadlines == old_task_deadlines
+        assert old_state.payment_mapping.deadlines_queue == old_task_deadlines_queue
+        assert new_state is sharing_manager.current_state
+        assert new_state == deepcopy_manager.current_state
+
+        touched_channels = sharing_manager.last_touched_channels
+        assert touched_channels is not None
+        changed_balance_proofs = list(
+            views.detect_balance_proof_change(old_state, new_state, touched_channels)
+        )
+        assert changed_balance_proofs == list(
+            views.detect_balance_proof_change(old_state, new_state)
+        )
+        if isinstance(state_change, ActionInitTarget):
+            assert touched_channels == {channel_state.canonical_identifier}
+            assert changed_balance_proofs == [mediated_transfer.balance_proof]
+
+    new_token_network_state = views.get_token_network_by_identifier(
+        new_state, token_network_state.address
+    )
+    assert type(new_token_network_state.channelidentifiers_to_channels) is dict
+    assert type(new_token_network_state.partneraddresses_to_channelidentifiers) is defaultdict
+
+
+def test_block_is_dispatched_to_due_payment_tasks(chain_state, token_network_state):
+    """ A Block must only be dispatched to the payment tasks which have
+    something to do, the deadlines index is rebuilt after a restore.
+    """
+    pkey, partner = factories.make_privkey_address()
+    channel_state = factories.create(
+        factories.NettingChannelStateProperties(
+            our_state=factories.NettingChannelEndStateProperties(address=chain_state.our_address),
+            partner_state=factories.NettingChannelEndStateProperties(balance=10, address=partner),
+            canonical_identifier=factories.make_canonical_identifier(
+                token_network_address=token_network_state.address
+            ),
+        )
+    )
+    lock_secrethash = sha3(sha3(b"test_due_payment_tasks"))
+    lock = HashTimeLockState(amount=3, expiration=50, secrethash=lock_secrethash)
+    mediated_transfer = make_receive_transfer_mediated(
+        channel_state=channel_state, privkey=pkey, nonce=1, transferred_amount=0, lock=lock
+    )
+
+    for state_change in (
+        ContractReceiveChannelNew(
+            transaction_hash=factories.make_transaction_hash(),
+            channel_state=channel_state,
+            block_number=2,
+            block_hash=make_block_hash(),
+        ),
+        ActionInitTarget(
+            route=factories.route_from_channel(channel_state), transfer=mediated_transfer
+        ),
+    ):
+        chain_state = state_transition(chain_state, state_change).new_state
+
+    lock_expiration_threshold = channel.get_receiver_expiration_threshold(lock)
+    deadlines = chain_state.payment_mapping.secrethashes_to_deadlines
+    assert deadlines == {lock_secrethash: lock_expiration_threshold}
+
+    def dispatch_block(chain_state, block_number):
+        state_change = Block(block_number=block_number, gas_limit=1, block_hash=make_block_hash())
+        with patch.object(target, "state_transition", wraps=target.state_transition) as patched:
+            iteration = state_transition(chain_state, state_change)
+        return iteration.events, patched.call_count
+
+    assert dispatch_block(chain_state, lock_expiration_threshold - 1) == ([], 0)
+
+    # tasks restored from a snapshot are scheduled on the next block
+    restored_state = JSONSerializer.deserialize(JSONSerializer.serialize(chain_state))
+    assert restored_state == chain_state
+    assert restored_state.payment_mapping.secrethashes_to_deadlines == {}
+
+    for state in (chain_state, restored_state):
+        events, visited_tasks = dispatch_block(state, lock_expiration_threshold)
+        assert visited_tasks == 1
+        assert any(isinstance(event, EventUnlockClaimFailed) for event in events)
+        assert state.payment_mapping.secrethashes_to_deadlines == {lock_secrethash: None}
+
+        assert dispatch_block(state, lock_expiration_threshold + 1) == ([], 0)
+
+
+def test_copy_on_access_dict():
+    shared = [1]
+    mapping = CopyOnAccessDict({"a": shared, "b": [2]}, list, list)
+
+    assert mapping.pop("a") == shared
+    assert mapping.pop("a", None) is None
+    assert shared == [1]
+
+    mapping["c"].append(3)
+    assert mapping.setdefault("d", [4]) == [4]
+    key, value = mapping.popitem()
+    assert (key, value) == ("d", [4])
+    assert mapping == {"b": [2], "c": [3]}
+    assert mapping.copied_keys == {"a", "c", "d"}
@@ -2,7 +2,7 @@
 from copy import deepcopy
 from typing import TYPE_CHECKING
 
-from raiden.transfer.identifiers import QueueIdentifier
+from raiden.transfer.identifiers import CanonicalIdentifier, QueueIdentifier
 from raiden.utils.typing import (
     Address,
     Any,
@@ -15,6 +15,7 @@ from raiden.utils.typing import (
     List,
     MessageID,
     Optional,
+    Set,
     T_BlockHash,
     T_BlockNumber,
     T_ChannelID,
@@ -248,24 +249,33 @@ class StateManager(Generic[ST]):
     state transitions by applying the StateChanges to the current State.
     """
 
-    __slots__ = ("state_transition", "current_state")
+    __slots__ = ("state_transition", "current_state", "copy_state", "last_touched_channels")
 
     def __init__(
         self,
         state_transition: Callable[[Optional[ST], StateChange], State],
         current_state: Optional[ST],
+        copy_state: bool = True,
     ) -> None:
         """ Initialize the state manager.
 
         Args:
             state_transition: function that can apply a StateChange message.
             current_state: current application state.
+            copy_state: If set the current state is deep copied before every
+                dispatch. Must only be disabled for transition functions which
+                never mutate their input state, e.g.
+                `node.state_transition_structural_sharing`.
         """
         if not callable(state_transition):
             raise ValueError("state_transition must be a callable")
 
         self.state_transition = state_transition
         self.current_state = current_state
+        self.copy_state = copy_state
+
+        # The channels touched by the last dispatch, `None` if unknown
+        self.last_touched_channels: Optional[Set[CanonicalIdentifier]] = None
 
     def dispatch(self, state_change: StateChange) -> Tuple[ST, List[Event]]:
         """ Apply the `state_change` in the current machine and return the
@@ -284,14 +294,23 @@ class StateManager(Generic[ST]):
 
         # the state objects must be treated as immutable, so make a copy of the
         # current state and pass the copy to the state machine to be modified.
-        next_state = deepcopy(self.current_state)
+        # Transition functions which do structural sharing copy only the
+        # subtrees they touch and leave the current state intact.
+        if self.copy_state:
+            next_state = deepcopy(self.current_state)
+        else:
+            next_state = self.current_state
 
         # update the current state by applying the change
         iteration = self.state_transition(next_state, state_change)
 
         assert isinstance(iteration, TransitionResult)
 
+        if not self.copy_state:
+            next_state = iteration.new_state
+
         self.current_state = iteration.new_state
+        self.last_touched_channels = iteration.touched_channels
         events = iteration.events
 
         assert isinstance(self.current_state, State)
@@ -315,13 +334,22 @@ class TransitionResult(Generic[ST]):  # pylint: disable=unsubscriptable-object
 
     When a task is completed the new_state is set to None, allowing the parent
     task to cleanup after the child.
+
+    `touched_channels` is the set of channels which may have been modified by
+    the transition, it is `None` if the transition function doesn't track it.
     """
 
-    __slots__ = ("new_state", "events")
+    __slots__ = ("new_state", "events", "touched_channels")
 
-    def __init__(self, new_state: Optional[ST], events: List[Event]) -> None:
+    def __init__(
+        self,
+        new_state: Optional[ST],
+        events: List[Event],
+        touched_channels: Optional[Set[CanonicalIdentifier]] = None,
+    ) -> None:
         self.new_state = new_state
         self.events = events
+        self.touched_channels = touched_channels
 
     def __eq__(self, other: Any) -> bool:
         return (
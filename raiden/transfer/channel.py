@@ -41,7 +41,12 @@ from raiden.transfer.mediated_transfer.state_change import (
     ReceiveLockExpired,
     ReceiveTransferRefund,
 )
-from raiden.transfer.merkle_tree import LEAVES, compute_layers, compute_merkleproof_for, merkleroot
+from raiden.transfer.merkle_tree import (
+    compute_layers_with,
+    compute_layers_without,
+    compute_merkleproof_for,
+    merkleroot,
+)
 from raiden.transfer.state import (
     CHANNEL_STATE_CLOSED,
     CHANNEL_STATE_CLOSING,
@@ -167,6 +172,29 @@ def is_deposit_confirmed(channel_state: NettingChannelState, block_number: Block
     )
 
 
+def get_block_deadline(channel_state: NettingChannelState) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the channel, or None if no block will.
+
+    Must be kept in sync with `handle_block`.
+    """
+    deadlines = list()
+
+    if get_status(channel_state) == CHANNEL_STATE_CLOSED:
+        closed_block_number = channel_state.close_transaction.finished_block_number
+        settlement_end = closed_block_number + channel_state.settle_timeout
+        deadlines.append(settlement_end + 1)
+
+    if channel_state.deposit_transaction_queue:
+        transaction_block_number = channel_state.deposit_transaction_queue[0].block_number
+        deadlines.append(transaction_block_number + DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS + 1)
+
+    if deadlines:
+        return BlockNumber(min(deadlines))
+
+    return None
+
+
 def is_lock_locked(end_state: NettingChannelEndState, secrethash: SecretHash) -> bool:
     """True if the `secrethash` is for a lock with an unknown secret."""
     return secrethash in end_state.secrethashes_to_lockedlocks
@@ -879,7 +907,7 @@ def get_batch_unlock(end_state: NettingChannelEndState,) -> Optional[MerkleTreeL
     network contract to verify the secret expiry and calculate the token amounts to transfer.
     """
 
-    if len(end_state.merkletree.layers[LEAVES]) == 0:  # pylint: disable=len-as-condition
+    if len(end_state.merkletree.leaves) == 0:  # pylint: disable=len-as-condition
         return None
 
     lockhashes_to_locks = dict()
@@ -900,7 +928,7 @@ def get_batch_unlock(end_state: NettingChannelEndState,) -> Optional[MerkleTreeL
     )
 
     ordered_locks = [
-        lockhashes_to_locks[LockHash(lockhash)] for lockhash in end_state.merkletree.layers[LEAVES]
+        lockhashes_to_locks[LockHash(lockhash)] for lockhash in end_state.merkletree.leaves
     ]
 
     # Not sure why the cast is needed here. The error was:
@@ -949,7 +977,7 @@ def get_next_nonce(end_state: NettingChannelEndState) -> Nonce:
 
 
 def _merkletree_width(merkletree: MerkleTreeState) -> int:
-    return len(merkletree.layers[LEAVES])
+    return len(merkletree.leaves)
 
 
 def get_number_of_pending_transfers(channel_end_state: NettingChannelEndState) -> int:
@@ -1054,11 +1082,9 @@ def compute_merkletree_with(
     # Use None to inform the caller the lockshash is already known
     result = None
 
-    leaves = merkletree.layers[LEAVES]
-    if lockhash not in leaves:
-        leaves = list(leaves)
-        leaves.append(Keccak256(lockhash))
-        result = MerkleTreeState(compute_layers(leaves))
+    layers = compute_layers_with(merkletree.layers, Keccak256(lockhash))
+    if layers is not None:
+        result = MerkleTreeState(layers)
 
     return result
 
@@ -1069,15 +1095,13 @@ def compute_merkletree_without(
     # Use None to inform the caller the lockhash is unknown
     result = None
 
-    leaves = merkletree.layers[LEAVES]
-    if lockhash in leaves:
-        leaves = list(leaves)
-        leaves.remove(Keccak256(lockhash))
-
-        if leaves:
-            result = MerkleTreeState(compute_layers(leaves))
-        else:
-            result = make_empty_merkle_tree()
+    leaves = merkletree.leaves
+    if len(leaves) == 1 and leaves[0] == lockhash:
+        result = make_empty_merkle_tree()
+    elif len(leaves) > 1:
+        layers = compute_layers_without(merkletree.layers, Keccak256(lockhash))
+        if layers is not None:
+            result = MerkleTreeState(layers)
 
     return result
 
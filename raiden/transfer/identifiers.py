@@ -120,3 +120,6 @@ class CanonicalIdentifier:
         if not isinstance(other, CanonicalIdentifier):
             return True
         return not self.__eq__(other)
+
+    def __hash__(self) -> int:
+        return hash((self.chain_identifier, self.token_network_address, self.channel_identifier))
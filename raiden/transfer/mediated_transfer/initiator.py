@@ -83,6 +83,28 @@ def events_for_unlock_lock(
     return [unlock_lock, payment_sent_success, unlock_success]
 
 
+def get_block_deadline(
+    initiator_state: InitiatorTransferState, channel_state: NettingChannelState
+) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the transfer, or None if no block will. A deadline in the past
+    means the next block.
+
+    Must be kept in sync with `handle_block`.
+    """
+    secrethash = initiator_state.transfer.lock.secrethash
+    locked_lock = channel_state.our_state.secrethashes_to_lockedlocks.get(secrethash)
+
+    if not locked_lock:
+        if channel_state.partner_state.secrethashes_to_lockedlocks.get(secrethash):
+            return None
+
+        # the transfer is finished, it is cleared by the next block
+        return BlockNumber(0)
+
+    return BlockNumber(locked_lock.expiration + DEFAULT_WAIT_BEFORE_LOCK_REMOVAL)
+
+
 def handle_block(
     initiator_state: InitiatorTransferState,
     state_change: Block,
@@ -175,6 +175,32 @@ def subdispatch_to_all_initiatortransfer(
     return TransitionResult(payment_state, events)
 
 
+def get_block_deadline(
+    payment_state: InitiatorPaymentState, channelidentifiers_to_channels: ChannelMap
+) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the payment, or None if no block will.
+    """
+    if not payment_state.initiator_transfers:
+        # cleared by `clear_if_finalized` on the next block
+        return BlockNumber(0)
+
+    deadlines = list()
+    for initiator_state in payment_state.initiator_transfers.values():
+        channel_state = channelidentifiers_to_channels.get(initiator_state.channel_identifier)
+        if not channel_state:
+            continue
+
+        deadline = initiator.get_block_deadline(initiator_state, channel_state)
+        if deadline is not None:
+            deadlines.append(deadline)
+
+    if deadlines:
+        return BlockNumber(min(deadlines))
+
+    return None
+
+
 def handle_block(
     payment_state: InitiatorPaymentState,
     state_change: Block,
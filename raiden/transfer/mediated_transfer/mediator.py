@@ -1120,6 +1120,58 @@ def handle_init(
     return TransitionResult(iteration.new_state, events)
 
 
+def get_block_deadline(
+    mediator_state: MediatorTransferState, channelidentifiers_to_channels: ChannelMap
+) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the mediated transfer, or None if no block will. A deadline in
+    the past means the next block.
+
+    Must be kept in sync with `handle_block`.
+    """
+    waiting_transfer = mediator_state.waiting_transfer
+    if waiting_transfer and waiting_transfer.state != "expired":
+        # `events_for_expired_pairs` expires it on the next block
+        return BlockNumber(0)
+
+    deadlines = list()
+    secrethash = mediator_state.secrethash
+
+    # `events_to_remove_expired_locks`
+    for pair in mediator_state.transfers_pair:
+        payee_channel = get_payee_channel(channelidentifiers_to_channels, pair)
+        if not payee_channel or channel.get_status(payee_channel) != CHANNEL_STATE_OPENED:
+            continue
+
+        our_state = payee_channel.our_state
+        lock = our_state.secrethashes_to_lockedlocks.get(secrethash)
+        if lock is None:
+            lock = our_state.secrethashes_to_unlockedlocks.get(secrethash)
+
+        if lock and secrethash not in our_state.secrethashes_to_onchain_unlockedlocks:
+            deadlines.append(channel.get_sender_expiration_threshold(lock))
+
+    # `events_for_onchain_secretreveal_if_dangerzone` and `events_for_expired_pairs`
+    for pair in get_pending_transfer_pairs(mediator_state.transfers_pair):
+        payer_channel = get_payer_channel(channelidentifiers_to_channels, pair)
+        if not payer_channel:
+            continue
+
+        lock = pair.payer_transfer.lock
+        secret_known = channel.is_secret_known(payer_channel.partner_state, lock.secrethash)
+        if secret_known and pair.payer_state != "payer_waiting_secret_reveal":
+            deadlines.append(BlockNumber(lock.expiration - payer_channel.reveal_timeout))
+
+        # an expired payer transfer is reported on every block while the pair is pending
+        if lock.secrethash not in payer_channel.our_state.secrethashes_to_onchain_unlockedlocks:
+            deadlines.append(channel.get_sender_expiration_threshold(lock))
+
+    if deadlines:
+        return BlockNumber(min(deadlines))
+
+    return None
+
+
 def handle_block(
     mediator_state: MediatorTransferState,
     state_change: Block,
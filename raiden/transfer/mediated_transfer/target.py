@@ -258,6 +258,36 @@ def handle_unlock(
     return TransitionResult(next_target_state, events)
 
 
+def get_block_deadline(
+    target_state: TargetTransferState, channel_state: NettingChannelState
+) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the transfer, or None if no block will.
+
+    Must be kept in sync with `handle_block`.
+    """
+    deadlines = list()
+    lock = target_state.transfer.lock
+
+    registered_onchain = (
+        lock.secrethash in channel_state.our_state.secrethashes_to_onchain_unlockedlocks
+    )
+    if not registered_onchain and target_state.state != TargetTransferState.EXPIRED:
+        deadlines.append(channel.get_receiver_expiration_threshold(lock))
+
+    secret_known_offchain = channel.is_secret_known_offchain(
+        channel_state.partner_state, lock.secrethash
+    )
+    has_onchain_reveal_started = target_state.state == TargetTransferState.ONCHAIN_SECRET_REVEAL
+    if secret_known_offchain and not has_onchain_reveal_started:
+        deadlines.append(BlockNumber(lock.expiration - channel_state.reveal_timeout))
+
+    if deadlines:
+        return BlockNumber(min(deadlines))
+
+    return None
+
+
 def handle_block(
     target_state: TargetTransferState,
     channel_state: NettingChannelState,
@@ -1,4 +1,5 @@
 # the layers grow from the leaves to the root
+from bisect import bisect_left
 from typing import TYPE_CHECKING
 
 from raiden.exceptions import HashLengthNot32
@@ -64,6 +65,85 @@ def compute_layers(elements: List[Keccak256]) -> List[List[Keccak256]]:
     return tree
 
 
+def _update_layers(
+    layers: List[List[Keccak256]], leaves: List[Keccak256], first_changed: int
+) -> List[List[Keccak256]]:
+    """ Computes the layers of the merkletree for `leaves`, where `layers` is
+    the tree before the change and `first_changed` the position of the first
+    leaf which differs.
+
+    Inserting or removing a leaf shifts every leaf on its right, so only the
+    nodes on the left of the change are reused. The leaves must be sorted.
+    """
+    tree = [leaves]
+
+    layer = leaves
+    depth = 0
+    changed = first_changed
+    while len(layer) > 1:
+        changed = changed // 2
+        depth += 1
+
+        # the nodes at the left of the change have the same children
+        if depth < len(layers):
+            next_layer = layers[depth][:changed]
+        else:
+            next_layer = []
+
+        paired_items = split_in_pairs(layer[changed * 2 :])
+        next_layer.extend(hash_pair(a, b) for a, b in paired_items)
+
+        tree.append(next_layer)
+        layer = next_layer
+
+    return tree
+
+
+def compute_layers_with(
+    layers: List[List[Keccak256]], element: Keccak256
+) -> Optional[List[List[Keccak256]]]:
+    """ Computes the layers of the merkletree `layers` with `element` added,
+    returns `None` if the element is already in the tree.
+    """
+    if not isinstance(element, bytes):
+        raise ValueError("all elements must be bytes")
+
+    if len(element) != 32:
+        raise HashLengthNot32()
+
+    leaves = layers[LEAVES]
+    position = bisect_left(leaves, element)
+    if position < len(leaves) and leaves[position] == element:
+        return None
+
+    if not leaves:
+        return [[element]]
+
+    new_leaves = list(leaves)
+    new_leaves.insert(position, element)
+    return _update_layers(layers, new_leaves, position)
+
+
+def compute_layers_without(
+    layers: List[List[Keccak256]], element: Keccak256
+) -> Optional[List[List[Keccak256]]]:
+    """ Computes the layers of the merkletree `layers` with `element` removed,
+    returns `None` if the element is not in the tree.
+
+    The tree must not become empty, use `make_empty_merkle_tree` instead.
+    """
+    leaves = layers[LEAVES]
+    position = bisect_left(leaves, element)
+    if position == len(leaves) or leaves[position] != element:
+        return None
+
+    assert len(leaves) > 1, "Use make_empty_merkle_tree if there are no elements"
+
+    new_leaves = list(leaves)
+    del new_leaves[position]
+    return _update_layers(layers, new_leaves, position)
+
+
 def compute_merkleproof_for(merkletree: "MerkleTreeState", element: Keccak256) -> List[Keccak256]:
     """ Containment proof for element.
 
@@ -73,7 +153,12 @@ def compute_merkleproof_for(merkletree: "MerkleTreeState", element: Keccak256) -
     Raises:
         IndexError: If the element is not part of the merkletree.
     """
-    idx = merkletree.layers[LEAVES].index(element)
+    leaves = merkletree.layers[LEAVES]
+
+    # the leaves are sorted
+    idx = bisect_left(leaves, element)
+    if idx == len(leaves) or leaves[idx] != element:
+        raise IndexError("element is not part of the merkletree")
 
     proof = []
     for layer in merkletree.layers:
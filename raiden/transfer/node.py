@@ -1,7 +1,13 @@
+from collections import defaultdict
+from copy import copy, deepcopy
+from functools import partial
+from heapq import heappop, heappush
+
 from raiden.transfer import channel, token_network, views
 from raiden.transfer.architecture import (
     ContractReceiveStateChange,
     ContractSendEvent,
+    ContractSendExpirableEvent,
     Event,
     SendMessageEvent,
     StateChange,
@@ -35,10 +41,14 @@ from raiden.transfer.mediated_transfer.state_change import (
 from raiden.transfer.state import (
     ChainState,
     InitiatorTask,
+    KeysToPendingTransactions,
     MediatorTask,
+    MessageIdsToQueueIds,
+    PaymentMappingState,
     PaymentNetworkState,
     TargetTask,
     TokenNetworkState,
+    TransferTask,
 )
 from raiden.transfer.state_change import (
     ActionChangeNodeNetworkState,
@@ -64,15 +74,21 @@ from raiden.transfer.state_change import (
     ReceiveProcessed,
     ReceiveUnlock,
 )
+from raiden.utils import sha3
 from raiden.utils.typing import (
     MYPY_ANNOTATION,
+    Any,
     BlockHash,
     BlockNumber,
+    Callable,
+    ChainID,
     ChannelID,
+    Dict,
     List,
     Optional,
     PaymentNetworkID,
     SecretHash,
+    Set,
     TokenAddress,
     TokenNetworkAddress,
     TokenNetworkID,
@@ -94,6 +110,231 @@ TokenNetworkStateChange = Union[
 ]
 
 
+class CopyOnAccessDict(dict):
+    """ A shallow copy of a mapping which copies its values on first access.
+
+    Used to do structural sharing between the state before and after a state
+    transition. Values are copied with `copy_value` the first time they are
+    read through the mapping, so any later in-place mutation done by the
+    transition functions does not leak into the previous state. Values which
+    are never accessed keep being shared with the previous state.
+
+    Missing keys are filled with `default_factory`, like a `defaultdict`, if
+    it is given.
+
+    Note:
+        Equality, `in`, `len` and key iteration don't copy values, iterating
+        over the keys is safe because the keys themselves are immutable.
+    """
+
+    __slots__ = ("copy_value", "copied_keys", "default_factory")
+
+    def __init__(
+        self,
+        mapping: Dict,
+        copy_value: Callable[[Any], Any],
+        default_factory: Callable[[], Any] = None,
+    ) -> None:
+        super().__init__(mapping)
+        self.copy_value = copy_value
+        self.copied_keys: set = set()
+        self.default_factory = default_factory
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        self[key] = self.default_factory()
+        return dict.__getitem__(self, key)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if key not in self.copied_keys:
+            value = self.copy_value(value)
+            dict.__setitem__(self, key, value)
+            self.copied_keys.add(key)
+        return value
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.copied_keys.add(key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        dict.__delitem__(self, key)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if key not in self.copied_keys:
+            value = self.copy_value(value)
+            self.copied_keys.add(key)
+        return key, value
+
+    def values(self):
+        return [self[key] for key in list(self.keys())]
+
+    def items(self):
+        return [(key, self[key]) for key in list(self.keys())]
+
+
+def _unshare(mapping: Dict, finalize_value: Callable[[Any], None] = None) -> Dict:
+    """ Converts a `CopyOnAccessDict` back to a plain dictionary, finalizing
+    the values which were copied during the state transition.
+    """
+    if not isinstance(mapping, CopyOnAccessDict):
+        return mapping
+
+    if mapping.default_factory is not None:
+        result: Dict = defaultdict(mapping.default_factory, mapping)
+    else:
+        result = dict(mapping)
+    if finalize_value is not None:
+        for key in mapping.copied_keys:
+            if key in result:
+                finalize_value(result[key])
+
+    return result
+
+
+def _copy_token_network(token_network_state: TokenNetworkState) -> TokenNetworkState:
+    token_network_copy = copy(token_network_state)
+
+    token_network_copy.channelidentifiers_to_channels = CopyOnAccessDict(
+        token_network_state.channelidentifiers_to_channels, deepcopy
+    )
+    token_network_copy.partneraddresses_to_channelidentifiers = CopyOnAccessDict(
+        token_network_state.partneraddresses_to_channelidentifiers, list, list
+    )
+    # copied by `token_network` before their first change
+    token_network_copy.deadlines_are_shared = True
+    token_network_copy.network_graph = copy(token_network_state.network_graph)
+    token_network_copy.network_graph.participants_are_shared = True
+
+    return token_network_copy
+
+
+def _copy_payment_network(payment_network_state: PaymentNetworkState) -> PaymentNetworkState:
+    payment_network_copy = copy(payment_network_state)
+
+    payment_network_copy.tokenidentifiers_to_tokennetworks = CopyOnAccessDict(
+        payment_network_state.tokenidentifiers_to_tokennetworks, _copy_token_network
+    )
+    payment_network_copy.tokenaddresses_to_tokenidentifiers = dict(
+        payment_network_state.tokenaddresses_to_tokenidentifiers
+    )
+
+    return payment_network_copy
+
+
+def _finalize_token_network(
+    token_network_state: TokenNetworkState,
+    chain_id: ChainID,
+    touched_channels: Set[CanonicalIdentifier],
+) -> None:
+    channels = token_network_state.channelidentifiers_to_channels
+
+    if isinstance(channels, CopyOnAccessDict):
+        touched_channels.update(
+            CanonicalIdentifier(
+                chain_identifier=chain_id,
+                token_network_address=token_network_state.address,
+                channel_identifier=channel_identifier,
+            )
+            for channel_identifier in channels.copied_keys
+            if channel_identifier in channels
+        )
+
+    token_network_state.channelidentifiers_to_channels = _unshare(channels)
+    token_network_state.partneraddresses_to_channelidentifiers = _unshare(
+        token_network_state.partneraddresses_to_channelidentifiers
+    )
+
+
+def _finalize_payment_network(
+    payment_network_state: PaymentNetworkState,
+    chain_id: ChainID,
+    touched_channels: Set[CanonicalIdentifier],
+) -> None:
+    payment_network_state.tokenidentifiers_to_tokennetworks = _unshare(
+        payment_network_state.tokenidentifiers_to_tokennetworks,
+        partial(_finalize_token_network, chain_id=chain_id, touched_channels=touched_channels),
+    )
+
+
+def copy_on_write(chain_state: ChainState, state_change: StateChange) -> ChainState:
+    """ Returns a copy of `chain_state` which shares every untouched subtree
+    with the original.
+
+    Only the root is copied eagerly, the nested payment networks, token
+    networks, channels, payment tasks and message queues are copied the first
+    time they are accessed. The result must be passed through
+    `finalize_copy_on_write` once the state transition is done.
+    """
+    chain_state_copy = copy(chain_state)
+
+    chain_state_copy.pseudo_random_generator = deepcopy(chain_state.pseudo_random_generator)
+    chain_state_copy.pending_transactions = list(chain_state.pending_transactions)
+    chain_state_copy.keys_to_pending_transactions = dict(chain_state.keys_to_pending_transactions)
+    chain_state_copy.tokennetworkaddresses_to_paymentnetworkaddresses = dict(
+        chain_state.tokennetworkaddresses_to_paymentnetworkaddresses
+    )
+    chain_state_copy.identifiers_to_paymentnetworks = CopyOnAccessDict(
+        chain_state.identifiers_to_paymentnetworks, _copy_payment_network
+    )
+    chain_state_copy.queueids_to_queues = CopyOnAccessDict(chain_state.queueids_to_queues, list)
+    chain_state_copy.messageids_are_shared = True
+
+    chain_state_copy.payment_mapping = copy(chain_state.payment_mapping)
+    chain_state_copy.payment_mapping.secrethashes_to_task = CopyOnAccessDict(
+        chain_state.payment_mapping.secrethashes_to_task, deepcopy
+    )
+    # copied by `_unshare_task_deadlines` before their first change
+    chain_state_copy.payment_mapping.deadlines_are_shared = True
+
+    if isinstance(state_change, ActionChangeNodeNetworkState):
+        chain_state_copy.nodeaddresses_to_networkstates = dict(
+            chain_state.nodeaddresses_to_networkstates
+        )
+
+    return chain_state_copy
+
+
+def finalize_copy_on_write(chain_state: ChainState) -> Set[CanonicalIdentifier]:
+    """ Replaces the copy-on-access mappings installed by `copy_on_write` with
+    plain dictionaries, so the resulting state can be used as usual.
+
+    Returns the canonical identifiers of the channels which were copied, and
+    therefore possibly modified, by the state transition.
+    """
+    touched_channels: Set[CanonicalIdentifier] = set()
+    chain_state.identifiers_to_paymentnetworks = _unshare(
+        chain_state.identifiers_to_paymentnetworks,
+        partial(
+            _finalize_payment_network,
+            chain_id=chain_state.chain_id,
+            touched_channels=touched_channels,
+        ),
+    )
+    chain_state.queueids_to_queues = _unshare(chain_state.queueids_to_queues)
+    chain_state.payment_mapping.secrethashes_to_task = _unshare(
+        chain_state.payment_mapping.secrethashes_to_task
+    )
+
+    return touched_channels
+
+
 def get_networks(
     chain_state: ChainState,
     payment_network_identifier: PaymentNetworkID,
@@ -139,24 +380,36 @@ def get_token_network_by_address(
     return token_network_state
 
 
-def subdispatch_to_all_channels(
-    chain_state: ChainState,
-    state_change: StateChange,
-    block_number: BlockNumber,
-    block_hash: BlockHash,
+def subdispatch_block_to_due_channels(
+    chain_state: ChainState, state_change: Block, block_number: BlockNumber, block_hash: BlockHash
 ) -> TransitionResult[ChainState]:
     events = list()
 
-    for payment_network in chain_state.identifiers_to_paymentnetworks.values():
-        for token_network_state in payment_network.tokenidentifiers_to_tokennetworks.values():
-            for channel_state in token_network_state.channelidentifiers_to_channels.values():
-                result = channel.state_transition(
-                    channel_state=channel_state,
-                    state_change=state_change,
-                    block_number=block_number,
-                    block_hash=block_hash,
-                )
-                events.extend(result.events)
+    # The token networks are looked up with `dict.get`, which does not copy
+    # them when the state is structurally shared, so only the token networks
+    # with due channels are copied
+    payment_networks = chain_state.identifiers_to_paymentnetworks
+    for payment_network_identifier in list(payment_networks.keys()):
+        token_networks = dict.get(
+            payment_networks, payment_network_identifier
+        ).tokenidentifiers_to_tokennetworks
+
+        for token_network_identifier in list(token_networks.keys()):
+            token_network_state = dict.get(token_networks, token_network_identifier)
+            if not token_network.has_due_channels(token_network_state, block_number):
+                continue
+
+            payment_network_state = payment_networks[payment_network_identifier]
+            token_network_state = payment_network_state.tokenidentifiers_to_tokennetworks[
+                token_network_identifier
+            ]
+            iteration = token_network.handle_block(
+                token_network_state=token_network_state,
+                state_change=state_change,
+                block_number=block_number,
+                block_hash=block_hash,
+            )
+            events.extend(iteration.events)
 
     return TransitionResult(chain_state, events)
 
@@ -183,12 +436,130 @@ def subdispatch_by_canonical_id(
     return TransitionResult(chain_state, events)
 
 
-def subdispatch_to_all_lockedtransfers(
-    chain_state: ChainState, state_change: StateChange
+def _unshare_task_deadlines(payment_mapping: PaymentMappingState) -> None:
+    """ Copies the deadlines index before its first change if it is shared
+    with the previous state by `copy_on_write`.
+    """
+    if payment_mapping.deadlines_are_shared:
+        payment_mapping.secrethashes_to_deadlines = dict(payment_mapping.secrethashes_to_deadlines)
+        payment_mapping.deadlines_queue = list(payment_mapping.deadlines_queue)
+        payment_mapping.deadlines_are_shared = False
+
+
+def get_paymenttask_deadline(
+    chain_state: ChainState, sub_task: TransferTask
+) -> Optional[BlockNumber]:
+    """ Returns the first block number at which a Block state change has an
+    effect on the task, or None if no block will.
+    """
+    deadline = None
+
+    if isinstance(sub_task, InitiatorTask):
+        token_network_state = get_token_network_by_address(
+            chain_state, sub_task.token_network_identifier
+        )
+        if token_network_state:
+            deadline = initiator_manager.get_block_deadline(
+                sub_task.manager_state, token_network_state.channelidentifiers_to_channels
+            )
+
+    elif isinstance(sub_task, MediatorTask):
+        token_network_state = get_token_network_by_address(
+            chain_state, sub_task.token_network_identifier
+        )
+        if token_network_state:
+            deadline = mediator.get_block_deadline(
+                sub_task.mediator_state, token_network_state.channelidentifiers_to_channels
+            )
+
+    elif isinstance(sub_task, TargetTask):
+        channel_state = views.get_channelstate_by_canonical_identifier(
+            chain_state=chain_state, canonical_identifier=sub_task.canonical_identifier
+        )
+        if channel_state:
+            deadline = target.get_block_deadline(sub_task.target_state, channel_state)
+
+    return deadline
+
+
+def schedule_paymenttask(chain_state: ChainState, secrethash: SecretHash) -> None:
+    """ Updates the block deadline of the task, must be called after any
+    change which may modify it. Removes the task from the index if it is gone.
+    """
+    payment_mapping = chain_state.payment_mapping
+    deadlines = payment_mapping.secrethashes_to_deadlines
+
+    # `dict.get` doesn't copy the task if it is structurally shared, the
+    # deadline is computed without modifying it
+    sub_task = dict.get(payment_mapping.secrethashes_to_task, secrethash)
+    if sub_task is None:
+        if secrethash in deadlines:
+            _unshare_task_deadlines(payment_mapping)
+            del payment_mapping.secrethashes_to_deadlines[secrethash]
+        return
+
+    deadline = get_paymenttask_deadline(chain_state, sub_task)
+    if secrethash not in deadlines or deadlines[secrethash] != deadline:
+        _unshare_task_deadlines(payment_mapping)
+        payment_mapping.secrethashes_to_deadlines[secrethash] = deadline
+
+        # Entries which don't match the deadline of the task are stale and
+        # skipped when popped
+        if deadline is not None:
+            heappush(payment_mapping.deadlines_queue, (deadline, secrethash))
+
+
+def _synchronize_task_deadlines(chain_state: ChainState) -> None:
+    """ Schedules the tasks which were added without going through the state
+    transitions, e.g. after a restore.
+    """
+    payment_mapping = chain_state.payment_mapping
+    _unshare_task_deadlines(payment_mapping)
+    tasks = payment_mapping.secrethashes_to_task
+    deadlines = payment_mapping.secrethashes_to_deadlines
+
+    for secrethash in deadlines.keys() - tasks.keys():
+        del deadlines[secrethash]
+
+    for secrethash in tasks.keys() - deadlines.keys():
+        schedule_paymenttask(chain_state, secrethash)
+
+
+def subdispatch_block_to_due_paymenttasks(
+    chain_state: ChainState, state_change: Block, block_number: BlockNumber
 ) -> TransitionResult[ChainState]:
-    events = list()
+    """ Dispatches the block to the payment tasks which have something due,
+    the other tasks are neither visited nor copied. Finished tasks are
+    cleared when their deadline fires.
+    """
+    events: List[Event] = list()
+    payment_mapping = chain_state.payment_mapping
+
+    if len(payment_mapping.secrethashes_to_deadlines) != len(
+        payment_mapping.secrethashes_to_task
+    ):
+        _synchronize_task_deadlines(chain_state)
+
+    queue = payment_mapping.deadlines_queue
+    if not queue or queue[0][0] > block_number:
+        return TransitionResult(chain_state, events)
+
+    _unshare_task_deadlines(payment_mapping)
+    tasks = payment_mapping.secrethashes_to_task
+    deadlines = payment_mapping.secrethashes_to_deadlines
+    queue = payment_mapping.deadlines_queue
 
-    for secrethash in list(chain_state.payment_mapping.secrethashes_to_task.keys()):
+    due_tasks = list()
+    while queue and queue[0][0] <= block_number:
+        deadline, secrethash = heappop(queue)
+
+        is_current = secrethash in tasks and deadlines.get(secrethash) == deadline
+        if is_current:
+            # the entry was popped, the task has to be scheduled again
+            del deadlines[secrethash]
+            due_tasks.append(secrethash)
+
+    for secrethash in due_tasks:
         result = subdispatch_to_paymenttask(chain_state, state_change, secrethash)
         events.extend(result.events)
 
@@ -277,6 +648,8 @@ def subdispatch_to_paymenttask(
                 if sub_iteration.new_state is None:
                     del chain_state.payment_mapping.secrethashes_to_task[secrethash]
 
+
+    schedule_paymenttask(chain_state, secrethash)
     return TransitionResult(chain_state, events)
 
 
@@ -322,6 +695,8 @@ def subdispatch_initiatortask(
             elif secrethash in chain_state.payment_mapping.secrethashes_to_task:
                 del chain_state.payment_mapping.secrethashes_to_task[secrethash]
 
+
+    schedule_paymenttask(chain_state, secrethash)
     return TransitionResult(chain_state, events)
 
 
@@ -369,6 +744,8 @@ def subdispatch_mediatortask(
             elif secrethash in chain_state.payment_mapping.secrethashes_to_task:
                 del chain_state.payment_mapping.secrethashes_to_task[secrethash]
 
+
+    schedule_paymenttask(chain_state, secrethash)
     return TransitionResult(chain_state, events)
 
 
@@ -423,6 +800,8 @@ def subdispatch_targettask(
         elif secrethash in chain_state.payment_mapping.secrethashes_to_task:
             del chain_state.payment_mapping.secrethashes_to_task[secrethash]
 
+
+    schedule_paymenttask(chain_state, secrethash)
     return TransitionResult(chain_state, events)
 
 
@@ -462,18 +841,77 @@ def sanity_check(iteration: TransitionResult[ChainState]) -> None:
     assert isinstance(iteration.new_state, ChainState)
 
 
+def _unshare_messageids_to_queueids(chain_state: ChainState) -> MessageIdsToQueueIds:
+    """ Returns the message index of `chain_state` to be changed, it is copied
+    first if it is shared with the previous state.
+    """
+    messageids_to_queueids = views.get_messageids_to_queueids(chain_state)
+
+    if chain_state.messageids_are_shared:
+        messageids_to_queueids = dict(messageids_to_queueids)
+        chain_state.messageids_to_queueids = messageids_to_queueids
+        chain_state.messageids_are_shared = False
+
+    return messageids_to_queueids
+
+
+def index_queued_message(chain_state: ChainState, message: SendMessageEvent) -> None:
+    """ Appends `message` to its queue and records it in the message index. """
+    queueid = message.queue_identifier
+    messageids_to_queueids = _unshare_messageids_to_queueids(chain_state)
+
+    queue = chain_state.queueids_to_queues.setdefault(queueid, [])
+    queue.append(message)
+
+    key = (queueid.recipient, message.message_identifier)
+    messageids_to_queueids[key] = messageids_to_queueids.get(key, frozenset()) | {queueid}
+
+
+def unindex_message_queue(chain_state: ChainState, queueid: QueueIdentifier) -> None:
+    """ Removes the queue `queueid` and its messages from the message index. """
+    # The index must be built before the queue is removed
+    views.get_messageids_to_queueids(chain_state)
+
+    queue = chain_state.queueids_to_queues.pop(queueid, None)
+    if not queue:
+        return
+
+    messageids_to_queueids = _unshare_messageids_to_queueids(chain_state)
+    for message in queue:
+        key = (queueid.recipient, message.message_identifier)
+        remaining_queueids = messageids_to_queueids.get(key, frozenset()) - {queueid}
+        if remaining_queueids:
+            messageids_to_queueids[key] = remaining_queueids
+        else:
+            messageids_to_queueids.pop(key, None)
+
+
 def inplace_delete_message_queue(
     chain_state: ChainState,
     state_change: Union[ReceiveDelivered, ReceiveProcessed],
     queueid: QueueIdentifier,
 ) -> None:
     """ Filter messages from queue, if the queue becomes empty, cleanup the queue itself. """
-    queue = chain_state.queueids_to_queues.get(queueid)
-    if not queue:
+    messageids_to_queueids = views.get_messageids_to_queueids(chain_state)
+    key = (state_change.sender, state_change.message_identifier)
+    queueids = messageids_to_queueids.get(key, frozenset())
+
+    # Only the queues holding the message are accessed, and therefore copied
+    if queueid not in queueids:
         return
 
+    queue = chain_state.queueids_to_queues[queueid]
+    queued_messages_count = len(queue)
     inplace_delete_message(message_queue=queue, state_change=state_change)
 
+    if len(queue) < queued_messages_count:
+        messageids_to_queueids = _unshare_messageids_to_queueids(chain_state)
+
+        if queueids == {queueid}:
+            del messageids_to_queueids[key]
+        else:
+            messageids_to_queueids[key] = queueids - {queueid}
+
     if len(queue) == 0:
         del chain_state.queueids_to_queues[queueid]
     else:
@@ -484,13 +922,12 @@ def inplace_delete_message(
     message_queue: List[SendMessageEvent], state_change: Union[ReceiveDelivered, ReceiveProcessed]
 ) -> None:
     """ Check if the message exists in queue with ID `queueid` and exclude if found."""
-    for message in list(message_queue):
-        message_found = (
-            message.message_identifier == state_change.message_identifier
-            and message.recipient == state_change.sender
-        )
-        if message_found:
-            message_queue.remove(message)
+    message_queue[:] = [
+        message
+        for message in message_queue
+        if message.message_identifier != state_change.message_identifier
+        or message.recipient != state_change.sender
+    ]
 
 
 def handle_block(chain_state: ChainState, state_change: Block) -> TransitionResult[ChainState]:
@@ -499,13 +936,15 @@ def handle_block(chain_state: ChainState, state_change: Block) -> TransitionResu
     chain_state.block_hash = state_change.block_hash
 
     # Subdispatch Block state change
-    channels_result = subdispatch_to_all_channels(
+    channels_result = subdispatch_block_to_due_channels(
         chain_state=chain_state,
         state_change=state_change,
         block_number=block_number,
         block_hash=chain_state.block_hash,
     )
-    transfers_result = subdispatch_to_all_lockedtransfers(chain_state, state_change)
+    transfers_result = subdispatch_block_to_due_paymenttasks(
+        chain_state=chain_state, state_change=state_change, block_number=block_number
+    )
     events = channels_result.events + transfers_result.events
     return TransitionResult(chain_state, events)
 
@@ -564,8 +1003,7 @@ def handle_contract_receive_channel_closed(
             recipient=channel_state.partner_state.address,
             channel_identifier=state_change.channel_identifier,
         )
-        if queue_id in chain_state.queueids_to_queues:
-            chain_state.queueids_to_queues.pop(queue_id)
+        unindex_message_queue(chain_state, queue_id)
 
     return handle_token_network_action(chain_state=chain_state, state_change=state_change)
 
@@ -735,8 +1173,10 @@ def handle_processed(
     chain_state: ChainState, state_change: ReceiveProcessed
 ) -> TransitionResult[ChainState]:
     events: List[Event] = list()
-    # Clean up message queue
-    for queueid in list(chain_state.queueids_to_queues.keys()):
+    # Clean up the message queues, only the ones holding the message are visited
+    messageids_to_queueids = views.get_messageids_to_queueids(chain_state)
+    key = (state_change.sender, state_change.message_identifier)
+    for queueid in messageids_to_queueids.get(key, frozenset()):
         inplace_delete_message_queue(chain_state, state_change, queueid)
 
     return TransitionResult(chain_state, events)
@@ -1082,25 +1522,160 @@ def is_transaction_pending(chain_state, transaction, state_change):
     )
 
 
+def pending_transaction_keys(transaction: ContractSendEvent) -> List[Any]:
+    """ Returns the keys under which `transaction` is indexed.
+
+    The first key is the one of the on-chain events which can satisfy or
+    invalidate the transaction, see `state_change_pending_transaction_key`.
+    Transactions which can expire are also indexed under
+    `ContractSendExpirableEvent`.
+    """
+    key: Any
+    if isinstance(transaction, ContractSendSecretReveal):
+        key = sha3(transaction.secret)
+    elif isinstance(transaction, ContractSendChannelBatchUnlock):
+        # A batch unlock of a channel which is gone satisfies every pending
+        # batch unlock, regardless of its channel
+        key = ContractSendChannelBatchUnlock
+    else:
+        key = (transaction.token_network_identifier, transaction.channel_identifier)
+
+    if isinstance(transaction, ContractSendExpirableEvent):
+        return [key, ContractSendExpirableEvent]
+
+    return [key]
+
+
+def state_change_pending_transaction_key(state_change: ContractReceiveStateChange) -> Any:
+    """ Returns the key of the pending transactions which `state_change` can
+    satisfy or invalidate, `None` if it can't clear any of them.
+    """
+    if isinstance(state_change, ContractReceiveSecretReveal):
+        return sha3(state_change.secret)
+
+    if isinstance(state_change, ContractReceiveChannelBatchUnlock):
+        return ContractSendChannelBatchUnlock
+
+    channel_state_changes = (
+        ContractReceiveChannelClosed,
+        ContractReceiveChannelSettled,
+        ContractReceiveUpdateTransfer,
+    )
+    if isinstance(state_change, channel_state_changes):
+        return (state_change.token_network_identifier, state_change.channel_identifier)
+
+    return None
+
+
+def _index_pending_transaction(chain_state: ChainState, transaction: ContractSendEvent) -> None:
+    keys_to_pending_transactions = chain_state.keys_to_pending_transactions
+    for key in pending_transaction_keys(transaction):
+        keys_to_pending_transactions[key] = keys_to_pending_transactions.get(key, ()) + (
+            transaction,
+        )
+
+    if isinstance(transaction, ContractSendExpirableEvent):
+        min_expiration = chain_state.pending_transactions_min_expiration
+        if min_expiration is None or transaction.expiration < min_expiration:
+            chain_state.pending_transactions_min_expiration = transaction.expiration
+
+    chain_state.pending_transactions_count += 1
+
+
+def get_keys_to_pending_transactions(chain_state: ChainState) -> KeysToPendingTransactions:
+    """ Returns the index of the pending transactions, see
+    `pending_transaction_keys`.
+
+    The index is kept up-to-date by `update_queues`. It is rebuilt here if the
+    pending transactions were populated without it, e.g. when the state is
+    restored from a snapshot.
+    """
+    if chain_state.pending_transactions_count != len(chain_state.pending_transactions):
+        chain_state.keys_to_pending_transactions = dict()
+        chain_state.pending_transactions_count = 0
+        chain_state.pending_transactions_min_expiration = None
+
+        for transaction in chain_state.pending_transactions:
+            _index_pending_transaction(chain_state, transaction)
+
+    return chain_state.keys_to_pending_transactions
+
+
+def append_pending_transaction(chain_state: ChainState, transaction: ContractSendEvent) -> None:
+    get_keys_to_pending_transactions(chain_state)
+    chain_state.pending_transactions.append(transaction)
+    _index_pending_transaction(chain_state, transaction)
+
+
+def clear_pending_transactions(
+    chain_state: ChainState, state_change: ContractReceiveStateChange
+) -> None:
+    """ Removes the pending transactions which are satisfied, invalidated or
+    expired after `state_change`.
+
+    Only the transactions indexed under the key of `state_change` are
+    evaluated, the transactions which can expire are evaluated only once the
+    current block is past the earliest expiration.
+    """
+    keys_to_pending_transactions = get_keys_to_pending_transactions(chain_state)
+
+    candidates = list(
+        keys_to_pending_transactions.get(state_change_pending_transaction_key(state_change), ())
+    )
+    min_expiration = chain_state.pending_transactions_min_expiration
+    check_expiration = min_expiration is not None and min_expiration < chain_state.block_number
+    if check_expiration:
+        candidates.extend(keys_to_pending_transactions.get(ContractSendExpirableEvent, ()))
+
+    cleared = {
+        id(transaction): transaction
+        for transaction in candidates
+        if not is_transaction_pending(chain_state, transaction, state_change)
+    }
+
+    if cleared:
+        chain_state.pending_transactions = [
+            transaction
+            for transaction in chain_state.pending_transactions
+            if id(transaction) not in cleared
+        ]
+        chain_state.pending_transactions_count = len(chain_state.pending_transactions)
+
+        for transaction in cleared.values():
+            for key in pending_transaction_keys(transaction):
+                remaining = tuple(
+                    pending
+                    for pending in keys_to_pending_transactions.get(key, ())
+                    if id(pending) not in cleared
+                )
+                if remaining:
+                    keys_to_pending_transactions[key] = remaining
+                else:
+                    keys_to_pending_transactions.pop(key, None)
+
+    if check_expiration:
+        chain_state.pending_transactions_min_expiration = min(
+            (
+                transaction.expiration
+                for transaction in keys_to_pending_transactions.get(ContractSendExpirableEvent, ())
+            ),
+            default=None,
+        )
+
+
 def update_queues(iteration: TransitionResult[ChainState], state_change: StateChange) -> None:
     chain_state = iteration.new_state
     assert chain_state is not None, "chain_state must be set"
 
     if isinstance(state_change, ContractReceiveStateChange):
-        pending_transactions = [
-            transaction
-            for transaction in chain_state.pending_transactions
-            if is_transaction_pending(chain_state, transaction, state_change)
-        ]
-        chain_state.pending_transactions = pending_transactions
+        clear_pending_transactions(chain_state, state_change)
 
     for event in iteration.events:
         if isinstance(event, SendMessageEvent):
-            queue = chain_state.queueids_to_queues.setdefault(event.queue_identifier, [])
-            queue.append(event)
+            index_queued_message(chain_state, event)
 
         if isinstance(event, ContractSendEvent):
-            chain_state.pending_transactions.append(event)
+            append_pending_transaction(chain_state, event)
 
 
 def state_transition(
@@ -1116,6 +1691,27 @@ def state_transition(
     return iteration
 
 
+def state_transition_structural_sharing(
+    chain_state: Optional[ChainState], state_change: StateChange
+) -> TransitionResult[ChainState]:
+    """ Same as `state_transition`, but `chain_state` is left untouched.
+
+    Instead of deep copying the whole state before the transition, only the
+    path from the root to the modified objects is copied, the rest of the
+    tree is shared between the old and the new state.
+    """
+    if chain_state is None:
+        return state_transition(chain_state, state_change)
+
+    next_state = copy_on_write(chain_state, state_change)
+    iteration = state_transition(next_state, state_change)
+
+    assert iteration.new_state is next_state, "The chain state must not be replaced"
+    iteration.touched_channels = finalize_copy_on_write(next_state)
+
+    return iteration
+
+
 def _get_channels_close_events(
     chain_state: ChainState, token_network_state: TokenNetworkState
 ) -> List[Event]:
@@ -6,6 +6,7 @@ from random import Random
 from typing import TYPE_CHECKING, Tuple
 
 import networkx
+from cachetools import LRUCache
 from eth_utils import encode_hex, to_canonical_address, to_checksum_address
 
 from raiden.constants import EMPTY_MERKLE_ROOT, UINT64_MAX, UINT256_MAX
@@ -13,7 +14,7 @@ from raiden.encoding import messages
 from raiden.encoding.format import buffer_for
 from raiden.transfer.architecture import ContractSendEvent, SendMessageEvent, State
 from raiden.transfer.identifiers import CanonicalIdentifier, QueueIdentifier
-from raiden.transfer.merkle_tree import merkleroot
+from raiden.transfer.merkle_tree import LEAVES, compute_layers, merkleroot
 from raiden.transfer.utils import hash_balance_data, pseudo_random_generator_from_json
 from raiden.utils import lpex, pex, serialization, sha3
 from raiden.utils.serialization import map_dict, map_list, serialize_bytes
@@ -32,6 +33,7 @@ from raiden.utils.typing import (
     ChannelMap,
     Dict,
     FeeAmount,
+    FrozenSet,
     Keccak256,
     List,
     LockHash,
@@ -70,6 +72,8 @@ if TYPE_CHECKING:
 SecretHashToLock = Dict[SecretHash, "HashTimeLockState"]
 SecretHashToPartialUnlockProof = Dict[SecretHash, "UnlockPartialProofState"]
 QueueIdsToQueues = Dict[QueueIdentifier, List[SendMessageEvent]]
+MessageIdsToQueueIds = Dict[Tuple[Address, MessageID], FrozenSet[QueueIdentifier]]
+KeysToPendingTransactions = Dict[Any, Tuple[ContractSendEvent, ...]]
 OptionalBalanceProofState = Optional[Union["BalanceProofSignedState", "BalanceProofUnsignedState"]]
 
 CHANNEL_STATE_CLOSED = "closed"
@@ -96,6 +100,9 @@ NODE_NETWORK_UNKNOWN = "unknown"
 NODE_NETWORK_UNREACHABLE = "unreachable"
 NODE_NETWORK_REACHABLE = "reachable"
 
+# Number of routing targets per token network for which the distances are kept
+DISTANCES_CACHE_SIZE = 128
+
 
 def balanceproof_from_envelope(envelope_message: "EnvelopeMessage",) -> "BalanceProofSignedState":
     return BalanceProofSignedState(
@@ -124,10 +131,6 @@ def message_identifier_from_prng(prng: Random) -> MessageID:
     return MessageID(prng.randint(0, UINT64_MAX))
 
 
-def to_comparable_graph(network: networkx.Graph) -> List[List[Any]]:
-    return sorted(sorted(edge) for edge in network.edges())
-
-
 class TransferTask(State):
     # TODO: When we turn these into dataclasses it would be a good time to move common attributes
     # of all transfer tasks like the `token_network_identifier` into the common subclass
@@ -294,8 +297,19 @@ class ChainState(State):
         self.our_address = our_address
         self.payment_mapping = PaymentMappingState()
         self.pending_transactions: List[ContractSendEvent] = list()
+        # Transient index of `pending_transactions`, it is neither compared nor
+        # serialized, see `node.get_keys_to_pending_transactions`
+        self.keys_to_pending_transactions: KeysToPendingTransactions = dict()
+        self.pending_transactions_count = 0
+        self.pending_transactions_min_expiration: Optional[BlockExpiration] = None
         self.pseudo_random_generator = pseudo_random_generator
         self.queueids_to_queues: QueueIdsToQueues = dict()
+        # Transient index of `queueids_to_queues`, it is neither compared nor
+        # serialized, see `views.get_messageids_to_queueids`. None if it must
+        # be rebuilt from the queues.
+        self.messageids_to_queueids: Optional[MessageIdsToQueueIds] = dict()
+        # set when the index is shared with the previous state
+        self.messageids_are_shared = False
         self.last_transport_authdata: Optional[str] = None
         self.tokennetworkaddresses_to_paymentnetworkaddresses: Dict[
             TokenNetworkAddress, PaymentNetworkID
@@ -386,6 +400,7 @@ class ChainState(State):
         restored.queueids_to_queues = serialization.deserialize_queueid_to_queue(
             data["queueids_to_queues"]
         )
+        restored.messageids_to_queueids = None
         restored.last_transport_authdata = data.get("last_transport_authdata")
         restored.tokennetworkaddresses_to_paymentnetworkaddresses = map_dict(
             to_canonical_address,
@@ -461,6 +476,9 @@ class TokenNetworkState(State):
         "network_graph",
         "channelidentifiers_to_channels",
         "partneraddresses_to_channelidentifiers",
+        "channelidentifiers_to_deadlines",
+        "deadlines_queue",
+        "deadlines_are_shared",
     )
 
     def __init__(self, address: TokenNetworkID, token_address: TokenAddress) -> None:
@@ -480,6 +498,15 @@ class TokenNetworkState(State):
             list
         )
 
+        # Index of the next block at which each channel has something to do,
+        # so a Block is only dispatched to the due channels. It is derived
+        # from the channels, so it is neither compared nor serialized, it is
+        # rebuilt on the first block after a restore.
+        self.channelidentifiers_to_deadlines: Dict[ChannelID, Optional[BlockNumber]] = dict()
+        self.deadlines_queue: List[Tuple[BlockNumber, ChannelID]] = list()
+        # set when the index is shared with the previous state
+        self.deadlines_are_shared = False
+
     def __repr__(self):
         return "<TokenNetworkState id:{} token:{}>".format(
             pex(self.address), pex(self.token_address)
@@ -543,28 +570,103 @@ class TokenNetworkState(State):
         return restored
 
 
-# This is necessary for the routing only, maybe it should be transient state
-# outside of the state tree.
 class TokenNetworkGraphState(State):
     """ Stores the existing channels in the channel manager contract, used for
     route finding.
+
+    Only the channel participants are part of the versioned state, they are
+    compared and stored in the snapshots. `copy_on_write` shares them with
+    the previous state until the first topology change, which copies them.
+
+    The networkx graph and the distances to the recently used targets, which
+    are cached for the route ranking, are a routing index of the latest
+    state. They are shared by the copies made by `copy_on_write`, so the
+    previous states see the latest topology there, and rebuilt from the
+    participants on restore.
     """
 
-    __slots__ = ("token_network_id", "network", "channel_identifier_to_participants")
+    __slots__ = (
+        "token_network_id",
+        "network",
+        "channel_identifier_to_participants",
+        "participants_are_shared",
+        "_target_to_distances",
+    )
 
     def __init__(self, token_network_address: TokenNetworkID) -> None:
         self.token_network_id = token_network_address
         self.network = networkx.Graph()
         self.channel_identifier_to_participants: Dict[ChannelID, Tuple[Address, Address]] = {}
+        # set when the participants are shared with the previous state
+        self.participants_are_shared = False
+        self._target_to_distances: LRUCache = LRUCache(maxsize=DISTANCES_CACHE_SIZE)
 
     def __repr__(self):
         return "<TokenNetworkGraphState num_edges:{}>".format(len(self.network.edges))
 
+    def _unshare_participants(self) -> None:
+        if self.participants_are_shared:
+            self.channel_identifier_to_participants = dict(
+                self.channel_identifier_to_participants
+            )
+            self.participants_are_shared = False
+
+    def add_channel(
+        self, channel_identifier: ChannelID, participant1: Address, participant2: Address
+    ) -> None:
+        self._unshare_participants()
+        self.network.add_edge(participant1, participant2)
+        self.channel_identifier_to_participants[channel_identifier] = (participant1, participant2)
+        self._target_to_distances.clear()
+
+    def remove_channel(self, channel_identifier: ChannelID) -> None:
+        # it might happen that both partners close at the same time, so the
+        # channel might already be deleted
+        if channel_identifier in self.channel_identifier_to_participants:
+            self._unshare_participants()
+            participants = self.channel_identifier_to_participants.pop(channel_identifier)
+            self.network.remove_edge(*participants)
+            self._target_to_distances.clear()
+
+    def distances_to(self, target: Address, excluded: Address) -> Dict[Address, int]:
+        """ Returns the length of the shortest path from every node that can
+        reach `target` without going through `excluded`, computed with a
+        single breadth-first search from the target.
+        """
+        key = (target, excluded)
+        distances = self._target_to_distances.get(key)
+
+        if distances is None:
+            distances = dict()
+
+            # the graph is undirected, so the distances from the target are
+            # the distances to it
+            if target in self.network and target != excluded:
+                adjacency = self.network.adj
+                distances[target] = 0
+                layer = [target]
+                length = 0
+                while layer:
+                    length += 1
+                    next_layer = list()
+                    for node in layer:
+                        for neighbour in adjacency[node]:
+                            if neighbour not in distances and neighbour != excluded:
+                                distances[neighbour] = length
+                                next_layer.append(neighbour)
+                    layer = next_layer
+
+            self._target_to_distances[key] = distances
+
+        return distances
+
     def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
+
         return (
             isinstance(other, TokenNetworkGraphState)
             and self.token_network_id == other.token_network_id
-            and to_comparable_graph(self.network) == to_comparable_graph(other.network)
             and self.channel_identifier_to_participants == other.channel_identifier_to_participants
         )
 
@@ -574,7 +676,6 @@ class TokenNetworkGraphState(State):
     def to_dict(self) -> Dict[str, Any]:
         return {
             "token_network_id": to_checksum_address(self.token_network_id),
-            "network": serialization.serialize_networkx_graph(self.network),
             "channel_identifier_to_participants": map_dict(
                 str,  # keys in json can only be strings
                 serialization.serialize_participants_tuple,
@@ -585,12 +686,14 @@ class TokenNetworkGraphState(State):
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "TokenNetworkGraphState":
         restored = cls(token_network_address=to_canonical_address(data["token_network_id"]))
-        restored.network = serialization.deserialize_networkx_graph(data["network"])
         restored.channel_identifier_to_participants = map_dict(
             serialization.deserialize_channel_id,
             serialization.deserialize_participants_tuple,
             data["channel_identifier_to_participants"],
         )
+        # Older snapshots also contain the serialized graph, which is ignored
+        # since it is fully determined by the participants
+        restored.network.add_edges_from(restored.channel_identifier_to_participants.values())
 
         return restored
 
@@ -611,11 +714,25 @@ class PaymentMappingState(State):
     # Because token swaps span multiple token networks, the state of the
     # payment task is kept in this mapping, instead of inside an arbitrary
     # token network.
-    __slots__ = ("secrethashes_to_task",)
+    __slots__ = (
+        "secrethashes_to_task",
+        "secrethashes_to_deadlines",
+        "deadlines_queue",
+        "deadlines_are_shared",
+    )
 
     def __init__(self) -> None:
         self.secrethashes_to_task: Dict[SecretHash, TransferTask] = dict()
 
+        # Index of the next block at which each task has something to do, so a
+        # Block is only dispatched to the due tasks. It is derived from the
+        # tasks and their channels, so it is neither compared nor serialized,
+        # it is rebuilt on the first block after a restore.
+        self.secrethashes_to_deadlines: Dict[SecretHash, Optional[BlockNumber]] = dict()
+        self.deadlines_queue: List[Tuple[BlockNumber, SecretHash]] = list()
+        # set when the index is shared with the previous state
+        self.deadlines_are_shared = False
+
     def __repr__(self):
         return "<PaymentMappingState qtd_transfers:{}>".format(len(self.secrethashes_to_task))
 
@@ -1235,26 +1352,57 @@ class TransactionExecutionStatus(State):
 
 
 class MerkleTreeState(State):
-    __slots__ = ("layers",)
+    """ The merkle tree of the pending locks of a channel end.
+
+    The layers are computed on first use when the tree is restored from its
+    leaves, so loading a snapshot does not rehash every tree.
+    """
+
+    __slots__ = ("_leaves", "_layers")
 
     def __init__(self, layers: List[List[Keccak256]]) -> None:
-        self.layers = layers
+        self._leaves = layers[LEAVES]
+        self._layers: Optional[List[List[Keccak256]]] = layers
+
+    @classmethod
+    def from_leaves(cls, leaves: List[Keccak256]) -> "MerkleTreeState":
+        """ Restores the tree from its sorted, unique `leaves` without
+        computing the layers.
+        """
+        if not leaves:
+            return make_empty_merkle_tree()
+
+        merkletree = cls.__new__(cls)
+        merkletree._leaves = leaves
+        merkletree._layers = None
+        return merkletree
+
+    @property
+    def leaves(self) -> List[Keccak256]:
+        return self._leaves
+
+    @property
+    def layers(self) -> List[List[Keccak256]]:
+        if self._layers is None:
+            self._layers = compute_layers(self._leaves)
+        return self._layers
 
     def __repr__(self):
         return "<MerkleTreeState root:{}>".format(pex(merkleroot(self)))
 
     def __eq__(self, other: Any) -> bool:
-        return isinstance(other, MerkleTreeState) and self.layers == other.layers
+        # the layers are fully determined by the leaves
+        return isinstance(other, MerkleTreeState) and self.leaves == other.leaves
 
     def __ne__(self, other: Any) -> bool:
         return not self.__eq__(other)
 
     def to_dict(self) -> Dict[str, Any]:
-        return {"layers": serialization.serialize_merkletree_layers(self.layers)}
+        return {"layers": serialization.serialize_merkletree_leaves(self.leaves)}
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "MerkleTreeState":
-        restored = cls(layers=serialization.deserialize_merkletree_layers(data["layers"]))
+        restored = cls.from_leaves(serialization.deserialize_merkletree_leaves(data["layers"]))
 
         return restored
 
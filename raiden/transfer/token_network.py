@@ -1,9 +1,12 @@
+from heapq import heappop, heappush
+
 from raiden.transfer import channel
 from raiden.transfer.architecture import Event, StateChange, TransitionResult
-from raiden.transfer.state import TokenNetworkState
+from raiden.transfer.state import NettingChannelState, TokenNetworkState
 from raiden.transfer.state_change import (
     ActionChannelClose,
     ActionChannelSetFee,
+    Block,
     ContractReceiveChannelBatchUnlock,
     ContractReceiveChannelClosed,
     ContractReceiveChannelNew,
@@ -13,7 +16,7 @@ from raiden.transfer.state_change import (
     ContractReceiveRouteNew,
     ContractReceiveUpdateTransfer,
 )
-from raiden.utils.typing import MYPY_ANNOTATION, BlockHash, BlockNumber, List, Union
+from raiden.utils.typing import MYPY_ANNOTATION, BlockHash, BlockNumber, ChannelID, List, Union
 
 # TODO: The proper solution would be to introduce a marker for state changes
 # that contains channel IDs and other specific channel attributes
@@ -27,6 +30,121 @@ StateChangeWithChannelID = Union[
 ]
 
 
+def _unshare_deadlines(token_network_state: TokenNetworkState) -> None:
+    """ Copies the deadlines index before its first change if it is shared
+    with the previous state by `copy_on_write`.
+    """
+    if token_network_state.deadlines_are_shared:
+        token_network_state.channelidentifiers_to_deadlines = dict(
+            token_network_state.channelidentifiers_to_deadlines
+        )
+        token_network_state.deadlines_queue = list(token_network_state.deadlines_queue)
+        token_network_state.deadlines_are_shared = False
+
+
+def schedule_channel(
+    token_network_state: TokenNetworkState, channel_state: NettingChannelState
+) -> None:
+    """ Updates the block deadline of the channel, must be called after any
+    change which may modify it.
+    """
+    channel_identifier = channel_state.identifier
+    deadline = channel.get_block_deadline(channel_state)
+    deadlines = token_network_state.channelidentifiers_to_deadlines
+
+    if channel_identifier not in deadlines or deadlines[channel_identifier] != deadline:
+        _unshare_deadlines(token_network_state)
+        token_network_state.channelidentifiers_to_deadlines[channel_identifier] = deadline
+
+        # Entries which don't match the deadline of the channel are stale and
+        # skipped when popped
+        if deadline is not None:
+            heappush(token_network_state.deadlines_queue, (deadline, channel_identifier))
+
+
+def unschedule_channel(
+    token_network_state: TokenNetworkState, channel_identifier: ChannelID
+) -> None:
+    if channel_identifier in token_network_state.channelidentifiers_to_deadlines:
+        _unshare_deadlines(token_network_state)
+        del token_network_state.channelidentifiers_to_deadlines[channel_identifier]
+
+
+def _synchronize_deadlines(token_network_state: TokenNetworkState) -> None:
+    """ Schedules the channels which were added without going through the
+    state transitions, e.g. after a restore.
+    """
+    _unshare_deadlines(token_network_state)
+    channels = token_network_state.channelidentifiers_to_channels
+    deadlines = token_network_state.channelidentifiers_to_deadlines
+
+    for channel_identifier in deadlines.keys() - channels.keys():
+        del deadlines[channel_identifier]
+
+    for channel_identifier in channels.keys() - deadlines.keys():
+        schedule_channel(token_network_state, channels[channel_identifier])
+
+
+def has_due_channels(token_network_state: TokenNetworkState, block_number: BlockNumber) -> bool:
+    """ True if a channel of the token network has something to do at
+    `block_number`. Reading the index doesn't access the channels.
+    """
+    queue = token_network_state.deadlines_queue
+    return len(token_network_state.channelidentifiers_to_deadlines) != len(
+        token_network_state.channelidentifiers_to_channels
+    ) or bool(queue and queue[0][0] <= block_number)
+
+
+def handle_block(
+    token_network_state: TokenNetworkState,
+    state_change: Block,
+    block_number: BlockNumber,
+    block_hash: BlockHash,
+) -> TransitionResult:
+    """ Dispatches the block to the channels which have something due, the
+    other channels are not visited.
+    """
+    events: List[Event] = list()
+
+    if len(token_network_state.channelidentifiers_to_deadlines) != len(
+        token_network_state.channelidentifiers_to_channels
+    ):
+        _synchronize_deadlines(token_network_state)
+
+    if not has_due_channels(token_network_state, block_number):
+        return TransitionResult(token_network_state, events)
+
+    _unshare_deadlines(token_network_state)
+    channels = token_network_state.channelidentifiers_to_channels
+    deadlines = token_network_state.channelidentifiers_to_deadlines
+    queue = token_network_state.deadlines_queue
+
+    due_channels = list()
+    while queue and queue[0][0] <= block_number:
+        deadline, channel_identifier = heappop(queue)
+
+        is_current = (
+            channel_identifier in channels and deadlines.get(channel_identifier) == deadline
+        )
+        if is_current:
+            # the entry was popped, the channel has to be scheduled again
+            del deadlines[channel_identifier]
+            due_channels.append(channel_identifier)
+
+    for channel_identifier in due_channels:
+        channel_state = channels[channel_identifier]
+        result = channel.state_transition(
+            channel_state=channel_state,
+            state_change=state_change,
+            block_number=block_number,
+            block_hash=block_hash,
+        )
+        events.extend(result.events)
+        schedule_channel(token_network_state, channel_state)
+
+    return TransitionResult(token_network_state, events)
+
+
 def subdispatch_to_channel_by_id(
     token_network_state: TokenNetworkState,
     state_change: StateChangeWithChannelID,
@@ -55,8 +173,10 @@ def subdispatch_to_channel_by_id(
         if result.new_state is None:
             del ids_to_channels[channel_identifier]
             partner_to_channelids.remove(channel_identifier)
+            unschedule_channel(token_network_state, channel_identifier)
         else:
             ids_to_channels[channel_identifier] = result.new_state
+            schedule_channel(token_network_state, result.new_state)
 
         events.extend(result.events)
 
@@ -87,10 +207,9 @@ def handle_channelnew(
     our_address = channel_state.our_state.address
     partner_address = channel_state.partner_state.address
 
-    token_network_state.network_graph.network.add_edge(our_address, partner_address)
-    token_network_state.network_graph.channel_identifier_to_participants[
-        state_change.channel_identifier
-    ] = (our_address, partner_address)
+    token_network_state.network_graph.add_channel(
+        state_change.channel_identifier, our_address, partner_address
+    )
 
     # Ignore duplicated channelnew events. For this to work properly on channel
     # reopens the blockchain events ChannelSettled and ChannelOpened must be
@@ -100,6 +219,7 @@ def handle_channelnew(
         token_network_state.channelidentifiers_to_channels[channel_identifier] = channel_state
         addresses_to_ids = token_network_state.partneraddresses_to_channelidentifiers
         addresses_to_ids[partner_address].append(channel_identifier)
+        schedule_channel(token_network_state, channel_state)
 
     return TransitionResult(token_network_state, events)
 
@@ -124,18 +244,7 @@ def handle_closed(
     block_number: BlockNumber,
     block_hash: BlockHash,
 ) -> TransitionResult:
-    network_graph_state = token_network_state.network_graph
-
-    # it might happen that both partners close at the same time, so the channel might
-    # already be deleted
-    if state_change.channel_identifier in network_graph_state.channel_identifier_to_participants:
-        participant1, participant2 = network_graph_state.channel_identifier_to_participants[
-            state_change.channel_identifier
-        ]
-        token_network_state.network_graph.network.remove_edge(participant1, participant2)
-        del token_network_state.network_graph.channel_identifier_to_participants[
-            state_change.channel_identifier
-        ]
+    token_network_state.network_graph.remove_channel(state_change.channel_identifier)
 
     return subdispatch_to_channel_by_id(
         token_network_state=token_network_state,
@@ -199,6 +308,7 @@ def handle_batch_unlock(
             ].remove(channel_state.identifier)
 
             del token_network_state.channelidentifiers_to_channels[channel_state.identifier]
+            unschedule_channel(token_network_state, channel_state.identifier)
 
     return TransitionResult(token_network_state, events)
 
@@ -208,12 +318,9 @@ def handle_newroute(
 ) -> TransitionResult:
     events: List[Event] = list()
 
-    token_network_state.network_graph.network.add_edge(
-        state_change.participant1, state_change.participant2
+    token_network_state.network_graph.add_channel(
+        state_change.channel_identifier, state_change.participant1, state_change.participant2
     )
-    token_network_state.network_graph.channel_identifier_to_participants[
-        state_change.channel_identifier
-    ] = (state_change.participant1, state_change.participant2)
 
     return TransitionResult(token_network_state, events)
 
@@ -223,18 +330,7 @@ def handle_closeroute(
 ) -> TransitionResult:
     events: List[Event] = list()
 
-    network_graph_state = token_network_state.network_graph
-
-    # it might happen that both partners close at the same time, so the channel might
-    # already be deleted
-    if state_change.channel_identifier in network_graph_state.channel_identifier_to_participants:
-        participant1, participant2 = network_graph_state.channel_identifier_to_participants[
-            state_change.channel_identifier
-        ]
-        token_network_state.network_graph.network.remove_edge(participant1, participant2)
-        del token_network_state.network_graph.channel_identifier_to_participants[
-            state_change.channel_identifier
-        ]
+    token_network_state.network_graph.remove_channel(state_change.channel_identifier)
 
     return TransitionResult(token_network_state, events)
 
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from raiden.transfer import channel
 from raiden.transfer.architecture import ContractSendEvent
 from raiden.transfer.identifiers import CanonicalIdentifier
@@ -14,6 +16,7 @@ from raiden.transfer.state import (
     ChainState,
     InitiatorTask,
     MediatorTask,
+    MessageIdsToQueueIds,
     NettingChannelState,
     PaymentNetworkState,
     QueueIdsToQueues,
@@ -27,8 +30,10 @@ from raiden.utils.typing import (
     BlockNumber,
     Callable,
     Dict,
+    Iterable,
     Iterator,
     List,
+    MessageID,
     Optional,
     PaymentNetworkID,
     Secret,
@@ -36,6 +41,7 @@ from raiden.utils.typing import (
     Set,
     TokenAddress,
     TokenNetworkID,
+    Tuple,
     Union,
 )
 
@@ -93,6 +99,30 @@ def get_all_messagequeues(chain_state: ChainState,) -> QueueIdsToQueues:
     return chain_state.queueids_to_queues
 
 
+def get_messageids_to_queueids(chain_state: ChainState) -> MessageIdsToQueueIds:
+    """ Returns the index from `(recipient, message_identifier)` to the
+    identifiers of the queues holding the message.
+
+    The index is kept up-to-date by the state transitions. It is built here
+    if the queues were populated without it, e.g. when the state is restored
+    from a snapshot.
+    """
+    if chain_state.messageids_to_queueids is None:
+        messageids_to_queueids: Dict[Tuple[Address, MessageID], Set] = defaultdict(set)
+        # `dict.items` bypasses the copy-on-access of the state transitions
+        for queueid, queue in dict.items(chain_state.queueids_to_queues):
+            for message in queue:
+                key = (queueid.recipient, message.message_identifier)
+                messageids_to_queueids[key].add(queueid)
+
+        chain_state.messageids_to_queueids = {
+            key: frozenset(queueids) for key, queueids in messageids_to_queueids.items()
+        }
+        chain_state.messageids_are_shared = False
+
+    return chain_state.messageids_to_queueids
+
+
 def get_networkstatuses(chain_state: ChainState) -> Dict:
     return chain_state.nodeaddresses_to_networkstates
 
@@ -496,10 +526,58 @@ def filter_channels_by_status(
     return states
 
 
+def _detect_channel_balance_proof_change(
+    old_channel: Optional[NettingChannelState], current_channel: NettingChannelState
+) -> Iterator[Union[BalanceProofSignedState, BalanceProofUnsignedState]]:
+    if current_channel == old_channel:
+        return
+
+    partner_state_updated = current_channel.partner_state.balance_proof is not None and (
+        old_channel is None
+        or old_channel.partner_state.balance_proof != current_channel.partner_state.balance_proof
+    )
+
+    if partner_state_updated:
+        assert current_channel.partner_state.balance_proof, MYPY_ANNOTATION
+        yield current_channel.partner_state.balance_proof
+
+    our_state_updated = current_channel.our_state.balance_proof is not None and (
+        old_channel is None
+        or old_channel.our_state.balance_proof != current_channel.our_state.balance_proof
+    )
+
+    if our_state_updated:
+        assert current_channel.our_state.balance_proof, MYPY_ANNOTATION
+        yield current_channel.our_state.balance_proof
+
+
 def detect_balance_proof_change(
-    old_state: ChainState, current_state: ChainState
+    old_state: ChainState,
+    current_state: ChainState,
+    touched_channels: Optional[Iterable[CanonicalIdentifier]] = None,
 ) -> Iterator[Union[BalanceProofSignedState, BalanceProofUnsignedState]]:
-    """ Compare two states for any received balance_proofs that are not in `old_state`. """
+    """ Compare two states for any received balance_proofs that are not in `old_state`.
+
+    If the channels touched by the state transition are known, only these are
+    compared, otherwise the whole state trees are walked.
+    """
+    if touched_channels is not None:
+        for canonical_identifier in touched_channels:
+            current_channel = get_channelstate_by_canonical_identifier(
+                current_state, canonical_identifier
+            )
+            if current_channel is None:
+                continue
+
+            old_channel = None
+            if old_state is not None:
+                old_channel = get_channelstate_by_canonical_identifier(
+                    old_state, canonical_identifier
+                )
+
+            yield from _detect_channel_balance_proof_change(old_channel, current_channel)
+        return
+
     if old_state == current_state:
         return
     for payment_network_identifier in current_state.identifiers_to_paymentnetworks:
@@ -541,29 +619,4 @@ def detect_balance_proof_change(
                 current_channel = current_token_network.channelidentifiers_to_channels[
                     channel_identifier
                 ]
-                if current_channel == old_channel:
-                    continue
-
-                else:
-                    partner_state_updated = (
-                        current_channel.partner_state.balance_proof is not None
-                        and (
-                            old_channel is None
-                            or old_channel.partner_state.balance_proof
-                            != current_channel.partner_state.balance_proof
-                        )
-                    )
-
-                    if partner_state_updated:
-                        assert current_channel.partner_state.balance_proof, MYPY_ANNOTATION
-                        yield current_channel.partner_state.balance_proof
-
-                    our_state_updated = current_channel.our_state.balance_proof is not None and (
-                        old_channel is None
-                        or old_channel.our_state.balance_proof
-                        != current_channel.our_state.balance_proof
-                    )
-
-                    if our_state_updated:
-                        assert current_channel.our_state.balance_proof, MYPY_ANNOTATION
-                        yield current_channel.our_state.balance_proof
+                yield from _detect_channel_balance_proof_change(old_channel, current_channel)
@@ -1,5 +1,13 @@
+from contextlib import ExitStack
+
 import structlog
-from eth_utils import decode_hex, event_abi_to_log_topic, to_checksum_address
+from eth_utils import (
+    decode_hex,
+    encode_hex,
+    event_abi_to_log_topic,
+    to_canonical_address,
+    to_checksum_address,
+)
 from gevent.lock import Semaphore
 from web3 import Web3
 from web3.utils.abi import filter_by_type
@@ -15,6 +23,7 @@ from raiden.utils.typing import (
     ChannelID,
     Dict,
     List,
+    Optional,
     TokenNetworkAddress,
 )
 from raiden_contracts.constants import CONTRACT_TOKEN_NETWORK, ChannelEvent
@@ -161,3 +170,111 @@ class StatelessFilter(LogFilter):
                 self._last_block = block_number
 
             return result
+
+
+def log_matches_topics(log_event: Dict[str, Any], topics: Optional[List]) -> bool:
+    """ True if `log_event` would be returned by `eth_getLogs` for `topics`.
+
+    Each entry of `topics` is either `None` to match anything, a topic or a
+    list of alternative topics.
+    """
+    if not topics:
+        return True
+
+    log_topics = log_event["topics"]
+    if len(topics) > len(log_topics):
+        return False
+
+    for expected, topic in zip(topics, log_topics):
+        if expected is None:
+            continue
+
+        if isinstance(topic, bytes):
+            topic = encode_hex(topic)
+
+        alternatives = expected if isinstance(expected, list) else [expected]
+        if topic.lower() not in (alternative.lower() for alternative in alternatives):
+            return False
+
+    return True
+
+
+def get_new_entries_for_filters(
+    filters: List[StatelessFilter], target_block_number: BlockNumber
+) -> List[List[Dict[str, Any]]]:
+    """ Like `StatelessFilter.get_new_entries` for each of the `filters`.
+
+    The filters which are synchronized to the same block are queried together,
+    with a single `eth_getLogs` for all their contract addresses per block
+    range. The logs are then demultiplexed to the filters by address and
+    topics. The entries are returned in the same order as `filters`.
+    """
+    entries: List[List[Dict[str, Any]]] = [[] for _ in filters]
+    if not filters:
+        return entries
+
+    web3 = filters[0].web3
+
+    with ExitStack() as stack:
+        for stateless_filter in filters:
+            stack.enter_context(stateless_filter._lock)
+
+        from_block_to_positions: Dict[BlockNumber, List[int]] = dict()
+        for position, stateless_filter in enumerate(filters):
+            filter_from_number = block_specification_to_number(
+                block=stateless_filter.filter_params.get("fromBlock", GENESIS_BLOCK_NUMBER),
+                web3=web3,
+            )
+            from_block_number = max(filter_from_number, stateless_filter._last_block + 1)
+            from_block_to_positions.setdefault(from_block_number, []).append(position)
+
+        for from_block_number, positions in from_block_to_positions.items():
+            address_to_positions: Dict[bytes, List[int]] = dict()
+            for position in positions:
+                address = to_canonical_address(filters[position].filter_params["address"])
+                address_to_positions.setdefault(address, []).append(position)
+
+            position_to_topics = {
+                position: filters[position].filter_params.get("topics") for position in positions
+            }
+            filter_params: Dict[str, Any] = {
+                "address": [to_checksum_address(address) for address in address_to_positions]
+            }
+            # The topics can only be sent along if all the filters agree on them
+            first_topics = position_to_topics[positions[0]]
+            if all(topics == first_topics for topics in position_to_topics.values()):
+                filter_params["topics"] = first_topics
+
+            # Batch the filter queries in ranges of FILTER_MAX_BLOCK_RANGE
+            # to avoid timeout problems
+            while from_block_number <= target_block_number:
+                to_block = min(from_block_number + FILTER_MAX_BLOCK_RANGE, target_block_number)
+                filter_params["fromBlock"] = from_block_number
+                filter_params["toBlock"] = to_block
+
+                log.debug(
+                    "Querying StatelessFilters",
+                    from_block=from_block_number,
+                    to_block=to_block,
+                    number_of_contracts=len(address_to_positions),
+                )
+                for log_event in web3.eth.getLogs(filter_params):
+                    address = to_canonical_address(log_event["address"])
+                    matching_positions = [
+                        position
+                        for position in address_to_positions.get(address, ())
+                        if log_matches_topics(log_event, position_to_topics[position])
+                    ]
+                    # The entries are decoded in place, each filter gets its own
+                    if len(matching_positions) > 1:
+                        for position in matching_positions:
+                            entries[position].append(dict(log_event))
+                    elif matching_positions:
+                        entries[matching_positions[0]].append(log_event)
+
+                for position in positions:
+                    filters[position]._last_block = to_block
+
+                from_block_number += FILTER_MAX_BLOCK_RANGE
+
+    return entries
@@ -106,6 +106,14 @@ def serialize_merkletree_layers(data) -> List[str]:
     return map_list(serialize_bytes, data[LEAVES])
 
 
+def serialize_merkletree_leaves(data: List[Keccak256]) -> List[str]:
+    return map_list(serialize_bytes, data)
+
+
+def deserialize_merkletree_leaves(data: List[str]) -> List[Keccak256]:
+    return cast(List[Keccak256], map_list(deserialize_bytes, data))
+
+
 def deserialize_merkletree_layers(data: List[str]):
     elements = cast(List[Keccak256], map_list(deserialize_bytes, data))
     if len(elements) == 0:
@@ -14,8 +14,9 @@ from raiden.storage.migrations.v18_to_v19 import upgrade_v18_to_v19
 from raiden.storage.migrations.v19_to_v20 import upgrade_v19_to_v20
 from raiden.storage.migrations.v20_to_v21 import upgrade_v20_to_v21
 from raiden.storage.migrations.v21_to_v22 import upgrade_v21_to_v22
+from raiden.storage.serialize import binary_to_json
 from raiden.storage.sqlite import SQLiteStorage
-from raiden.storage.versions import VERSION_RE, filter_db_names, latest_db_file
+from raiden.storage.versions import VERSION_RE, archive_db_file, filter_db_names, latest_db_file
 from raiden.utils.typing import Callable, List, NamedTuple
 
 
@@ -49,6 +50,21 @@ def update_version(storage: SQLiteStorage, version: int):
     )
 
 
+def convert_snapshots_to_json(storage: SQLiteStorage) -> None:
+    """ Convert the snapshots written with the `BinarySerializer` to JSON.
+
+    The migrations work on the JSON representation of the snapshots. The
+    conversion doesn't instantiate the objects, so it works for the older
+    versions of the state classes.
+    """
+    updated_snapshots_data = [
+        (binary_to_json(snapshot.data), snapshot.identifier)
+        for snapshot in storage.get_snapshots()
+        if isinstance(snapshot.data, bytes)
+    ]
+    storage.update_snapshots(updated_snapshots_data)
+
+
 def get_file_version(db_path: Path) -> int:
     match = VERSION_RE.match(os.path.basename(db_path))
     assert match, f'Database name "{db_path}" does not match our format'
@@ -196,7 +212,16 @@ class UpgradeManager:
             try:
                 version_iteration = from_version
 
+                # The migrations are applied to the whole history, the
+                # archived state changes and events are moved back into the
+                # new database and archived again by the node.
+                archive_path = archive_db_file(str(from_file))
+                if os.path.exists(archive_path):
+                    storage.merge_archive(archive_path)
+
                 with storage.transaction():
+                    convert_snapshots_to_json(storage)
+
                     for upgrade_record in UPGRADES_LIST:
                         if upgrade_record.from_version < from_version:
                             continue